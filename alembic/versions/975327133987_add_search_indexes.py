@@ -0,0 +1,47 @@
+"""Add search indexes
+
+Revision ID: 975327133987
+Revises: d50d2314e9b3
+Create Date: 2026-10-17 18:41:09.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '975327133987'
+down_revision = 'd50d2314e9b3'
+branch_labels = None
+depends_on = None
+
+
+# Выражения должны в точности совпадать с section_search_vector и
+# post_search_vector из simple_forum/db/models.py, иначе планировщик
+# не станет использовать индексы
+INDEXES = (
+    (
+        'ix_section_search', 'section',
+        "to_tsvector('simple', coalesce(name, ''))"
+    ),
+    (
+        'ix_post_search', 'post',
+        "to_tsvector('simple', coalesce(topic, '') || ' ' || "
+        "coalesce(description, ''))"
+    ),
+)
+
+
+def upgrade():
+    # См. d50d2314e9b3: CONCURRENTLY выполняется вне транзакции
+    for name, table, expression in INDEXES:
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name))
+        op.create_index(
+            name, table, [sa.text(expression)], postgresql_using='gin',
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table, postgresql_concurrently=True)
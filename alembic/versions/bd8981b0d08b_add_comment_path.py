@@ -0,0 +1,86 @@
+"""Add comment path
+
+Revision ID: bd8981b0d08b
+Revises: 975327133987
+Create Date: 2026-10-17 19:02:37.871640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bd8981b0d08b'
+down_revision = '975327133987'
+branch_labels = None
+depends_on = None
+
+
+# Ширина сегмента пути - COMMENT_PATH_SEGMENT_WIDTH из
+# simple_forum/db/models.py
+CREATE_SET_PATH_FUNCTION = """
+CREATE OR REPLACE FUNCTION comment_set_path() RETURNS trigger AS $$
+BEGIN
+    NEW.path := coalesce(
+        (SELECT path || '.' FROM comment WHERE id = NEW.parent_id), ''
+    ) || lpad(NEW.id::text, 10, '0');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+CREATE_SET_PATH_TRIGGER = """
+CREATE TRIGGER comment_set_path BEFORE INSERT ON comment
+FOR EACH ROW EXECUTE PROCEDURE comment_set_path()
+"""
+
+# Пересчитываем пути всех комментариев, а не только пустые: ответы,
+# вставленные между созданием триггера и заполнением, получили путь
+# без префикса еще не заполненного родителя
+BACKFILL_PATHS = """
+WITH RECURSIVE tree (id, path) AS (
+    SELECT id, lpad(id::text, 10, '0')
+    FROM comment
+    WHERE parent_id IS NULL
+  UNION ALL
+    SELECT comment.id, tree.path || '.' || lpad(comment.id::text, 10, '0')
+    FROM comment JOIN tree ON comment.parent_id = tree.id
+)
+UPDATE comment SET path = tree.path
+FROM tree
+WHERE comment.id = tree.id AND comment.path IS DISTINCT FROM tree.path
+"""
+
+
+def upgrade():
+    op.add_column(
+        'comment', sa.Column('path', sa.String(collation='C'), nullable=True)
+    )
+    op.execute(CREATE_SET_PATH_FUNCTION)
+    op.execute(CREATE_SET_PATH_TRIGGER)
+    op.execute(BACKFILL_PATHS)
+    # См. d50d2314e9b3: CONCURRENTLY выполняется вне транзакции.
+    # Индекс (post_id, path) покрывает и выборку по post_id,
+    # поэтому ix_comment_post_id больше не нужен
+    op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_comment_post_id_path')
+    op.create_index(
+        'ix_comment_post_id_path', 'comment', ['post_id', 'path'],
+        postgresql_concurrently=True
+    )
+    op.drop_index(
+        'ix_comment_post_id', 'comment', postgresql_concurrently=True
+    )
+
+
+def downgrade():
+    op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_comment_post_id')
+    op.create_index(
+        'ix_comment_post_id', 'comment', ['post_id'],
+        postgresql_concurrently=True
+    )
+    op.drop_index(
+        'ix_comment_post_id_path', 'comment', postgresql_concurrently=True
+    )
+    op.execute('DROP TRIGGER comment_set_path ON comment')
+    op.execute('DROP FUNCTION comment_set_path()')
+    op.drop_column('comment', 'path')
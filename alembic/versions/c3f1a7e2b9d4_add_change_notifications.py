@@ -0,0 +1,74 @@
+"""Add change notifications
+
+Revision ID: c3f1a7e2b9d4
+Revises: bd8981b0d08b
+Create Date: 2026-10-17 19:20:11.502318
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f1a7e2b9d4'
+down_revision = 'bd8981b0d08b'
+branch_labels = None
+depends_on = None
+
+
+# Канал и формат уведомлений - CHANGES_CHANNEL и parse_change из
+# simple_forum/db/changes.py. Триггер уровня команды отправляет по одному
+# уведомлению на каждый затронутый объект, а одинаковые уведомления
+# в пределах транзакции PostgreSQL объединяет сам, поэтому пакетная вставка
+# комментариев к посту дает одно уведомление.
+# Аргументы триггера: тип объекта и колонка с его id
+CREATE_NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION notify_forum_changes() RETURNS trigger AS $$
+DECLARE
+    entity_id bigint;
+BEGIN
+    FOR entity_id IN EXECUTE format(
+        'SELECT DISTINCT %I FROM changed_rows', TG_ARGV[1]
+    ) LOOP
+        PERFORM pg_notify('forum_changes', TG_ARGV[0] || ':' || entity_id);
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# Таблица, событие, тип объекта, колонка с id. Новые разделы и посты
+# еще не могут быть в кешах, а новый комментарий изменяет свой пост
+TRIGGERS = (
+    ('section', 'UPDATE', 'section', 'id'),
+    ('section', 'DELETE', 'section', 'id'),
+    ('post', 'UPDATE', 'post', 'id'),
+    ('post', 'DELETE', 'post', 'id'),
+    ('comment', 'INSERT', 'post', 'post_id'),
+    ('comment', 'UPDATE', 'post', 'post_id'),
+    ('comment', 'DELETE', 'post', 'post_id'),
+)
+
+# Таблица переходов задается только для триггера с одним событием
+CREATE_NOTIFY_TRIGGER = """
+CREATE TRIGGER {table}_notify_{event} AFTER {event} ON {table}
+REFERENCING {transition} TABLE AS changed_rows
+FOR EACH STATEMENT
+EXECUTE PROCEDURE notify_forum_changes('{entity}', '{column}')
+"""
+
+
+def upgrade():
+    op.execute(CREATE_NOTIFY_FUNCTION)
+    for table, event, entity, column in TRIGGERS:
+        op.execute(CREATE_NOTIFY_TRIGGER.format(
+            table=table, event=event, entity=entity, column=column,
+            transition='OLD' if event == 'DELETE' else 'NEW'
+        ))
+
+
+def downgrade():
+    for table, event, _, _ in reversed(TRIGGERS):
+        op.execute('DROP TRIGGER {table}_notify_{event} ON {table}'.format(
+            table=table, event=event
+        ))
+    op.execute('DROP FUNCTION notify_forum_changes()')
@@ -0,0 +1,42 @@
+"""Add indexes
+
+Revision ID: d50d2314e9b3
+Revises: d9366df1dbb5
+Create Date: 2026-10-17 18:20:41.552310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd50d2314e9b3'
+down_revision = 'd9366df1dbb5'
+branch_labels = None
+depends_on = None
+
+
+# Индексы строятся с CONCURRENTLY, чтобы не блокировать запись в таблицы
+# на работающей базе. CONCURRENTLY нельзя выполнять внутри транзакции -
+# env.py создает движок с isolation_level='AUTOCOMMIT', поэтому каждая
+# команда выполняется отдельно.
+INDEXES = (
+    ('ix_post_section_id', 'post', ['section_id']),
+    ('ix_comment_post_id', 'comment', ['post_id']),
+    ('ix_comment_parent_id', 'comment', ['parent_id']),
+    ('ix_section_created_at_id', 'section', ['created_at', 'id']),
+    ('ix_post_created_at_id', 'post', ['created_at', 'id']),
+)
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        # Если предыдущая попытка построения прервалась, от нее остается
+        # невалидный индекс - удаляем его перед повторным построением
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name))
+        op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table, postgresql_concurrently=True)
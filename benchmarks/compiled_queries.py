@@ -0,0 +1,102 @@
+"""Затраты CPU на подготовку SQL запросов queries.py.
+
+Сравнивает построение и компиляцию SQLAlchemy-запроса на каждый вызов
+с запросом, скомпилированным один раз (prepared_query), для обоих
+бэкендов БД. БД не нужна: измеряется только работа Python до отправки
+запроса.
+
+    python benchmarks/compiled_queries.py --number 2000
+"""
+import argparse
+import os
+import sys
+from timeit import timeit
+
+sys.path.insert(
+    0, os.path.realpath(os.path.join(os.path.dirname(__file__), '..'))
+)
+
+from simple_forum.db import asyncpg_backend  # noqa: E402
+from simple_forum.db.models import post  # noqa: E402
+from simple_forum.db.queries import (  # noqa: E402
+    TOTAL_EXACT, _get_obj_query, _page_query, _post_comments_query
+)
+from simple_forum.db.utils import compile_query  # noqa: E402
+
+# Запрос, аргументы формы и значения параметров
+QUERIES = (
+    ('get_post', _get_obj_query, (post,), {'obj_id': 1}),
+    (
+        'find_posts', _page_query,
+        (post, None, False, False, False, TOTAL_EXACT), {'limit': 26}
+    ),
+    (
+        'get_post_comments', _post_comments_query, (True, True),
+        {'post_id': 1, 'path_length': 20, 'limit': 100}
+    ),
+)
+
+
+def aiopg_compiled(query, args, params):
+    sql, defaults = compile_query(query.build(*args))
+    return sql, {**defaults, **params}
+
+
+def aiopg_prepared(query, args, params):
+    prepared = query(*args)
+    return prepared.sql, prepared.params(**params)
+
+
+def asyncpg_compiled(query, args, params):
+    return asyncpg_backend._compile(query.build(*args), params)
+
+
+def asyncpg_prepared(query, args, params):
+    return asyncpg_backend._compile(*aiopg_prepared(query, args, params))
+
+
+BACKENDS = (
+    ('aiopg', aiopg_compiled, aiopg_prepared),
+    ('asyncpg', asyncpg_compiled, asyncpg_prepared),
+)
+
+
+def measure(func, query, args, params, number):
+    """Среднее время вызова в микросекундах."""
+    return timeit(
+        lambda: func(query, args, params), number=number
+    ) / number * 10 ** 6
+
+
+def main(args):
+    print('{:<28}{:>12}{:>12}{:>12}'.format(
+        'us/call', 'compiled', 'prepared', 'saved'
+    ))
+    for name, query, shape, params in QUERIES:
+        for backend, compiled, prepared in BACKENDS:
+            # Прогрев: кеш prepared_query и кеш параметров asyncpg
+            prepared(query, shape, params)
+            compiled_time = measure(
+                compiled, query, shape, params, args.number
+            )
+            prepared_time = measure(
+                prepared, query, shape, params, args.number
+            )
+            print('{:<28}{:>12.1f}{:>12.1f}{:>12.1f}'.format(
+                '{} ({})'.format(name, backend), compiled_time,
+                prepared_time, compiled_time - prepared_time
+            ))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Measure CPU spent on building and compiling queries'
+    )
+    parser.add_argument(
+        '--number', type=int, default=2000, help='Calls per measurement'
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse_args())
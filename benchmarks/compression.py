@@ -0,0 +1,70 @@
+"""Степень и время сжатия ответа с деревом комментариев.
+
+Сжимает JSON поста с комментариями (как в GET /api/v1/posts/{id}) на
+разных уровнях zlib каждой кодировкой из simple_forum/api/compression.py.
+Время сжатия - то, на которое сжатие в цикле событий задержало бы другие
+запросы (см. compression_executor_size). БД не нужна.
+
+    python benchmarks/compression.py --comments 1000 --number 20
+"""
+import argparse
+import os
+import sys
+from timeit import timeit
+
+sys.path.insert(
+    0, os.path.realpath(os.path.join(os.path.dirname(__file__), '..'))
+)
+
+from simple_forum.api.codec import create_json_codec  # noqa: E402
+from simple_forum.api.compression import ENCODINGS, compress  # noqa: E402
+
+LEVELS = (1, 6, 9)
+
+
+def make_post(comments):
+    return {
+        'id': 1, 'section_id': 1, 'topic': 'topic',
+        'description': 'description',
+        'comments': [
+            {
+                'id': num, 'post_id': 1, 'parent_id': num - 1 or None,
+                'text': 'Текст комментария номер {}'.format(num),
+                'children': [num + 1], 'replies_count': 1,
+                'has_more_replies': False
+            }
+            for num in range(1, comments + 1)
+        ]
+    }
+
+
+def main(args):
+    body = create_json_codec().dumps(make_post(args.comments))
+    print('body: {} bytes'.format(len(body)))
+    print('{:<12}{:>8}{:>12}{:>10}'.format('encoding', 'level', 'bytes', 'ms'))
+    for encoding in ENCODINGS:
+        for level in LEVELS:
+            compressed = compress(body, encoding, level)
+            elapsed = timeit(
+                lambda: compress(body, encoding, level), number=args.number
+            ) / args.number * 1000
+            print('{:<12}{:>8}{:>12}{:>10.2f}'.format(
+                encoding, level, len(compressed), elapsed
+            ))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Measure response compression ratio and time'
+    )
+    parser.add_argument(
+        '--comments', type=int, default=1000, help='Comments in the post'
+    )
+    parser.add_argument(
+        '--number', type=int, default=20, help='Calls per measurement'
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,143 @@
+"""Сравнение бэкендов БД aiopg и asyncpg на функциях queries.py.
+
+Создает раздел с постами и комментариями, выполняет одни и те же
+запросы через оба бэкенда с заданной конкурентностью и печатает
+количество операций в секунду. Тестовый раздел удаляется в конце.
+
+    python benchmarks/db_backends.py --requests 2000 --concurrency 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+from time import monotonic
+
+sys.path.insert(
+    0, os.path.realpath(os.path.join(os.path.dirname(__file__), '..'))
+)
+
+from sqlalchemy import delete, insert  # noqa: E402
+
+from simple_forum.db.models import comment, post, section  # noqa: E402
+from simple_forum.db.queries import (  # noqa: E402
+    find_posts, get_post, get_post_comments, get_section
+)
+from simple_forum.db.utils import (  # noqa: E402
+    BACKENDS, close_async_engine, create_async_engine
+)
+from simple_forum.utils import DEFAULT_CONFIG_PATH, read_config  # noqa: E402
+
+
+async def retrieve_post(conn, ids):
+    post_id = random.choice(ids['posts'])
+    await get_post(conn, post_id)
+    await get_post_comments(conn, post_id)
+
+
+async def retrieve_posts(conn, ids):
+    await find_posts(conn, topic__like=None, per_page=25)
+
+
+async def retrieve_section(conn, ids):
+    await get_section(conn, ids['section'])
+
+
+WORKLOADS = (retrieve_post, retrieve_posts, retrieve_section)
+
+
+async def seed(engine, posts_count, comments_count):
+    async with engine.acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values(name='benchmark', description='')
+        )
+        cur = await conn.execute(
+            insert(post).values([
+                {
+                    'section_id': section_id,
+                    'topic': 'topic {}'.format(num),
+                    'description': 'description'
+                }
+                for num in range(posts_count)
+            ]).returning(post.c.id)
+        )
+        post_ids = [row.id for row in await cur.fetchall()]
+        for post_id in post_ids:
+            await conn.execute(
+                insert(comment).values([
+                    {'post_id': post_id, 'text': 'comment'}
+                    for _ in range(comments_count)
+                ])
+            )
+    return {'section': section_id, 'posts': post_ids}
+
+
+async def run_workload(engine, workload, ids, requests, concurrency):
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            async with engine.acquire() as conn:
+                await workload(conn, ids)
+
+    started_at = monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return requests / (monotonic() - started_at)
+
+
+async def main(args):
+    config = read_config(args.config)
+    db_config = {**config['database'], 'maxsize': args.concurrency}
+    engines = {
+        backend: await create_async_engine({**db_config, 'backend': backend})
+        for backend in BACKENDS
+    }
+    ids = await seed(engines[BACKENDS[0]], args.posts, args.comments)
+    try:
+        print('{:<20}'.format('ops/s') + ''.join(
+            '{:>12}'.format(backend) for backend in BACKENDS
+        ))
+        for workload in WORKLOADS:
+            results = []
+            for backend in BACKENDS:
+                # Прогрев: соединения пула и кеш подготовленных запросов
+                await run_workload(
+                    engines[backend], workload, ids, args.concurrency * 10,
+                    args.concurrency
+                )
+                results.append(await run_workload(
+                    engines[backend], workload, ids, args.requests,
+                    args.concurrency
+                ))
+            print('{:<20}'.format(workload.__name__) + ''.join(
+                '{:>12.0f}'.format(result) for result in results
+            ))
+    finally:
+        async with engines[BACKENDS[0]].acquire() as conn:
+            await conn.execute(
+                delete(section).where(section.c.id == ids['section'])
+            )
+        for engine in engines.values():
+            await close_async_engine(engine)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Compare aiopg and asyncpg backends'
+    )
+    parser.add_argument(
+        '--config', default=DEFAULT_CONFIG_PATH, help='Configuration path'
+    )
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument(
+        '--posts', type=int, default=200, help='Posts in the test section'
+    )
+    parser.add_argument(
+        '--comments', type=int, default=50, help='Comments per post'
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main(parse_args()))
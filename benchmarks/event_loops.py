@@ -0,0 +1,181 @@
+"""Пропускная способность GET /api/v1/posts с разными циклами событий.
+
+Создает раздел с постами, для каждого доступного цикла событий (asyncio
+и uvloop, если он установлен) запускает приложение в отдельном процессе
+и нагружает retrieve_posts_view запросами с заданной конкурентностью.
+Нагрузку создает этот процесс на одном и том же цикле событий, поэтому
+различия в результатах - за счет сервера. Тестовый раздел удаляется
+в конце.
+
+    python benchmarks/event_loops.py --requests 5000 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+from time import monotonic
+
+sys.path.insert(
+    0, os.path.realpath(os.path.join(os.path.dirname(__file__), '..'))
+)
+
+from aiohttp import ClientError, ClientSession, TCPConnector  # noqa: E402
+from aiohttp import web  # noqa: E402
+from sqlalchemy import delete, insert  # noqa: E402
+
+from main import make_app  # noqa: E402
+from simple_forum.db.models import post, section  # noqa: E402
+from simple_forum.db.utils import (  # noqa: E402
+    close_async_engine, create_async_engine
+)
+from simple_forum.event_loop import (  # noqa: E402
+    LOOP_ASYNCIO, LOOP_UVLOOP, setup_event_loop, uvloop
+)
+from simple_forum.utils import DEFAULT_CONFIG_PATH, read_config  # noqa: E402
+
+# Время в секундах на запуск сервера
+SERVER_START_TIMEOUT = 10
+
+
+def serve(args):
+    """Запускает приложение на заданном цикле событий (в дочернем
+    процессе)."""
+    config = read_config(args.config)
+    setup_event_loop(args.serve)
+    web.run_app(
+        make_app(config), host='127.0.0.1', port=args.port, print=None,
+        access_log=None
+    )
+
+
+async def seed(config, posts_count):
+    engine = await create_async_engine(config['database'])
+    try:
+        async with engine.acquire() as conn:
+            section_id = await conn.scalar(
+                insert(section).values(name='benchmark', description='')
+            )
+            await conn.execute(insert(post).values([
+                {
+                    'section_id': section_id,
+                    'topic': 'topic {}'.format(num),
+                    'description': 'description'
+                }
+                for num in range(posts_count)
+            ]))
+    finally:
+        await close_async_engine(engine)
+    return section_id
+
+
+async def cleanup(config, section_id):
+    engine = await create_async_engine(config['database'])
+    try:
+        async with engine.acquire() as conn:
+            await conn.execute(
+                delete(section).where(section.c.id == section_id)
+            )
+    finally:
+        await close_async_engine(engine)
+
+
+async def wait_for_server(session, url):
+    deadline = monotonic() + SERVER_START_TIMEOUT
+    while monotonic() < deadline:
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return
+        except ClientError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError('Server did not start in {}s'.format(
+        SERVER_START_TIMEOUT
+    ))
+
+
+async def run_load(session, url, requests, concurrency):
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            async with session.get(url) as response:
+                assert response.status == 200
+                await response.read()
+
+    started_at = monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return requests / (monotonic() - started_at)
+
+
+async def measure(args, loop_name):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen([
+        sys.executable, __file__, '--config', args.config,
+        '--serve', loop_name, '--port', str(port)
+    ])
+    url = 'http://127.0.0.1:{}/api/v1/posts?per_page={}'.format(
+        port, args.per_page
+    )
+    try:
+        connector = TCPConnector(limit=args.concurrency)
+        async with ClientSession(connector=connector) as session:
+            await wait_for_server(session, url)
+            # Прогрев: соединения клиента и пула, кеши запросов
+            await run_load(
+                session, url, args.concurrency * 10, args.concurrency
+            )
+            return await run_load(
+                session, url, args.requests, args.concurrency
+            )
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def main(args):
+    config = read_config(args.config)
+    loop_names = [LOOP_ASYNCIO] + ([LOOP_UVLOOP] if uvloop else [])
+    section_id = await seed(config, args.posts)
+    try:
+        print('{:<12}{:>12}'.format('loop', 'req/s'))
+        for loop_name in loop_names:
+            print('{:<12}{:>12.0f}'.format(
+                loop_name, await measure(args, loop_name)
+            ))
+    finally:
+        await cleanup(config, section_id)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Compare request throughput with asyncio and uvloop'
+    )
+    parser.add_argument(
+        '--config', default=DEFAULT_CONFIG_PATH, help='Configuration path'
+    )
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument(
+        '--posts', type=int, default=200, help='Posts in the test section'
+    )
+    parser.add_argument(
+        '--per-page', type=int, default=25, help='Posts per response'
+    )
+    parser.add_argument('--serve', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.serve:
+        serve(args)
+    else:
+        # Нагрузка создается на одном и том же цикле для всех серверов
+        setup_event_loop(LOOP_ASYNCIO)
+        asyncio.get_event_loop().run_until_complete(main(args))
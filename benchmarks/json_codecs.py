@@ -0,0 +1,130 @@
+"""Пропускная способность кодеков JSON.
+
+Кодирует и декодирует типичные ответы API (страницу постов и пост
+с комментариями) каждым доступным кодеком из simple_forum/api/codec.py.
+Для сравнения приводится json.dumps с настройками по умолчанию, которым
+пользуется web.json_response: он экранирует не-ASCII символы, поэтому
+его ответы длиннее. БД не нужна.
+
+    python benchmarks/json_codecs.py --number 2000 --items 25
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from timeit import timeit
+
+sys.path.insert(
+    0, os.path.realpath(os.path.join(os.path.dirname(__file__), '..'))
+)
+
+from simple_forum.api.codec import (  # noqa: E402
+    CODEC_ORJSON, CODECS, create_json_codec, orjson
+)
+
+
+class AiohttpDefaultCodec:
+    """Кодирование, как в web.json_response, и request.json()."""
+
+    name = 'json_response'
+
+    def dumps(self, data):
+        return json.dumps(data).encode()
+
+    def loads(self, raw):
+        return json.loads(raw.decode())
+
+
+def make_posts_page(items):
+    return {
+        'page_num': 1, 'per_page': items, 'total': items * 10, 'next': None,
+        'items': [
+            {
+                'id': num, 'section_id': 1,
+                'topic': 'Тема поста {}'.format(num),
+                'description': 'Описание поста ' * 5, 'comments': []
+            }
+            for num in range(items)
+        ]
+    }
+
+
+def make_post(items):
+    return {
+        'id': 1, 'section_id': 1, 'topic': 'topic',
+        'description': 'description',
+        'comments': [
+            {
+                'id': num, 'post_id': 1, 'parent_id': num - 1 or None,
+                'text': 'Текст комментария ' * 10, 'children': [num + 1],
+                'replies_count': 1, 'has_more_replies': False
+            }
+            for num in range(items)
+        ]
+    }
+
+
+def make_export_records(items):
+    now = datetime.now()
+    return [
+        {
+            'type': 'comment', 'id': num, 'post_id': 1, 'parent_id': None,
+            'text': 'text', 'created_at': now, 'updated_at': None
+        }
+        for num in range(items)
+    ]
+
+
+# Название, данные. Записи выгрузки с datetime умеют кодировать только
+# кодеки из codec.py
+CASES = (
+    ('posts page', make_posts_page),
+    ('post with comments', make_post),
+    ('export records', make_export_records),
+)
+
+
+def measure(func, number):
+    """Количество операций в секунду."""
+    return number / timeit(func, number=number)
+
+
+def main(args):
+    codecs = [AiohttpDefaultCodec()] + [
+        create_json_codec(name)
+        for name in CODECS
+        if name != CODEC_ORJSON or orjson is not None
+    ]
+    print('{:<24}{:<16}{:>12}{:>12}{:>12}'.format(
+        'ops/s', 'codec', 'dumps', 'loads', 'bytes'
+    ))
+    for name, make_data in CASES:
+        data = make_data(args.items)
+        for codec in codecs:
+            try:
+                raw = codec.dumps(data)
+            except TypeError:
+                continue
+            dumps_ops = measure(lambda: codec.dumps(data), args.number)
+            loads_ops = measure(lambda: codec.loads(raw), args.number)
+            print('{:<24}{:<16}{:>12.0f}{:>12.0f}{:>12}'.format(
+                name, codec.name, dumps_ops, loads_ops, len(raw)
+            ))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Measure JSON codec throughput'
+    )
+    parser.add_argument(
+        '--number', type=int, default=2000, help='Calls per measurement'
+    )
+    parser.add_argument(
+        '--items', type=int, default=25, help='Items per page or comments'
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse_args())
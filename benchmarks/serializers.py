@@ -0,0 +1,115 @@
+"""Сравнение Schema.dump из marshmallow с make_serializer.
+
+Сериализует страницу постов и пост с комментариями так, как это делают
+представления: marshmallow - с созданием схемы на каждый запрос,
+make_serializer - сериализатором, построенным один раз. БД не нужна.
+Перед замером проверяется, что результаты совпадают.
+
+    python benchmarks/serializers.py --number 2000 --items 25
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from timeit import timeit
+from types import SimpleNamespace
+
+sys.path.insert(
+    0, os.path.realpath(os.path.join(os.path.dirname(__file__), '..'))
+)
+
+from simple_forum.api.v1.resources import (  # noqa: E402
+    PostSchema, PostsPageSchema, SectionsPageSchema, dump_post,
+    dump_posts_page, dump_sections_page
+)
+from simple_forum.db.queries import Page  # noqa: E402
+
+
+def make_sections_page(items):
+    now = datetime.now()
+    return Page([
+        {
+            'id': num, 'name': 'name {}'.format(num),
+            'description': 'description', 'created_at': now,
+            'updated_at': now
+        }
+        for num in range(items)
+    ], 1, items, items * 10, (now, items))
+
+
+def make_posts_page(items):
+    return Page([
+        {
+            'id': num, 'section_id': 1, 'topic': 'topic {}'.format(num),
+            'description': 'description'
+        }
+        for num in range(items)
+    ], 1, items, items * 10, None)
+
+
+def make_post(items):
+    return {
+        'id': 1, 'section_id': 1, 'topic': 'topic',
+        'description': 'description',
+        'comments': [
+            SimpleNamespace(
+                id=num, post_id=1, parent_id=num - 1 if num else None,
+                text='text', children=[num + 1], replies_count=1,
+                has_more_replies=False
+            )
+            for num in range(items)
+        ]
+    }
+
+
+# Название, схема marshmallow, быстрый сериализатор, данные
+CASES = (
+    ('sections page', SectionsPageSchema, dump_sections_page,
+     make_sections_page),
+    ('posts page', PostsPageSchema, dump_posts_page, make_posts_page),
+    ('post with comments', PostSchema, dump_post, make_post),
+)
+
+
+def measure(func, obj, number):
+    """Среднее время вызова в микросекундах."""
+    return timeit(lambda: func(obj), number=number) / number * 10 ** 6
+
+
+def main(args):
+    print('{:<28}{:>14}{:>14}{:>10}'.format(
+        'us/call', 'marshmallow', 'serializer', 'speedup'
+    ))
+    for name, schema_class, serializer, make_obj in CASES:
+        obj = make_obj(args.items)
+
+        def marshmallow_dump(obj):
+            return schema_class().dump(obj).data
+
+        assert json.dumps(serializer(obj)) == json.dumps(
+            marshmallow_dump(obj)
+        )
+        marshmallow_time = measure(marshmallow_dump, obj, args.number)
+        serializer_time = measure(serializer, obj, args.number)
+        print('{:<28}{:>14.1f}{:>14.1f}{:>9.1f}x'.format(
+            '{} ({})'.format(name, args.items), marshmallow_time,
+            serializer_time, marshmallow_time / serializer_time
+        ))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Compare marshmallow dump with precompiled serializers'
+    )
+    parser.add_argument(
+        '--number', type=int, default=2000, help='Calls per measurement'
+    )
+    parser.add_argument(
+        '--items', type=int, default=25, help='Items per page or comments'
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse_args())
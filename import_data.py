@@ -0,0 +1,66 @@
+"""Массовый импорт данных форума из NDJSON.
+
+    python import_data.py dump.ndjson
+    zcat dump.ndjson.gz | python import_data.py -
+"""
+import argparse
+import logging.config
+import sys
+
+from simple_forum.db.importer import (
+    DEFAULT_BATCH_SIZE, ImportDataError, import_ndjson
+)
+from simple_forum.db.utils import (
+    close_blocking_engine, create_blocking_engine, make_dsn
+)
+from simple_forum.utils import DEFAULT_CONFIG_PATH, read_config
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Bulk import of sections, posts and comments from NDJSON'
+    )
+    parser.add_argument('path', help="NDJSON file, '-' to read from stdin")
+    parser.add_argument(
+        '--config', default=DEFAULT_CONFIG_PATH, help='Configuration path'
+    )
+    parser.add_argument(
+        '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+        help='Records per COPY transaction'
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    config = read_config(args.config)
+    logging.config.dictConfig(config['logging'])
+    engine = create_blocking_engine(make_dsn(config['database']))
+    conn = engine.raw_connection()
+    try:
+        if args.path == '-':
+            result = import_ndjson(conn, sys.stdin, args.batch_size)
+        else:
+            with open(args.path, encoding='utf-8') as lines:
+                result = import_ndjson(conn, lines, args.batch_size)
+    except ImportDataError as exc:
+        sys.exit(str(exc))
+    finally:
+        conn.close()
+        close_blocking_engine(engine)
+    total = sum(result.rows.values())
+    print(
+        'Imported {} rows ({}) in {:.1f}s, {:.0f} rows/s'.format(
+            total,
+            ', '.join(
+                '{}: {}'.format(record_type, count)
+                for record_type, count in sorted(result.rows.items())
+            ),
+            result.elapsed,
+            total / result.elapsed if result.elapsed else 0
+        )
+    )
+
+
+if __name__ == '__main__':
+    main()
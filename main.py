@@ -1,37 +1,151 @@
+import argparse
 import logging.config
+import sys
 
 from aiohttp import web
 from aiojobs.aiohttp import setup as setup_jobs
 
-from simple_forum.utils import read_config
+from simple_forum.api.middlewares import (
+    compression_middleware, pool_timeout_middleware,
+    read_your_writes_middleware, single_flight_middleware
+)
+from simple_forum.api.cache import PostCache
+from simple_forum.api.codec import create_json_codec
+from simple_forum.api.singleflight import SingleFlight
+from simple_forum.db.changes import ChangesListener
+from simple_forum.event_loop import setup_event_loop
+from simple_forum.prefork import Supervisor, bind_socket, split_pool_size
+from simple_forum.utils import DEFAULT_CONFIG_PATH, read_config
 from simple_forum.db.utils import create_async_engine, close_async_engine
 from simple_forum.routes import setup_routes
 
 
 async def setup_db_engine(app):
     app['db'] = await create_async_engine(app['config']['database'])
+    app['db_replicas'] = [
+        await create_async_engine(replica_config)
+        for replica_config in app['config']['replicas']['databases']
+    ]
     app.on_cleanup.append(close_db_engine)
 
 
 async def close_db_engine(app):
     await close_async_engine(app['db'])
+    for replica in app['db_replicas']:
+        await close_async_engine(replica)
+
+
+async def start_changes_listener(app):
+    # Кеш сбрасывается и при изменениях, сделанных другими процессами
+    app['changes_listener'] = ChangesListener(
+        app['config']['database'], app['post_cache'].on_change,
+        app['post_cache'].clear
+    )
+    app['changes_listener'].start()
+    app.on_cleanup.append(stop_changes_listener)
+
+
+async def stop_changes_listener(app):
+    await app['changes_listener'].stop()
 
 
 def make_app(config):
-    app = web.Application()
+    app = web.Application(
+        middlewares=[
+            compression_middleware, pool_timeout_middleware,
+            read_your_writes_middleware, single_flight_middleware
+        ]
+    )
     app['config'] = config
+    app['json_codec'] = create_json_codec(config['api']['json_codec'])
+    if config['api']['coalesce_reads']:
+        app['single_flight'] = SingleFlight()
+    if config['api']['post_cache_size'] > 0:
+        # Ответы, прочитанные с реплик, живут не дольше окна, в течение
+        # которого реплики могут отставать
+        app['post_cache'] = PostCache(
+            config['api']['post_cache_size'],
+            replica_ttl=config['replicas']['read_your_writes_window']
+        )
+        app.on_startup.append(start_changes_listener)
     app.on_startup.append(setup_db_engine)
     setup_jobs(app)
     setup_routes(app)
     return app
 
 
-def run(config):
-    app = make_app(config)
-    web.run_app(app, **config['server'])
+def run(config, workers=None):
+    """Запускает сервер.
+
+    :param workers: количество процессов-воркеров, по умолчанию
+    workers.count из конфига."""
+    if workers is None:
+        workers = config['workers']['count']
+    # Воркеры наследуют политику и создают циклы событий после fork
+    setup_event_loop(config['event_loop'])
+    if workers <= 1:
+        app = make_app(config)
+        web.run_app(app, **config['server'])
+    else:
+        run_workers(config, workers)
+
+
+def run_workers(config, workers):
+    """Запускает воркеры на общем сокете (см. simple_forum/prefork.py)."""
+    # Пул каждого воркера - его доля общего лимита соединений с БД
+    # за вычетом соединения для прослушивания изменений
+    budget = config['workers']['db_connections']
+    listener_connections = 1 if config['api']['post_cache_size'] > 0 else 0
+    try:
+        worker_config = {
+            **config,
+            'database': split_pool_size(
+                config['database'], workers, budget, listener_connections
+            ),
+            'replicas': {
+                **config['replicas'],
+                'databases': [
+                    split_pool_size(replica_config, workers, budget)
+                    for replica_config in config['replicas']['databases']
+                ]
+            }
+        }
+    except ValueError as exc:
+        sys.exit(str(exc))
+    server_config = dict(config['server'])
+    host, port = server_config.pop('host'), server_config.pop('port')
+    sock = bind_socket(
+        host, port, reuse_address=server_config.pop('reuse_address', True),
+        reuse_port=server_config.pop('reuse_port', False),
+        backlog=server_config.pop('backlog', 128)
+    )
+
+    def serve(worker_id):
+        web.run_app(
+            make_app(worker_config), sock=sock, print=None, **server_config
+        )
+
+    print('======== Running on http://{}:{} with {} workers ========'.format(
+        host, port, workers
+    ))
+    Supervisor(serve, workers, config['workers']['stop_timeout']).run()
+    sock.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run simple_forum API')
+    parser.add_argument(
+        '--config', default=DEFAULT_CONFIG_PATH, help='Configuration path'
+    )
+    parser.add_argument(
+        '--workers', type=int, default=None,
+        help='Worker processes sharing the port, overrides workers.count'
+    )
+    return parser.parse_args()
 
 
 if __name__ == '__main__':
-    config = read_config()
+    args = parse_args()
+    config = read_config(args.config)
     logging.config.dictConfig(config['logging'])
-    run(config)
+    run(config, args.workers)
@@ -0,0 +1,148 @@
+"""Кеш ответов GET /posts/{id} в памяти процесса.
+
+Посты читают намного чаще, чем изменяют, поэтому готовые тела ответов
+хранятся в LRU-кеше по id поста и удаляются из него при любом изменении
+поста или его комментариев (см. invalidate_posts в utils.py).
+
+Чтобы в кеш не попали устаревшие данные:
+
+* ответ сохраняется, только если за время его чтения из БД не
+  сбрасывались ни этот пост, ни весь кеш (см. PostCache.version);
+* ответ, прочитанный с реплики, хранится не дольше допустимого отставания
+  реплик (read_your_writes_window).
+
+Изменения, сделанные другими процессами приложения или в обход API,
+приходят через LISTEN/NOTIFY (см. db/changes.py и on_change).
+"""
+from collections import OrderedDict, namedtuple
+from time import monotonic
+from typing import Hashable, Optional
+
+from ..db.changes import ENTITY_POST
+
+# Тело ответа, его ETag и сжатые варианты тела по кодировкам (заполняет
+# compression_middleware, см. COMPRESSED_BODIES)
+CachedPost = namedtuple('CachedPost', ('body', 'etag', 'compressed'))
+
+
+class PostCache:
+    """LRU-кеш ответов по id поста.
+
+    Для одного поста хранятся ответы на разные параметры запроса
+    (max_depth, limit), каждый из них занимает место в кеше,
+    сбрасываются они вместе.
+
+    :param maxsize: максимальное количество ответов в кеше.
+    :param replica_ttl: время жизни в секундах ответов, прочитанных
+    с реплики."""
+
+    def __init__(self, maxsize: int, replica_ttl: float = 0):
+        self.maxsize = maxsize
+        self.replica_ttl = replica_ttl
+        # (post_id, ключ параметров) -> (CachedPost, истекает или None)
+        self._responses = OrderedDict()
+        # post_id -> ключи параметров ответов в кеше
+        self._keys = {}
+        # Счетчик сбросов. Сброс поста запоминается в _invalidated,
+        # сброс всего кеша поднимает _epoch: ответы, чтение которых
+        # началось раньше, не сохраняются
+        self._version = 0
+        self._epoch = 0
+        # post_id -> version при последнем сбросе поста, не больше
+        # maxsize последних постов
+        self._invalidated = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    @property
+    def version(self) -> int:
+        """Номер сброса кеша. Запоминается перед чтением из БД и
+        передается в set."""
+        return self._version
+
+    def get(self, post_id: int, key: Hashable) -> Optional[CachedPost]:
+        entry = self._responses.get((post_id, key))
+        if entry is not None:
+            cached_post, expires_at = entry
+            if expires_at is None or expires_at > monotonic():
+                self._responses.move_to_end((post_id, key))
+                self.hits += 1
+                return cached_post
+            self._remove(post_id, key)
+        self.misses += 1
+        return None
+
+    def set(
+        self, post_id: int, key: Hashable, cached_post: CachedPost,
+        version: int, from_replica: bool = False
+    ):
+        """Сохраняет ответ.
+
+        :param version: значение version перед чтением ответа из БД.
+        Если с тех пор пост или весь кеш сбрасывались, ответ мог
+        устареть и не сохраняется.
+        :param from_replica: ответ прочитан с реплики."""
+        if version < self._epoch:
+            return
+        if self._invalidated.get(post_id, -1) > version:
+            return
+        expires_at = None
+        if from_replica:
+            if self.replica_ttl <= 0:
+                return
+            expires_at = monotonic() + self.replica_ttl
+        self._responses[post_id, key] = (cached_post, expires_at)
+        self._responses.move_to_end((post_id, key))
+        self._keys.setdefault(post_id, set()).add(key)
+        while len(self._responses) > self.maxsize:
+            (evicted_id, evicted_key), _ = self._responses.popitem(last=False)
+            self._remove_key(evicted_id, evicted_key)
+            self.evictions += 1
+
+    def _remove(self, post_id, key):
+        del self._responses[post_id, key]
+        self._remove_key(post_id, key)
+
+    def _remove_key(self, post_id, key):
+        keys = self._keys[post_id]
+        keys.discard(key)
+        if not keys:
+            del self._keys[post_id]
+
+    def invalidate(self, post_id: int):
+        self._version += 1
+        self.invalidations += 1
+        self._invalidated[post_id] = self._version
+        self._invalidated.move_to_end(post_id)
+        if len(self._invalidated) > self.maxsize:
+            # Сброс забытого поста мог случиться во время еще идущего
+            # чтения любого поста - такие чтения не сохраняются
+            _, self._epoch = self._invalidated.popitem(last=False)
+        for key in self._keys.pop(post_id, ()):
+            del self._responses[post_id, key]
+
+    def on_change(self, entity: str, entity_id: int):
+        """Обработчик уведомлений об изменениях (см. ChangesListener)."""
+        if entity == ENTITY_POST:
+            self.invalidate(entity_id)
+
+    def clear(self):
+        self._version += 1
+        self._epoch = self._version
+        self.invalidations += 1
+        self._invalidated.clear()
+        self._responses.clear()
+        self._keys.clear()
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._responses),
+            'posts': len(self._keys),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,83 @@
+"""Кодеки JSON для запросов и ответов API.
+
+Все представления читают тело запроса и формируют JSON-ответ через
+кодек приложения (см. get_json_codec). Если установлен orjson, по
+умолчанию используется он, иначе - стандартный модуль json. Оба кодека
+выдают одинаковый компактный JSON в UTF-8 и сериализуют даты и время
+в ISO 8601.
+"""
+import json
+from datetime import date, datetime, time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Названия кодеков. auto - orjson, если он установлен, иначе json
+CODEC_AUTO = 'auto'
+CODEC_JSON = 'json'
+CODEC_ORJSON = 'orjson'
+
+
+class JsonCodec:
+    """Кодек на стандартном модуле json."""
+
+    name = CODEC_JSON
+
+    def dumps(self, data) -> bytes:
+        return json.dumps(
+            data, ensure_ascii=False, separators=(',', ':'),
+            default=_default
+        ).encode()
+
+    def loads(self, raw: bytes):
+        """:raise ValueError: если raw - некорректный JSON."""
+        return json.loads(raw)
+
+
+class OrjsonCodec(JsonCodec):
+    """Кодек на orjson. Даты и время orjson сериализует сам."""
+
+    name = CODEC_ORJSON
+
+    def dumps(self, data) -> bytes:
+        return orjson.dumps(data)
+
+    def loads(self, raw: bytes):
+        return orjson.loads(raw)
+
+
+CODECS = {
+    CODEC_JSON: JsonCodec,
+    CODEC_ORJSON: OrjsonCodec,
+}
+CODEC_NAMES = (CODEC_AUTO, *CODECS)
+
+
+def create_json_codec(name: str = CODEC_AUTO) -> JsonCodec:
+    """Создает кодек по названию.
+
+    :param name: auto, json или orjson."""
+    if name == CODEC_AUTO:
+        name = CODEC_JSON if orjson is None else CODEC_ORJSON
+    if name not in CODECS:
+        raise ValueError(
+            'Unknown JSON codec {}, expected one of {}'.format(
+                name, ', '.join(CODEC_NAMES)
+            )
+        )
+    if name == CODEC_ORJSON and orjson is None:
+        raise ValueError('JSON codec orjson requires the orjson package')
+    return CODECS[name]()
+
+
+def _default(value):
+    # То же представление, что у orjson
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    raise TypeError(
+        'Object of type {} is not JSON serializable'.format(
+            type(value).__name__
+        )
+    )
@@ -0,0 +1,60 @@
+"""Сжатие ответов gzip и deflate (см. compression_middleware).
+
+Кодировка выбирается по заголовку Accept-Encoding. zlib отпускает GIL
+во время сжатия, поэтому большие ответы сжимаются в пуле потоков
+и не останавливают цикл событий.
+"""
+import zlib
+from typing import Optional
+
+# Ключ ответа (web.Response) со словарем сжатых вариантов тела по
+# кодировкам. Если view его задает, compression_middleware берет сжатое
+# тело из словаря или сохраняет его туда, и тело, которое отдается
+# многим запросам (кеш постов), сжимается один раз на кодировку
+COMPRESSED_BODIES = 'compressed_bodies'
+
+ENCODING_GZIP = 'gzip'
+ENCODING_DEFLATE = 'deflate'
+# Поддерживаемые кодировки в порядке предпочтения при одинаковом q
+ENCODINGS = (ENCODING_GZIP, ENCODING_DEFLATE)
+
+# wbits для zlib: gzip - с заголовком и контрольной суммой gzip,
+# deflate - формат zlib (RFC 1950), как требует HTTP
+_WBITS = {
+    ENCODING_GZIP: 16 + zlib.MAX_WBITS,
+    ENCODING_DEFLATE: zlib.MAX_WBITS,
+}
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Выбирает кодировку сжатия по заголовку Accept-Encoding.
+
+    :return: gzip, deflate или None, если клиент не принимает ни одну
+    из них."""
+    weights = {}
+    for item in accept_encoding.lower().split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip()
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                continue
+        weights[coding] = weight
+    best, best_weight = None, 0
+    for encoding in ENCODINGS:
+        weight = weights.get(encoding, weights.get('*', 0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(body: bytes, encoding: str, level: int) -> bytes:
+    """Сжимает тело ответа.
+
+    :param encoding: gzip или deflate.
+    :param level: уровень сжатия zlib от 1 до 9."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS[encoding])
+    return compressor.compress(body) + compressor.flush()
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+
+from aiohttp import hdrs, web
+
+from ..db.utils import PoolTimeoutError
+from ..utils import (
+    DEFAULT_COMPRESSION_EXECUTOR_SIZE, DEFAULT_COMPRESSION_LEVEL,
+    DEFAULT_COMPRESSION_MIN_SIZE
+)
+from .compression import COMPRESSED_BODIES, choose_encoding, compress
+from .utils import READ_PRIMARY_COOKIE
+
+logger = logging.getLogger(__name__)
+
+# Методы, которые не изменяют данные
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Через сколько секунд клиенту стоит повторить запрос, если пул соединений
+# с БД исчерпан
+POOL_TIMEOUT_RETRY_AFTER = 1
+
+
+@web.middleware
+async def pool_timeout_middleware(request, handler):
+    """Отвечает 503, если свободное соединение с БД не удалось получить
+    за acquire_timeout."""
+    try:
+        return await handler(request)
+    except PoolTimeoutError as exc:
+        logger.error('{} {}: {}'.format(request.method, request.path, exc))
+        raise web.HTTPServiceUnavailable(
+            headers={'Retry-After': str(POOL_TIMEOUT_RETRY_AFTER)}
+        )
+
+
+@web.middleware
+async def read_your_writes_middleware(request, handler):
+    """После успешной записи направляет чтение клиента в основную БД.
+    
+    Реплики отстают от основной БД, поэтому клиент мог бы не увидеть
+    только что сделанные изменения. В ответ на запрос на запись
+    выставляется cookie, которая в течение окна read_your_writes_window
+    направляет чтение клиента в основную БД."""
+    response = await handler(request)
+    window = request.app['config']['replicas']['read_your_writes_window']
+    if (
+        request.method not in SAFE_METHODS and
+        response.status < 400 and
+        window > 0 and
+        request.app.get('db_replicas')
+    ):
+        response.set_cookie(
+            READ_PRIMARY_COOKIE, '1', max_age=window, httponly=True
+        )
+    return response
+
+
+@web.middleware
+async def single_flight_middleware(request, handler):
+    """После запроса на запись новые запросы на чтение не присоединяются
+    к выборкам, начатым до него (см. singleflight.py), и видят запись."""
+    try:
+        return await handler(request)
+    finally:
+        single_flight = request.app.get('single_flight')
+        if request.method not in SAFE_METHODS and single_flight is not None:
+            single_flight.reset()
+
+
+@web.middleware
+async def compression_middleware(request, handler):
+    """Сжимает ответ gzip или deflate, если клиент принимает сжатие.
+    
+    Сжимаются ответы не меньше compression_min_size байт. Ответы от
+    compression_executor_size байт сжимаются в пуле потоков, чтобы
+    не останавливать цикл событий. Потоковые ответы (выгрузка раздела)
+    не сжимаются. Сжатые тела берутся из response[COMPRESSED_BODIES]
+    и сохраняются туда, если view его задал."""
+    response = await handler(request)
+    api_config = request.app['config']['api']
+    level = api_config.get('compression_level', DEFAULT_COMPRESSION_LEVEL)
+    body = getattr(response, 'body', None)
+    if (
+        level <= 0 or
+        not isinstance(body, bytes) or
+        len(body) < api_config.get(
+            'compression_min_size', DEFAULT_COMPRESSION_MIN_SIZE
+        ) or
+        hdrs.CONTENT_ENCODING in response.headers
+    ):
+        return response
+    # Ответ зависит от Accept-Encoding, даже если сжатие не выбрано.
+    # check_not_modified уже мог добавить заголовок
+    if hdrs.ACCEPT_ENCODING not in response.headers.getall(hdrs.VARY, ()):
+        response.headers.add(hdrs.VARY, hdrs.ACCEPT_ENCODING)
+    encoding = choose_encoding(request.headers.get(hdrs.ACCEPT_ENCODING, ''))
+    if encoding is None:
+        return response
+    compressed_bodies = response.get(COMPRESSED_BODIES, {})
+    compressed = compressed_bodies.get(encoding)
+    if compressed is None:
+        if len(body) >= api_config.get(
+            'compression_executor_size', DEFAULT_COMPRESSION_EXECUTOR_SIZE
+        ):
+            compressed = await asyncio.get_event_loop().run_in_executor(
+                None, compress, body, encoding, level
+            )
+        else:
+            compressed = compress(body, encoding, level)
+        compressed_bodies[encoding] = compressed
+    response.body = compressed
+    response.headers[hdrs.CONTENT_ENCODING] = encoding
+    return response
@@ -0,0 +1,167 @@
+"""Быстрая сериализация ответов API.
+
+Schema.dump в marshmallow 2 на каждый вызов проходит по полям через
+Marshaller, собирает ошибки и вызывает хуки схемы, а представления
+к тому же создают схемы заново на каждый запрос. Для ответов на чтение
+это лишняя работа: данные берутся из БД и не требуют проверки.
+
+make_serializer один раз разбирает поля схемы и строит функцию, которая
+только переносит значения в словарь. Результат совпадает с
+schema.dump(obj).data. Валидация входных данных по-прежнему выполняется
+схемами marshmallow.
+"""
+import re
+from operator import attrgetter
+from typing import Any, Callable
+
+from marshmallow import Schema, fields, missing, utils
+
+# Директивы strftime, которые можно заменить форматированием чисел:
+# директива -> (формат, атрибут datetime)
+_STRFTIME_DIRECTIVES = {
+    'd': ('%02d', 'day'),
+    'm': ('%02d', 'month'),
+    'Y': ('%d', 'year'),
+    'H': ('%02d', 'hour'),
+    'M': ('%02d', 'minute'),
+    'S': ('%02d', 'second'),
+}
+_STRFTIME_DIRECTIVE_RE = re.compile(r'%(.)')
+
+
+def make_serializer(schema: Schema) -> Callable[[Any], Any]:
+    """Строит функцию, сериализующую объекты так же, как
+    schema.dump(obj).data.
+
+    :param schema: экземпляр схемы. Учитываются many, only и exclude.
+    Хуки pre_dump и post_dump не поддерживаются."""
+    # Schema.dump заполняет __processors__ пустыми списками по ключам хуков
+    if any(schema.__processors__.values()):
+        raise ValueError(
+            'Schema {} has processors, which are not supported'.format(
+                type(schema).__name__
+            )
+        )
+    field_serializers = [
+        (field.dump_to or name, _make_field_serializer(name, field))
+        for name, field in schema.fields.items()
+        if not field.load_only
+    ]
+    dict_class = schema.dict_class
+
+    def serialize(obj):
+        data = dict_class()
+        for key, serialize_field in field_serializers:
+            value = serialize_field(obj)
+            if value is not missing:
+                data[key] = value
+        return data
+
+    if schema.many:
+        return lambda objs: [serialize(obj) for obj in objs]
+    return serialize
+
+
+def _make_field_serializer(name, field):
+    """Функция, возвращающая значение поля для объекта или missing,
+    если поле не нужно включать в результат (см. Field.serialize)."""
+    attr = field.attribute or name
+    convert = _make_converter(field, attr)
+    if not field._CHECK_ATTRIBUTE:
+        return lambda obj: convert(None, obj)
+    get_value = _make_getter(attr)
+    default = field.default
+
+    def serialize_field(obj):
+        value = get_value(obj)
+        if value is missing:
+            return default() if callable(default) else default
+        return convert(value, obj)
+
+    return serialize_field
+
+
+def _make_getter(attr):
+    if '.' in attr:
+        return lambda obj: utils.get_value(attr, obj)
+
+    # То же, что utils.get_value для ключа без точек, но без исключения
+    # на каждое поле для объектов, не поддерживающих obj[key]
+    def get_value(obj):
+        if hasattr(obj, '__getitem__'):
+            try:
+                return obj[attr]
+            except (KeyError, AttributeError, IndexError, TypeError):
+                pass
+        try:
+            value = getattr(obj, attr)
+        except AttributeError:
+            return missing
+        return value() if callable(value) else value
+
+    return get_value
+
+
+def _make_converter(field, attr):
+    """Функция (value, obj) -> сериализованное значение. Для полей
+    без быстрой реализации используется Field._serialize."""
+    field_type = type(field)
+    if field_type is fields.Integer and not field.as_string:
+        return lambda value, obj: None if value is None else int(value)
+    if field_type is fields.String:
+        ensure_text_type = utils.ensure_text_type
+        return lambda value, obj: (
+            None if value is None else ensure_text_type(value)
+        )
+    if field_type is fields.DateTime:
+        dateformat = field.dateformat or field.DEFAULT_FORMAT
+        format_func = field.DATEFORMAT_SERIALIZATION_FUNCS.get(dateformat)
+        if format_func is None:
+            format_datetime = _compile_strftime(dateformat)
+            return lambda value, obj: (
+                None if value is None else format_datetime(value)
+            )
+    if field_type is fields.List:
+        convert_item = _make_converter(field.container, attr)
+        is_collection = utils.is_collection
+
+        def convert_list(value, obj):
+            if value is None:
+                return None
+            if is_collection(value):
+                return [convert_item(item, obj) for item in value]
+            return [convert_item(value, obj)]
+
+        return convert_list
+    if field_type is fields.Nested and not isinstance(field.only, str):
+        # Схема вложенного поля создается с many=field.many
+        serialize = make_serializer(field.schema)
+        return lambda value, obj: None if value is None else serialize(value)
+    return lambda value, obj: field._serialize(value, attr, obj)
+
+
+def _compile_strftime(dateformat):
+    """Возвращает функцию, форматирующую datetime так же, как
+    value.strftime(dateformat), но в несколько раз быстрее.
+    Поддерживаются числовые директивы (%d.%m.%Y %H:%M:%S и т.п.),
+    для остальных форматов используется strftime."""
+    parts = _STRFTIME_DIRECTIVE_RE.split(dateformat)
+    template = []
+    attrs = []
+    for num, part in enumerate(parts):
+        if num % 2 == 0:
+            template.append(part.replace('%', '%%'))
+        elif part in _STRFTIME_DIRECTIVES:
+            part_format, attr = _STRFTIME_DIRECTIVES[part]
+            template.append(part_format)
+            attrs.append(attr)
+        else:
+            return lambda value: value.strftime(dateformat)
+    template = ''.join(template)
+    if len(attrs) < 2:
+        # attrgetter с одним атрибутом возвращает значение, а не кортеж
+        return lambda value: template % tuple(
+            getattr(value, attr) for attr in attrs
+        )
+    get_values = attrgetter(*attrs)
+    return lambda value: template % get_values(value)
@@ -0,0 +1,103 @@
+"""Объединение одинаковых одновременных запросов на чтение.
+
+Если к одному посту одновременно приходят сотни запросов, каждый из них
+выполнил бы одни и те же запросы к БД и ту же сериализацию. SingleFlight
+выполняет выборку один раз: запросы с тем же ключом, пришедшие, пока она
+идет, ждут ее результата (см. coalesce в utils.py).
+
+Выборка выполняется в отдельной задаче, поэтому отмена запроса, который
+ее начал (клиент закрыл соединение), не отменяет ее для остальных.
+
+Запрос, пришедший после записи, не должен получить результат выборки,
+начатой до нее: после каждой записи вызывается reset, и новые запросы
+начинают новую выборку.
+"""
+import asyncio
+from functools import partial
+from typing import Awaitable, Callable, Hashable
+
+# Верхние границы интервалов гистограммы количества запросов на выборку
+SERVED_BUCKETS = (1, 10, 100, 1000)
+
+
+class _Flight:
+
+    __slots__ = ('task', 'requests')
+
+    def __init__(self, task):
+        self.task = task
+        self.requests = 0
+
+
+class SingleFlight:
+    """Выполняет одну выборку на группу одновременных запросов
+    с одинаковым ключом."""
+
+    def __init__(self):
+        # (поколение, ключ) -> выполняющаяся выборка
+        self._flights = {}
+        self._generation = 0
+        self.requests = 0
+        self.fetches = 0
+        self.max_requests_per_fetch = 0
+        self._served = [0] * (len(SERVED_BUCKETS) + 1)
+
+    def reset(self):
+        """Запросы, пришедшие после вызова, не присоединяются к уже
+        начатым выборкам."""
+        self._generation += 1
+
+    async def do(self, key: Hashable, fetch: Callable[[], Awaitable]):
+        """Возвращает результат fetch, выполняя его, только если выборки
+        с тем же ключом сейчас нет.
+
+        :param key: ключ, от которого полностью зависит результат."""
+        key = (self._generation, key)
+        self.requests += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(
+                asyncio.ensure_future(fetch())
+            )
+            flight.task.add_done_callback(partial(self._finish, key, flight))
+            self.fetches += 1
+        flight.requests += 1
+        return await asyncio.shield(flight.task)
+
+    def _finish(self, key, flight, task):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        self.max_requests_per_fetch = max(
+            self.max_requests_per_fetch, flight.requests
+        )
+        for index, bound in enumerate(SERVED_BUCKETS):
+            if flight.requests <= bound:
+                break
+        else:
+            index = len(SERVED_BUCKETS)
+        self._served[index] += 1
+        # Ошибку получат ожидающие запросы, если их не отменили. Иначе
+        # asyncio сообщит о необработанном исключении задачи
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        """Статистика выборок. requests_per_fetch - количество завершенных
+        выборок по числу обслуженных запросов."""
+        labels = []
+        lower = 1
+        for bound in SERVED_BUCKETS:
+            labels.append(
+                str(bound) if lower == bound
+                else '{}-{}'.format(lower, bound)
+            )
+            lower = bound + 1
+        labels.append('>{}'.format(SERVED_BUCKETS[-1]))
+        return {
+            'in_flight': len(self._flights),
+            'requests': self.requests,
+            'fetches': self.fetches,
+            'coalesced': self.requests - self.fetches,
+            'max_requests_per_fetch': self.max_requests_per_fetch,
+            'requests_per_fetch': dict(zip(labels, self._served)),
+        }
@@ -1,15 +1,291 @@
-from json import JSONDecodeError
+import hashlib
+import logging
+import random
+from contextlib import contextmanager
+from datetime import timezone
+from email.utils import format_datetime
 
-from aiohttp import web
+from aiohttp import hdrs, web
 from marshmallow import ValidationError
 
+from ..db.utils import (
+    get_constraint_name, get_error_detail, is_foreign_key_violation
+)
+from .codec import create_json_codec
+
+logger = logging.getLogger(__name__)
+
+# Максимальное количество элементов в пакетном запросе
+MAX_BATCH_SIZE = 1000
+
+# Cookie, которая направляет чтение клиента в основную БД
+READ_PRIMARY_COOKIE = 'read_primary'
+
+# Кодек для приложений, в которых app['json_codec'] не задан
+FALLBACK_JSON_CODEC = create_json_codec()
+
+SECTION_DOES_NOT_EXIST = 'Section with id {} does not exist'
+POST_DOES_NOT_EXIST = 'Post with id {} does not exist'
+COMMENT_DOES_NOT_EXIST = 'Comment with id {} does not exist'
+REFERENCE_DOES_NOT_EXIST = 'Referenced object does not exist'
+
+# Внешние ключи (имена по умолчанию Postgres: <таблица>_<столбец>_fkey) ->
+# поле со ссылкой и сообщение об ошибке
+FOREIGN_KEYS = {
+    'post_section_id_fkey': ('section_id', SECTION_DOES_NOT_EXIST),
+    'comment_post_id_fkey': ('post_id', POST_DOES_NOT_EXIST),
+    'comment_parent_id_fkey': ('parent_id', COMMENT_DOES_NOT_EXIST),
+}
+
+
+def get_read_db(request):
+    """Возвращает движок БД для запроса на чтение.
+    
+    Чтение распределяется между репликами случайным образом. Если реплик
+    нет или клиент недавно писал в БД (см. read_your_writes_middleware),
+    используется основная БД."""
+    replicas = request.app.get('db_replicas')
+    if not replicas or READ_PRIMARY_COOKIE in request.cookies:
+        return request.app['db']
+    return random.choice(replicas)
+
+
+def is_post_json_in_db(request):
+    """Собирается ли ответ GET /posts/{id} в БД (см. get_post_json)."""
+    api_config = request.app.get('config', {}).get('api', {})
+    return api_config.get('post_json_in_db', False)
+
+
+def get_post_cache(request):
+    """Возвращает кеш ответов GET /posts/{id} (см. cache.py) или None,
+    если кеш отключен."""
+    return request.app.get('post_cache')
+
+
+def invalidate_posts(request, *post_ids):
+    """Удаляет из кеша ответы по постам, данные которых изменились.
+    
+    Вызывается после записи в БД. Без post_ids кеш очищается целиком,
+    например при каскадном удалении раздела."""
+    cache = get_post_cache(request)
+    if cache is None:
+        return
+    if not post_ids:
+        cache.clear()
+    for post_id in set(post_ids):
+        cache.invalidate(post_id)
+
+
+def get_json_codec(request):
+    """Возвращает кодек JSON приложения (см. codec.py)."""
+    return request.app.get('json_codec', FALLBACK_JSON_CODEC)
+
+
+def json_response(request, data, status=200, headers=None):
+    """Формирует JSON-ответ кодеком приложения."""
+    return json_body_response(
+        get_json_codec(request).dumps(data), status=status, headers=headers
+    )
+
+
+def json_body_response(body, status=200, headers=None):
+    """Формирует JSON-ответ с уже сериализованным телом."""
+    return web.Response(
+        body=body, status=status, headers=headers,
+        content_type='application/json', charset='utf-8'
+    )
+
+
+async def coalesce(request, key, fetch):
+    """Выполняет выборку для запроса на чтение, объединяя ее
+    с одинаковыми одновременными запросами (см. singleflight.py).
+    
+    :param key: ключ, от которого полностью зависит результат: вид
+    ресурса, id, параметры запроса.
+    :param fetch: функция без аргументов, возвращающая корутину выборки.
+    Вместо HTTP-исключений должна возвращать значение (например, None),
+    по которому каждый запрос сформирует свой ответ."""
+    single_flight = request.app.get('single_flight')
+    if single_flight is None:
+        return await fetch()
+    # Клиент, читающий из основной БД, не должен получить результат,
+    # прочитанный с реплики
+    return await single_flight.do(
+        (key, READ_PRIMARY_COOKIE in request.cookies), fetch
+    )
+
+
+def make_etag(*parts):
+    """Слабый ETag по версии данных ответа.
+    
+    Ответ сравнивается не побайтно, а по версиям строк, из которых он
+    построен, поэтому ETag слабый.
+    
+    :param parts: значения, от которых зависит ответ: версии строк
+    (id, created_at, updated_at), параметры запроса."""
+    return 'W/"{}"'.format(hashlib.sha1(repr(parts).encode()).hexdigest())
+
+
+def make_page_etag(page, query_params):
+    """ETag страницы пагинации по версиям ее элементов.
+    
+    :param page: страница (Page).
+    :param query_params: параметры запроса страницы."""
+    return make_etag(
+        sorted(query_params.items()), page.page_num, page.per_page,
+        page.total, page.next,
+        [(item.id, item.created_at, item.updated_at) for item in page.items]
+    )
+
+
+def is_conditional(request):
+    """Проверяет, что запрос условный (If-None-Match, If-Modified-Since).
+    
+    Такой запрос может получить 304 по версии данных без сериализации
+    ответа, поэтому выборки для него не объединяются с остальными
+    (см. coalesce)."""
+    return (
+        hdrs.IF_NONE_MATCH in request.headers or
+        hdrs.IF_MODIFIED_SINCE in request.headers
+    )
+
+
+def check_not_modified(request, etag, last_modified=None):
+    """Отвечает 304 Not Modified, если версия ответа у клиента актуальна.
+    Иначе возвращает заголовки с валидаторами для ответа.
+    
+    If-Modified-Since учитывается, только если нет If-None-Match.
+    
+    :param etag: ETag ответа (см. make_etag).
+    :param last_modified: время последнего изменения данных ответа
+    в UTC. Передается, только если удаление данных тоже его меняет."""
+    headers = {
+        hdrs.ETAG: etag,
+        # Без явного указания клиенты могут кешировать ответы
+        # с Last-Modified эвристически и не перепроверять их
+        hdrs.CACHE_CONTROL: 'no-cache',
+        # Ответ может быть сжат (см. compression_middleware), ответ 304
+        # должен содержать тот же Vary, что и 200
+        hdrs.VARY: hdrs.ACCEPT_ENCODING
+    }
+    if last_modified is not None:
+        last_modified = last_modified.replace(
+            microsecond=0, tzinfo=timezone.utc
+        )
+        headers[hdrs.LAST_MODIFIED] = format_datetime(
+            last_modified, usegmt=True
+        )
+    if_none_match = request.headers.get(hdrs.IF_NONE_MATCH)
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, etag)
+    else:
+        not_modified = (
+            last_modified is not None and
+            request.if_modified_since is not None and
+            last_modified <= request.if_modified_since
+        )
+    if not_modified:
+        raise web.HTTPNotModified(headers=headers)
+    return headers
+
+
+def _etag_matches(if_none_match, etag):
+    """Слабое сравнение ETag со значением заголовка If-None-Match."""
+    if if_none_match.strip() == '*':
+        return True
+    opaque_tag = etag[2:] if etag.startswith('W/') else etag
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == opaque_tag:
+            return True
+    return False
+
 
 async def load_data(request, schema):
     try:
-        request_data = await request.json()
-    except JSONDecodeError:
+        request_data = get_json_codec(request).loads(await request.read())
+    except ValueError:
         raise web.HTTPBadRequest
     try:
         return schema.load(request_data).data
     except ValidationError as exc:
         raise web.HTTPBadRequest(body=str(exc.messages))
+
+
+async def load_batch(request, schema):
+    """Загружает список элементов пакетного запроса.
+    
+    :param schema: схема с many=True."""
+    items = await load_data(request, schema)
+    if not items or len(items) > MAX_BATCH_SIZE:
+        raise web.HTTPBadRequest(
+            body='Batch must contain from 1 to {} items'.format(
+                MAX_BATCH_SIZE
+            )
+        )
+    return items
+
+
+def load_query(request, schema):
+    try:
+        return schema.load(request.query).data
+    except ValidationError as exc:
+        raise web.HTTPBadRequest(body=str(exc.messages))
+
+
+def get_reference_error(exc, data=None):
+    """Возвращает сообщение для клиента о нарушении внешнего ключа.
+    
+    Пояснение БД не возвращается клиенту: оно содержит имена таблиц
+    и столбцов.
+    
+    :param exc: ошибка БД.
+    :param data: записываемые данные. Если не переданы - сообщение
+    не содержит id связанного объекта."""
+    reference = FOREIGN_KEYS.get(get_constraint_name(exc))
+    if reference is None or data is None:
+        return REFERENCE_DOES_NOT_EXIST
+    field, message = reference
+    return message.format(data[field])
+
+
+@contextmanager
+def foreign_key_guard(data):
+    """Преобразует нарушение внешнего ключа в ответ 400 Bad Request.
+    
+    Существование связанных объектов проверяет сама БД при записи,
+    без отдельных запросов и гонок между проверкой и записью.
+    
+    :param data: записываемые данные."""
+    try:
+        yield
+    except Exception as exc:
+        if not is_foreign_key_violation(exc):
+            raise
+        err_message = get_reference_error(exc, data)
+        logger.error('{}: {}'.format(err_message, get_error_detail(exc)))
+        raise web.HTTPBadRequest(body=err_message)
+
+
+def find_reference_errors(items, field, existing_ids, message, errors=None):
+    """Собирает ошибки элементов пакета, ссылающихся на несуществующие
+    объекты, в формате ошибок валидации marshmallow: {индекс: {поле: [...]}}.
+    
+    :param items: элементы пакета.
+    :param field: поле со ссылкой.
+    :param existing_ids: id существующих объектов.
+    :param message: шаблон сообщения об ошибке.
+    :param errors: ранее собранные ошибки, которые нужно дополнить."""
+    errors = {} if errors is None else errors
+    for index, item in enumerate(items):
+        obj_id = item.get(field)
+        if obj_id is not None and obj_id not in existing_ids:
+            errors.setdefault(index, {})[field] = [message.format(obj_id)]
+    return errors
+
+
+def to_ndjson_line(codec, data):
+    """Сериализует объект в строку NDJSON."""
+    return codec.dumps(data) + b'\n'
@@ -1,17 +1,81 @@
-from marshmallow import Schema, fields
-from marshmallow.validate import Length
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from marshmallow import Schema, ValidationError, fields, validates_schema
+from marshmallow.validate import Length, OneOf, Range
+
+from ...db.queries import (
+    DEFAULT_COMMENTS_LIMIT, MAX_COMMENTS_LIMIT, MAX_PER_PAGE, TOTAL_MODES
+)
+from ..serializers import make_serializer
+
+
+class Cursor(fields.Field):
+    """Непрозрачный курсор пагинации.
+    
+    Упаковывает ключ сортировки (created_at, id) элемента в base64-строку
+    и распаковывает обратно."""
+    
+    default_error_messages = {'invalid': 'Not a valid cursor.'}
+    
+    def _serialize(self, value, attr, obj):
+        if value is None:
+            return None
+        created_at, obj_id = value
+        raw = '{}|{}'.format(created_at.isoformat(), obj_id)
+        return urlsafe_b64encode(raw.encode()).decode()
+    
+    def _deserialize(self, value, attr, data):
+        try:
+            raw = urlsafe_b64decode(value.encode()).decode()
+            created_at, obj_id = raw.split('|')
+            return datetime.fromisoformat(created_at), int(obj_id)
+        except (AttributeError, ValueError):
+            self.fail('invalid')
 
 
 class Page(Schema):
     """Базовый класс-схема для представления страницы пагинации.
     
-    :param page_num: Номер текущей страницы.
+    :param page_num: Номер текущей страницы (None для страниц,
+        запрошенных по курсору after, - у них номера нет).
     :param per_page: Количество элементов на странице.
-    :param total: Общее количество элементов."""
+    :param total: Общее количество элементов (точное или оценка).
+    :param next: Курсор следующей страницы."""
     
-    page_num = fields.Integer(required=True, allow_none=False)
+    page_num = fields.Integer(required=True, allow_none=True)
     per_page = fields.Integer(required=True, allow_none=False)
-    total = fields.Integer(required=True, allow_none=False)
+    total = fields.Integer(required=True, allow_none=True)
+    next = Cursor(required=True, allow_none=True)
+    
+    
+class PageQuerySchema(Schema):
+    """Базовый класс-схема параметров запроса страницы пагинации."""
+    
+    page_num = fields.Integer(validate=Range(min=1))
+    per_page = fields.Integer(validate=Range(min=1, max=MAX_PER_PAGE))
+    after = Cursor()
+    total = fields.String(validate=OneOf(TOTAL_MODES))
+    search = fields.String(validate=Length(min=1))
+    
+    @validates_schema
+    def validate_cursor(self, data):
+        # Результаты поиска сортируются по релевантности, курсор
+        # (created_at, id) к ним неприменим
+        if 'after' in data and 'search' in data:
+            raise ValidationError(
+                'Cursor pagination is not supported for search', 'after'
+            )
+    
+    
+class SectionsQuerySchema(PageQuerySchema):
+    
+    name__like = fields.String()
+    
+    
+class PostsQuerySchema(PageQuerySchema):
+    
+    topic__like = fields.String()
     
     
 class SectionSchema(Schema):
@@ -49,6 +113,30 @@ class CommentSchema(Schema):
         required=True, allow_none=False, validate=Length(min=1)
     )
     children = fields.List(fields.Integer(), dump_only=True, required=True)
+    replies_count = fields.Integer(dump_only=True)
+    has_more_replies = fields.Boolean(dump_only=True)
+    
+    
+class CommentsQuerySchema(Schema):
+    """Схема параметров запроса ветки комментариев.
+    
+    :param max_depth: глубина ответов относительно корня ветки
+    (0 - только сам комментарий).
+    :param limit: максимальное количество комментариев."""
+    
+    max_depth = fields.Integer(validate=Range(min=0))
+    limit = fields.Integer(
+        missing=DEFAULT_COMMENTS_LIMIT,
+        validate=Range(min=1, max=MAX_COMMENTS_LIMIT)
+    )
+
+
+class PostCommentsQuerySchema(CommentsQuerySchema):
+    """Схема параметров запроса комментариев поста. Глубина считается
+    от поста: 1 - только комментарии верхнего уровня, поста без
+    комментариев max_depth=0 не запрашивает."""
+    
+    max_depth = fields.Integer(validate=Range(min=1))
 
 
 class PostSchema(Schema):
@@ -67,3 +155,48 @@ class PostsPageSchema(Page):
     items = fields.Nested(
         PostSchema, many=True, required=True, allow_none=False
     )
+
+
+class ExportRecordSchema(Schema):
+    """Базовый класс-схема записи NDJSON-выгрузки.
+    
+    Формат записей совпадает с форматом импорта (import_data.py)."""
+    
+    id = fields.Integer()
+    created_at = fields.DateTime()
+    updated_at = fields.DateTime()
+
+
+class SectionExportSchema(ExportRecordSchema):
+    
+    type = fields.Constant('section')
+    name = fields.String()
+    description = fields.String()
+
+
+class PostExportSchema(ExportRecordSchema):
+    
+    type = fields.Constant('post')
+    section_id = fields.Integer()
+    topic = fields.String()
+    description = fields.String()
+
+
+class CommentExportSchema(ExportRecordSchema):
+    
+    type = fields.Constant('comment')
+    post_id = fields.Integer()
+    parent_id = fields.Integer()
+    text = fields.String()
+
+
+# Сериализаторы ответов на чтение, строятся один раз при импорте,
+# см. make_serializer
+dump_section = make_serializer(SectionSchema())
+dump_sections_page = make_serializer(SectionsPageSchema())
+dump_post = make_serializer(PostSchema())
+dump_posts_page = make_serializer(PostsPageSchema())
+dump_comments = make_serializer(CommentSchema(many=True))
+dump_section_export = make_serializer(SectionExportSchema())
+dump_post_export = make_serializer(PostExportSchema())
+dump_comment_export = make_serializer(CommentExportSchema())
@@ -1,12 +1,23 @@
+import logging
+from functools import partial
+
 from aiohttp import web
 from aiojobs.aiohttp import atomic
 
 from ....db.queries import (
-    create_comment, delete_comment, is_comment_exist, is_post_exist,
-    update_comment
+    create_comment, create_comments, delete_comment, get_comment_subtree,
+    get_existing_comment_ids, get_existing_post_ids, update_comment
+)
+from ....db.utils import get_error_detail, is_foreign_key_violation
+from ...utils import (
+    COMMENT_DOES_NOT_EXIST, POST_DOES_NOT_EXIST, coalesce,
+    find_reference_errors, foreign_key_guard, get_json_codec, get_read_db,
+    get_reference_error, invalidate_posts, json_body_response, json_response,
+    load_batch, load_data, load_query
 )
-from ...utils import load_data
-from ..resources import CommentSchema
+from ..resources import CommentSchema, CommentsQuerySchema, dump_comments
+
+logger = logging.getLogger(__name__)
 
 
 @atomic
@@ -15,50 +26,105 @@ async def create_comment_view(request: web.Request) -> web.Response:
     schema = CommentSchema(strict=True)
     comment_data = await load_data(request, schema)
     async with request.app['db'].acquire() as conn:
-        # Проверяем, что пост, к которому оставляется коммент существует
-        if not await is_post_exist(conn, comment_data['post_id']):
-            raise web.HTTPBadRequest(
-                body='Post with id {} does not exist'.format(
-                    comment_data['post_id']
-                )
+        # Существование поста и родительского комментария проверяют
+        # внешние ключи
+        with foreign_key_guard(comment_data):
+            new_comment = await create_comment(
+                conn, comment_data['post_id'], comment_data['text'],
+                comment_data.get('parent_id')
             )
-        # Если передан id родительского комментария - проверяем,
-        # что он существует
-        if comment_data.get('parent_id') is not None:
-            if not await is_comment_exist(conn, comment_data['parent_id']):
-                raise web.HTTPBadRequest(
-                    body='Comment with id {} does not exist'.format(
-                        comment_data['parent_id']
-                    )
-                )
-        new_comment = await create_comment(
-            conn, comment_data['post_id'], comment_data['text'],
-            comment_data.get('parent_id')
-        )
+        invalidate_posts(request, new_comment.post_id)
         response_data = schema.dump(new_comment).data
-        return web.json_response(response_data, status=201)
+        return json_response(request, response_data, status=201)
+
+
+@atomic
+async def create_comments_view(request: web.Request) -> web.Response:
+    """View для создания нескольких комментариев одним запросом."""
+    schema = CommentSchema(many=True, strict=True)
+    comments_data = await load_batch(request, schema)
+    async with request.app['db'].acquire() as conn:
+        try:
+            new_comments = await create_comments(conn, comments_data)
+        except Exception as exc:
+            if not is_foreign_key_violation(exc):
+                raise
+            # Пакет вставляется одним запросом целиком или не вставляется
+            # вовсе - находим элементы со ссылками на несуществующие
+            # посты и комментарии
+            existing_post_ids = await get_existing_post_ids(
+                conn, (_comment['post_id'] for _comment in comments_data)
+            )
+            existing_comment_ids = await get_existing_comment_ids(
+                conn, (
+                    _comment['parent_id'] for _comment in comments_data
+                    if _comment.get('parent_id') is not None
+                )
+            )
+            errors = find_reference_errors(
+                comments_data, 'post_id', existing_post_ids,
+                POST_DOES_NOT_EXIST
+            )
+            errors = find_reference_errors(
+                comments_data, 'parent_id', existing_comment_ids,
+                COMMENT_DOES_NOT_EXIST, errors=errors
+            )
+            err_message = str(errors or get_reference_error(exc))
+            logger.error('Can not create comments. {}: {}'.format(
+                err_message, get_error_detail(exc)
+            ))
+            raise web.HTTPBadRequest(body=err_message)
+    invalidate_posts(request, *(_comment.post_id for _comment in new_comments))
+    response_data = schema.dump(new_comments).data
+    return json_response(request, response_data, status=201)
 
 
 @atomic
 async def update_comment_view(request: web.Request) -> web.Response:
     schema = CommentSchema(strict=True)
-    comment_id = request.match_info['id']
+    comment_id = int(request.match_info['id'])
     comment_data = await load_data(request, schema)
     async with request.app['db'].acquire() as conn:
-        if not await is_comment_exist(conn, comment_id):
-            raise web.HTTPNotFound
         updated_comment = await update_comment(
             conn, comment_id, comment_data['text']
         )
+        if updated_comment is None:
+            raise web.HTTPNotFound
+        invalidate_posts(request, updated_comment.post_id)
         response_data = schema.dump(updated_comment).data
-        return web.json_response(response_data)
+        return json_response(request, response_data)
+
+
+async def retrieve_comment_subtree_view(request):
+    """View для получения ветки ответов на комментарий."""
+    comment_id = int(request.match_info['id'])
+    query_params = load_query(request, CommentsQuerySchema(strict=True))
+    body = await coalesce(
+        request,
+        ('comment_subtree', comment_id, tuple(sorted(query_params.items()))),
+        partial(_fetch_comment_subtree, request, comment_id, query_params)
+    )
+    if body is None:
+        raise web.HTTPNotFound
+    return json_body_response(body)
+
+
+async def _fetch_comment_subtree(request, comment_id, query_params):
+    """:return: тело ответа с веткой комментариев или None, если
+    комментария нет."""
+    async with get_read_db(request).acquire() as conn:
+        comments = await get_comment_subtree(conn, comment_id, **query_params)
+    if not comments:
+        return None
+    return get_json_codec(request).dumps(dump_comments(comments))
 
 
 @atomic
 async def delete_comment_view(request):
-    comment_id = request.match_info['id']
+    comment_id = int(request.match_info['id'])
     async with request.app['db'].acquire() as conn:
-        if not await is_comment_exist(conn, comment_id):
+        deleted_comment = await delete_comment(conn, comment_id)
+        if deleted_comment is None:
             raise web.HTTPNotFound
-        await delete_comment(conn, comment_id)
+        invalidate_posts(request, deleted_comment.post_id)
     return web.json_response(status=204)
@@ -0,0 +1,27 @@
+from ...utils import get_post_cache, json_response
+
+
+async def retrieve_metrics_view(request):
+    """Возвращает состояние пулов соединений с основной БД и репликами,
+    статистику кеша постов, прослушивания изменений и объединения
+    запросов на чтение."""
+    post_cache = get_post_cache(request)
+    changes_listener = request.app.get('changes_listener')
+    single_flight = request.app.get('single_flight')
+    response_data = {
+        'db': {
+            'primary': request.app['db'].stats(),
+            'replicas': [
+                replica.stats()
+                for replica in request.app.get('db_replicas', [])
+            ]
+        },
+        'post_cache': None if post_cache is None else post_cache.stats(),
+        'changes_listener': (
+            None if changes_listener is None else changes_listener.stats()
+        ),
+        'single_flight': (
+            None if single_flight is None else single_flight.stats()
+        )
+    }
+    return json_response(request, response_data)
@@ -1,14 +1,28 @@
 import logging
+from functools import partial
 
 from aiohttp import web
 from aiojobs.aiohttp import atomic
 
 from ....db.queries import (
-    create_post, delete_post, find_posts, get_post, get_post_comments,
-    is_post_exist, is_section_exist, update_post
+    create_post, create_posts, delete_post, find_posts,
+    get_existing_section_ids, get_post, get_post_comments, get_post_json,
+    get_post_version, update_post
+)
+from ....db.utils import get_error_detail, is_foreign_key_violation
+from ...cache import CachedPost
+from ...compression import COMPRESSED_BODIES
+from ...utils import (
+    READ_PRIMARY_COOKIE, SECTION_DOES_NOT_EXIST, check_not_modified, coalesce,
+    find_reference_errors, foreign_key_guard, get_json_codec, get_post_cache,
+    get_read_db, get_reference_error, invalidate_posts, is_conditional,
+    is_post_json_in_db, json_body_response, json_response, load_batch,
+    load_data, load_query, make_etag, make_page_etag
+)
+from ..resources import (
+    PostCommentsQuerySchema, PostSchema, PostsQuerySchema, dump_post,
+    dump_posts_page
 )
-from ...utils import load_data
-from ..resources import PostSchema, PostsPageSchema
 
 logger = logging.getLogger(__name__)
 
@@ -19,92 +33,191 @@ async def create_post_view(request):
     schema = PostSchema(strict=True)
     post_data = await load_data(request, schema)
     async with request.app['db'].acquire() as conn:
-        if not await is_section_exist(conn, post_data['section_id']):
-            err_message = (
-                'Can not create post. '
-                'Section with id {} does not exist'.format(
-                    post_data['section_id']
-                )
+        # Существование раздела проверяет внешний ключ
+        with foreign_key_guard(post_data):
+            new_post = await create_post(
+                conn, post_data['section_id'], post_data['topic'],
+                post_data['description']
             )
-            logger.error(err_message)
-            raise web.HTTPBadRequest(body=err_message)
-        new_post = await create_post(
-            conn, post_data['section_id'], post_data['topic'],
-            post_data['description']
-        )
         response_data = schema.dump(new_post).data
-        return web.json_response(response_data, status=201)
+        return json_response(request, response_data, status=201)
+
+
+@atomic
+async def create_posts_view(request):
+    """View для создания нескольких постов одним запросом."""
+    schema = PostSchema(many=True, strict=True)
+    posts_data = await load_batch(request, schema)
+    async with request.app['db'].acquire() as conn:
+        try:
+            new_posts = await create_posts(conn, posts_data)
+        except Exception as exc:
+            if not is_foreign_key_violation(exc):
+                raise
+            # Пакет вставляется одним запросом целиком или не вставляется
+            # вовсе - находим элементы со ссылками на несуществующие разделы
+            existing_ids = await get_existing_section_ids(
+                conn, (_post['section_id'] for _post in posts_data)
+            )
+            errors = find_reference_errors(
+                posts_data, 'section_id', existing_ids, SECTION_DOES_NOT_EXIST
+            )
+            err_message = str(errors or get_reference_error(exc))
+            logger.error('Can not create posts. {}: {}'.format(
+                err_message, get_error_detail(exc)
+            ))
+            raise web.HTTPBadRequest(body=err_message)
+    response_data = schema.dump(new_posts).data
+    return json_response(request, response_data, status=201)
 
 
 @atomic
 async def update_post_view(request):
     schema = PostSchema(strict=True)
-    post_id = request.match_info['id']
+    post_id = int(request.match_info['id'])
     post_data = await load_data(request, schema)
     async with request.app['db'].acquire() as conn:
-        if not await is_post_exist(conn, post_id):
+        updated_post = await update_post(
+            conn, post_id, topic=post_data['topic'],
+            description=post_data['description']
+        )
+        if updated_post is None:
             logger.error(
                 'Cannot update post with id {}. Post does not exist'.format(
                     post_id
                 )
             )
             raise web.HTTPNotFound
-        updated_post = await update_post(
-            conn, post_id, topic=post_data['topic'],
-            description=post_data['description']
-        )
+        invalidate_posts(request, post_id)
         post_comments = await get_post_comments(conn, post_id)
-        response_data = schema.load({
+        response_data = schema.dump({
             'id': updated_post.id,
             'section_id': updated_post.section_id,
             'topic': updated_post.topic,
             'description': updated_post.description,
             'comments': post_comments
         }).data
-        return web.json_response(response_data)
+        return json_response(request, response_data)
 
 
 async def retrieve_post_view(request):
-    schema = PostSchema()
-    post_id = request.match_info['id']
-    async with request.app['db'].acquire() as conn:
-        post = await get_post(conn, post_id)
-        if post is None:
-            raise web.HTTPNotFound
-        post_comments = await get_post_comments(conn, post_id)
-        response_data = schema.load({
-            'id': post.id,
-            'section_id': post.section_id,
-            'topic': post.topic,
-            'description': post.description,
-            'comments': post_comments
-        }).data
-        return web.json_response(response_data)
+    post_id = int(request.match_info['id'])
+    query_params = load_query(request, PostCommentsQuerySchema(strict=True))
+    cache = get_post_cache(request)
+    cache_key = tuple(sorted(query_params.items()))
+    # Клиент, который недавно писал в БД, читает из основной БД, а в кеше
+    # может быть ответ, прочитанный с отстающей реплики
+    if cache is not None and READ_PRIMARY_COOKIE not in request.cookies:
+        cached_post = cache.get(post_id, cache_key)
+        if cached_post is not None:
+            return _post_response(request, cached_post)
+    if is_conditional(request):
+        # Ответ 304 отдается по версии поста без выборки и сериализации,
+        # поэтому условные запросы не объединяются с остальными
+        cached_post = await _fetch_post(
+            request, post_id, query_params, conditional=True
+        )
+    else:
+        cached_post = await coalesce(
+            request, ('post', post_id, cache_key),
+            partial(_fetch_post, request, post_id, query_params)
+        )
+    if cached_post is None:
+        raise web.HTTPNotFound
+    return _post_response(request, cached_post)
+
+
+def _post_response(request, cached_post):
+    headers = check_not_modified(request, cached_post.etag)
+    response = json_body_response(cached_post.body, headers=headers)
+    # Тело из кеша сжимается один раз на кодировку
+    response[COMPRESSED_BODIES] = cached_post.compressed
+    return response
+
+
+async def _fetch_post(request, post_id, query_params, conditional=False):
+    """Читает пост с комментариями и сериализует ответ.
+    
+    :param conditional: ответить 304, если версия поста у клиента
+    актуальна.
+    :return: тело ответа и ETag или None, если поста нет."""
+    cache = get_post_cache(request)
+    cache_key = tuple(sorted(query_params.items()))
+    cache_version = None if cache is None else cache.version
+    db = get_read_db(request)
+    async with db.acquire() as conn:
+        version = await get_post_version(conn, post_id)
+        if version is None:
+            return None
+        etag = make_etag(post_id, list(version.values()), cache_key)
+        if conditional:
+            check_not_modified(request, etag)
+        if is_post_json_in_db(request):
+            post_json = await get_post_json(conn, post_id, **query_params)
+            if post_json is None:
+                return None
+            body = post_json.encode()
+        else:
+            post = await get_post(conn, post_id)
+            if post is None:
+                return None
+            post_comments = await get_post_comments(
+                conn, post_id, **query_params
+            )
+            body = get_json_codec(request).dumps(dump_post({
+                'id': post.id,
+                'section_id': post.section_id,
+                'topic': post.topic,
+                'description': post.description,
+                'comments': post_comments
+            }))
+    cached_post = CachedPost(body, etag, {})
+    if cache is not None:
+        cache.set(
+            post_id, cache_key, cached_post, cache_version,
+            from_replica=db is not request.app['db']
+        )
+    return cached_post
 
 
 async def retrieve_posts_view(request):
-    schema = PostsPageSchema(exclude=('children', ))
-    query_params = {}
-    for param in ('topic__like', 'page_num', 'per_page'):
-        if param in request.query:
-            query_params[param] = request.query[param]
-    async with request.app['db'].acquire() as conn:
+    query_params = load_query(request, PostsQuerySchema(strict=True))
+    if is_conditional(request):
+        etag, body = await _fetch_posts_page(
+            request, query_params, conditional=True
+        )
+    else:
+        etag, body = await coalesce(
+            request, ('posts', tuple(sorted(query_params.items()))),
+            partial(_fetch_posts_page, request, query_params)
+        )
+    headers = check_not_modified(request, etag)
+    return json_body_response(body, headers=headers)
+
+
+async def _fetch_posts_page(request, query_params, conditional=False):
+    """:param conditional: ответить 304, если версия страницы у клиента
+    актуальна, не сериализуя ответ.
+    :return: ETag и тело ответа со страницей постов."""
+    async with get_read_db(request).acquire() as conn:
         posts_page = await find_posts(conn, **query_params)
-    response_data = schema.dump(posts_page).data
-    return web.json_response(response_data)
+    etag = make_page_etag(posts_page, query_params)
+    if conditional:
+        check_not_modified(request, etag)
+    return etag, get_json_codec(request).dumps(dump_posts_page(posts_page))
 
 
 @atomic
 async def delete_post_view(request):
-    post_id = request.match_info['id']
+    post_id = int(request.match_info['id'])
     async with request.app['db'].acquire() as conn:
-        if not await is_post_exist(conn, post_id):
+        if await delete_post(conn, post_id) is None:
             logger.error(
                 'Cannot delete post with id {}. Post does not exist'.format(
                     post_id
                 )
             )
             raise web.HTTPNotFound
-        await delete_post(conn, post_id)
+        invalidate_posts(request, post_id)
         logger.info('Post with id {} was successfully deleted.')
     return web.json_response(status=204)
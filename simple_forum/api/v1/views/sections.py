@@ -1,17 +1,31 @@
 import logging
+from functools import partial
 
 from aiohttp import web
 from aiojobs.aiohttp import atomic
 
 from ....db.queries import (
     create_section, delete_section, find_sections, get_section,
-    is_section_exist, update_section
+    iter_section_export, update_section
+)
+from ...utils import (
+    check_not_modified, coalesce, get_json_codec, get_read_db,
+    invalidate_posts, is_conditional, json_body_response, json_response,
+    load_data, load_query, make_etag, make_page_etag, to_ndjson_line
+)
+from ..resources import (
+    SectionSchema, SectionsQuerySchema, dump_comment_export, dump_post_export,
+    dump_section, dump_section_export, dump_sections_page
 )
-from ...utils import load_data
-from ..resources import SectionSchema, SectionsPageSchema
 
 logger = logging.getLogger(__name__)
 
+# Сериализаторы записей выгрузки по значению колонки type
+EXPORT_SERIALIZERS = {
+    'post': dump_post_export,
+    'comment': dump_comment_export,
+}
+
 
 @atomic
 async def create_section_view(request):
@@ -22,65 +36,141 @@ async def create_section_view(request):
             conn, section_data['name'], section_data['description']
         )
     response_data = schema.dump(new_section).data
-    return web.json_response(response_data, status=201)
+    return json_response(request, response_data, status=201)
 
 
 @atomic
 async def update_section_view(request):
     schema = SectionSchema(strict=True)
-    section_id = request.match_info['id']
+    section_id = int(request.match_info['id'])
     section_data = await load_data(request, schema)
     async with request.app['db'].acquire() as conn:
-        if not await is_section_exist(conn, section_id):
+        updated_section = await update_section(
+            conn, section_id, name=section_data['name'],
+            description=section_data['description']
+        )
+        if updated_section is None:
             logger.error(
                 'Cannot update section id {}. Section does not exist'.format(
                     section_id
                 )
             )
             raise web.HTTPNotFound
-        updated_section = await update_section(
-            conn, section_id, name=section_data['name'],
-            description=section_data['description']
-        )
         response_data = schema.dump(updated_section).data
-        return web.json_response(response_data)
+        return json_response(request, response_data)
 
 
 async def retrieve_section_view(request):
-    section_id = request.match_info['id']
-    async with request.app['db'].acquire() as conn:
+    section_id = int(request.match_info['id'])
+    if is_conditional(request):
+        section = await _fetch_section(request, section_id, conditional=True)
+    else:
+        section = await coalesce(
+            request, ('section', section_id),
+            partial(_fetch_section, request, section_id)
+        )
+    if section is None:
+        logger.error('Section id {} does not exist'.format(section_id))
+        raise web.HTTPNotFound
+    etag, last_modified, body = section
+    headers = check_not_modified(request, etag, last_modified)
+    return json_body_response(body, headers=headers)
+
+
+async def _fetch_section(request, section_id, conditional=False):
+    """:param conditional: ответить 304, если версия раздела у клиента
+    актуальна, не сериализуя ответ.
+    :return: ETag, время изменения и тело ответа с разделом или None,
+    если раздела нет."""
+    async with get_read_db(request).acquire() as conn:
         section = await get_section(conn, section_id)
-        if section is None:
-            logger.error('Section id {} does not exist'.format(section_id))
-            raise web.HTTPNotFound
-    schema = SectionSchema()
-    response_data = schema.dump(section).data
-    return web.json_response(response_data)
+    if section is None:
+        return None
+    etag = make_etag(section.id, section.created_at, section.updated_at)
+    last_modified = section.updated_at or section.created_at
+    if conditional:
+        check_not_modified(request, etag, last_modified)
+    return (
+        etag, last_modified,
+        get_json_codec(request).dumps(dump_section(section))
+    )
 
 
 async def retrieve_sections_view(request):
-    schema = SectionsPageSchema()
-    query_params = {}
-    for param in ('name__like', 'page_num', 'per_page'):
-        if param in request.query:
-            query_params[param] = request.query[param]
-    async with request.app['db'].acquire() as conn:
+    query_params = load_query(request, SectionsQuerySchema(strict=True))
+    if is_conditional(request):
+        etag, body = await _fetch_sections_page(
+            request, query_params, conditional=True
+        )
+    else:
+        etag, body = await coalesce(
+            request, ('sections', tuple(sorted(query_params.items()))),
+            partial(_fetch_sections_page, request, query_params)
+        )
+    headers = check_not_modified(request, etag)
+    return json_body_response(body, headers=headers)
+
+
+async def _fetch_sections_page(request, query_params, conditional=False):
+    """:param conditional: ответить 304, если версия страницы у клиента
+    актуальна, не сериализуя ответ.
+    :return: ETag и тело ответа со страницей разделов."""
+    async with get_read_db(request).acquire() as conn:
         sections_page = await find_sections(conn, **query_params)
-    response_data = schema.dump(sections_page).data
-    return web.json_response(response_data)
+    etag = make_page_etag(sections_page, query_params)
+    if conditional:
+        check_not_modified(request, etag)
+    return (
+        etag, get_json_codec(request).dumps(dump_sections_page(sections_page))
+    )
+
+
+async def export_section_view(request):
+    """Выгружает раздел, его посты и комментарии в формате NDJSON.
+    
+    Строки читаются из серверного курсора пачками и сразу отправляются
+    клиенту, поэтому потребление памяти не зависит от размера раздела."""
+    section_id = int(request.match_info['id'])
+    async with get_read_db(request).acquire() as conn:
+        # Раздел и его содержимое читаются из одного снимка БД
+        async with conn.begin(
+            isolation_level='REPEATABLE READ', readonly=True
+        ):
+            # Выгрузка большого раздела может занять больше, чем
+            # statement_timeout из настроек
+            await conn.execute('SET LOCAL statement_timeout = 0')
+            section = await get_section(conn, section_id)
+            if section is None:
+                logger.error('Section id {} does not exist'.format(section_id))
+                raise web.HTTPNotFound
+            response = web.StreamResponse()
+            response.content_type = 'application/x-ndjson'
+            await response.prepare(request)
+            codec = get_json_codec(request)
+            await response.write(
+                to_ndjson_line(codec, dump_section_export(section))
+            )
+            async for rows in iter_section_export(conn, section_id):
+                await response.write(b''.join(
+                    to_ndjson_line(codec, EXPORT_SERIALIZERS[row.type](row))
+                    for row in rows
+                ))
+    await response.write_eof()
+    return response
 
 
 @atomic
 async def delete_section_view(request):
-    section_id = request.match_info['id']
+    section_id = int(request.match_info['id'])
     async with request.app['db'].acquire() as conn:
-        if not await is_section_exist(conn, section_id):
+        if await delete_section(conn, section_id) is None:
             logger.error(
                 'Cannot delete section id {}. Section does not exist'.format(
                     section_id
                 )
             )
             raise web.HTTPNotFound
-        await delete_section(conn, section_id)
+        # Посты раздела удалены каскадно, их id неизвестны
+        invalidate_posts(request)
         logger.info('Section id {} was successfully deleted.')
     return web.json_response(status=204)
@@ -0,0 +1,308 @@
+"""Бэкенд БД на asyncpg.
+
+Запросы в queries.py написаны для интерфейса SAConnection из aiopg.sa.
+Здесь этот интерфейс (execute, scalar, begin и результаты с fetchone,
+fetchall, first, scalar) реализован поверх asyncpg, поэтому все функции
+queries.py работают с обоими бэкендами без изменений.
+
+asyncpg использует бинарный протокол и автоматически подготавливает
+запросы: одинаковый SQL (а SQLAlchemy генерирует одинаковый SQL для
+запросов одной формы) разбирается и планируется один раз на соединение.
+"""
+import asyncio
+import itertools
+import json
+import re
+from functools import lru_cache
+
+import asyncpg
+from sqlalchemy.dialects.postgresql.base import PGCompiler, PGDialect
+
+# Ошибки, при которых стоит повторить подключение
+CONNECT_ERRORS = (OSError, asyncpg.CannotConnectNowError)
+
+# Параметры в стиле psycopg2 (%(name)s) в SQL-строках, см. compile_query
+_PYFORMAT_RE = re.compile(r'%\((\w+)\)s|%%')
+# Количество SQL-строк, для которых запоминается результат преобразования
+# параметров. Строки приходят из PreparedQuery, их число ограничено
+# количеством форм запросов
+PYFORMAT_CACHE_SIZE = 1024
+
+_ISOLATION_LEVELS = {
+    None: 'read_committed',
+    'READ COMMITTED': 'read_committed',
+    'REPEATABLE READ': 'repeatable_read',
+    'SERIALIZABLE': 'serializable',
+}
+
+
+class AsyncpgCompiler(PGCompiler):
+    """Компилятор с параметрами вида $1, $2, ... и вычислением
+    Python-умолчаний колонок, как в aiopg.sa."""
+
+    def _apply_numbered_params(self):
+        position = itertools.count(1)
+        self.string = re.sub(
+            r':\[_POSITION\]',
+            lambda match: '${}'.format(next(position)),
+            self.string
+        )
+
+    def construct_params(self, params=None, _group_number=None, _check=True):
+        compiled_params = super().construct_params(
+            params, _group_number, _check
+        )
+        for column in self.prefetch:
+            default = column.default
+            compiled_params[column.key] = (
+                default.arg(self.dialect) if default.is_callable
+                else default.arg
+            )
+        return compiled_params
+
+
+_dialect = PGDialect(paramstyle='numeric')
+_dialect.statement_compiler = AsyncpgCompiler
+_dialect.implicit_returning = True
+
+
+def _compile(query, params):
+    """Компилирует запрос в SQL и список позиционных параметров."""
+    if isinstance(query, str):
+        return _convert_pyformat(query, params or {})
+    compiled = query.compile(dialect=_dialect)
+    compiled_params = compiled.construct_params(params or None)
+    processors = compiled._bind_processors
+    return str(compiled), [
+        processors[name](compiled_params[name]) if name in processors
+        else compiled_params[name]
+        for name in compiled.positiontup
+    ]
+
+
+def _convert_pyformat(sql, params):
+    sql, names = _parse_pyformat(sql)
+    return sql, [params[name] for name in names]
+
+
+@lru_cache(maxsize=PYFORMAT_CACHE_SIZE)
+def _parse_pyformat(sql):
+    """Заменяет параметры %(name)s на $n.
+    Возвращает SQL и имена параметров в порядке номеров."""
+    positions = {}
+
+    def replace(match):
+        name = match.group(1)
+        if name is None:
+            return '%'
+        if name not in positions:
+            positions[name] = len(positions) + 1
+        return '${}'.format(positions[name])
+
+    sql = _PYFORMAT_RE.sub(replace, sql)
+    return sql, tuple(positions)
+
+
+class Row:
+    """Строка результата с доступом к колонкам по имени, индексу
+    и как к атрибутам, как у RowProxy из aiopg."""
+
+    __slots__ = ('_record',)
+
+    def __init__(self, record):
+        self._record = record
+
+    def __getattr__(self, name):
+        try:
+            return self._record[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __getitem__(self, key):
+        return self._record[key]
+
+    def __iter__(self):
+        return iter(self._record.values())
+
+    def __len__(self):
+        return len(self._record)
+
+    def __eq__(self, other):
+        return tuple(self) == tuple(other)
+
+    def keys(self):
+        return self._record.keys()
+
+    def values(self):
+        return self._record.values()
+
+    def items(self):
+        return self._record.items()
+
+    def __repr__(self):
+        return repr(tuple(self))
+
+
+class Result:
+    """Результат запроса. Строки уже получены целиком."""
+
+    def __init__(self, records):
+        self._rows = [Row(record) for record in records]
+        self._position = 0
+
+    async def fetchall(self):
+        rows = self._rows[self._position:]
+        self._position = len(self._rows)
+        return rows
+
+    async def fetchone(self):
+        if self._position >= len(self._rows):
+            return None
+        row = self._rows[self._position]
+        self._position += 1
+        return row
+
+    async def first(self):
+        return await self.fetchone()
+
+    async def scalar(self):
+        row = await self.fetchone()
+        return None if row is None else row[0]
+
+
+class Transaction:
+
+    def __init__(self, conn, isolation_level, readonly, deferrable):
+        self._conn = conn
+        self._readonly = readonly
+        self._transaction = conn.transaction(
+            isolation=_ISOLATION_LEVELS[isolation_level],
+            deferrable=deferrable
+        )
+
+    async def __aenter__(self):
+        await self._transaction.start()
+        if self._readonly:
+            # asyncpg 0.18 разрешает readonly только для serializable
+            await self._conn.execute('SET TRANSACTION READ ONLY')
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self._transaction.commit()
+        else:
+            await self._transaction.rollback()
+
+
+class Connection:
+    """Соединение asyncpg с интерфейсом SAConnection."""
+
+    def __init__(self, engine, connection):
+        self._engine = engine
+        self._connection = connection
+
+    @property
+    def connection(self):
+        return self._connection
+
+    @property
+    def closed(self):
+        return self._connection is None
+
+    async def execute(self, query, params=None):
+        sql, args = _compile(query, params)
+        return Result(await self._connection.fetch(sql, *args))
+
+    async def scalar(self, query, params=None):
+        sql, args = _compile(query, params)
+        return await self._connection.fetchval(sql, *args)
+
+    def begin(self, isolation_level=None, readonly=False, deferrable=False):
+        return Transaction(
+            self._connection, isolation_level, readonly, deferrable
+        )
+
+    async def close(self):
+        if self._connection is None:
+            return
+        await self._engine.release(self)
+
+
+class Engine:
+    """Пул соединений asyncpg с интерфейсом движка aiopg.sa."""
+
+    def __init__(self, pool, minsize, maxsize):
+        self._pool = pool
+        self._minsize = minsize
+        self._maxsize = maxsize
+        self._used = 0
+        # Наибольшее количество одновременно выданных соединений
+        self._peak = 0
+        self._closing = None
+
+    @property
+    def minsize(self):
+        return self._minsize
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @property
+    def size(self):
+        get_size = getattr(self._pool, 'get_size', None)
+        if get_size is not None:
+            return get_size()
+        # В asyncpg до 0.25 счетчика открытых соединений нет. Свободные
+        # соединения пул выдает в порядке LIFO и сам закрывает их только
+        # при pool_recycle, поэтому открыто minsize соединений или столько,
+        # сколько их было выдано одновременно
+        return max(self._minsize, self._peak)
+
+    @property
+    def freesize(self):
+        return self.size - self._used
+
+    async def acquire(self):
+        connection = await self._pool.acquire()
+        self._used += 1
+        self._peak = max(self._peak, self._used)
+        return Connection(self, connection)
+
+    async def release(self, conn):
+        connection, conn._connection = conn._connection, None
+        self._used -= 1
+        await self._pool.release(connection)
+
+    def close(self):
+        self._closing = asyncio.ensure_future(self._pool.close())
+
+    async def wait_closed(self):
+        await self._closing
+
+
+async def _init_connection(connection):
+    # psycopg2 разбирает json сам, asyncpg по умолчанию возвращает строку
+    await connection.set_type_codec(
+        'json', encoder=json.dumps, decoder=json.loads, schema='pg_catalog'
+    )
+
+
+async def create_engine(
+    host, port, database, user, password, minsize, maxsize, pool_recycle,
+    statement_timeout=None
+):
+    """Создает пул соединений asyncpg.
+
+    pool_recycle соответствует max_inactive_connection_lifetime: asyncpg
+    закрывает соединения, простаивающие дольше этого времени."""
+    server_settings = {}
+    if statement_timeout:
+        server_settings['statement_timeout'] = str(statement_timeout)
+    pool = await asyncpg.create_pool(
+        host=host, port=port, database=database, user=user,
+        password=password, min_size=minsize, max_size=maxsize,
+        max_inactive_connection_lifetime=max(pool_recycle, 0),
+        server_settings=server_settings, init=_init_connection
+    )
+    return Engine(pool, minsize, maxsize)
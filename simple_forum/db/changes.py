@@ -0,0 +1,217 @@
+"""Уведомления об изменениях данных через LISTEN/NOTIFY.
+
+Триггеры (см. миграцию c3f1a7e2b9d4) после каждой изменяющей команды
+отправляют в канал CHANGES_CHANNEL уведомления вида "<тип>:<id>":
+post:<id> - изменен пост или его комментарии, section:<id> - изменен
+раздел. Уведомления приходят после фиксации транзакции всем соединениям,
+выполнившим LISTEN, поэтому каждый процесс приложения сбрасывает свои
+кеши, какой бы процесс или внешний клиент ни изменил данные.
+
+Для прослушивания ChangesListener держит отдельное соединение вне пула
+и переподключается при его потере. Уведомления, отправленные, пока
+соединения нет, теряются, поэтому при потере и восстановлении соединения
+вызывается on_reset, который должен сбросить кеши целиком.
+"""
+import asyncio
+import logging
+from typing import Callable, Optional, Tuple
+
+import aiopg
+import asyncpg
+from psycopg2 import Error as AiopgError
+
+from .utils import BACKEND_AIOPG, BACKEND_ASYNCPG
+
+logger = logging.getLogger(__name__)
+
+CHANGES_CHANNEL = 'forum_changes'
+# Типы объектов в уведомлениях
+ENTITY_SECTION = 'section'
+ENTITY_POST = 'post'
+# Интервал в секундах между проверками соединения, если уведомлений нет
+PING_INTERVAL = 10
+# Задержка в секундах перед повторным подключением, удваивается
+# до MAX_RECONNECT_DELAY
+BASE_RECONNECT_DELAY = 0.1
+MAX_RECONNECT_DELAY = 10
+
+# application_name соединения, по которому его видно в pg_stat_activity
+APPLICATION_NAME = 'simple_forum_changes'
+
+# Ошибки потери соединения или невозможности подключиться
+LISTEN_ERRORS = (
+    OSError, asyncio.TimeoutError, AiopgError, asyncpg.PostgresError,
+    asyncpg.InterfaceError
+)
+
+
+def parse_change(payload: str) -> Optional[Tuple[str, int]]:
+    """Разбирает уведомление вида "<тип>:<id>".
+
+    :return: тип объекта и id или None, если формат неизвестен."""
+    entity, _, entity_id = payload.partition(':')
+    if not entity or not entity_id.isdigit():
+        return None
+    return entity, int(entity_id)
+
+
+class _AiopgListenConnection:
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    async def get_payload(self) -> str:
+        return (await self._conn.notifies.get()).payload
+
+    async def execute(self, sql):
+        async with self._conn.cursor() as cur:
+            await cur.execute(sql)
+
+    async def close(self):
+        await self._conn.close()
+
+
+class _AsyncpgListenConnection:
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._payloads = asyncio.Queue()
+
+    async def get_payload(self) -> str:
+        return await self._payloads.get()
+
+    async def execute(self, sql):
+        await self._conn.execute(sql)
+
+    async def listen(self, channel):
+        await self._conn.add_listener(channel, self._on_notification)
+
+    def _on_notification(self, conn, pid, channel, payload):
+        self._payloads.put_nowait(payload)
+
+    async def close(self):
+        await self._conn.close()
+
+
+async def _connect(db_config, channel):
+    params = {
+        key: db_config[key]
+        for key in ('host', 'port', 'database', 'user', 'password')
+    }
+    if db_config.get('backend', BACKEND_AIOPG) == BACKEND_ASYNCPG:
+        conn = _AsyncpgListenConnection(await asyncpg.connect(
+            server_settings={'application_name': APPLICATION_NAME}, **params
+        ))
+        await conn.listen(channel)
+    else:
+        conn = _AiopgListenConnection(await aiopg.connect(
+            application_name=APPLICATION_NAME, **params
+        ))
+        await conn.execute('LISTEN {}'.format(channel))
+    return conn
+
+
+class ChangesListener:
+    """Фоновая задача, которая слушает уведомления об изменениях.
+
+    :param db_config: настройки подключения (секция database конфига).
+    :param on_change: вызывается с типом объекта и id для каждого
+    уведомления.
+    :param on_reset: вызывается при подключении и потере соединения,
+    когда уведомления могли быть пропущены.
+    :param ping_interval: интервал проверки соединения в секундах."""
+
+    def __init__(
+        self, db_config: dict, on_change: Callable[[str, int], None],
+        on_reset: Callable[[], None], channel: str = CHANGES_CHANNEL,
+        ping_interval: float = PING_INTERVAL
+    ):
+        self.db_config = db_config
+        self.on_change = on_change
+        self.on_reset = on_reset
+        self.channel = channel
+        self.ping_interval = ping_interval
+        # Установлено, пока соединение слушает канал
+        self.connected = asyncio.Event()
+        self.notifications = 0
+        self.reconnects = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            'connected': self.connected.is_set(),
+            'notifications': self.notifications,
+            'reconnects': self.reconnects,
+        }
+
+    async def _run(self):
+        delay = BASE_RECONNECT_DELAY
+        while True:
+            try:
+                conn = await _connect(self.db_config, self.channel)
+            except LISTEN_ERRORS as exc:
+                logger.error(
+                    'Cannot listen to {}: {}. Retry in {}s'.format(
+                        self.channel, exc, delay
+                    )
+                )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                continue
+            delay = BASE_RECONNECT_DELAY
+            try:
+                self.connected.set()
+                self.on_reset()
+                await self._listen(conn)
+            except LISTEN_ERRORS as exc:
+                logger.error(
+                    'Lost connection listening to {}: {}'.format(
+                        self.channel, exc
+                    )
+                )
+                self.reconnects += 1
+            finally:
+                self.connected.clear()
+                self.on_reset()
+                await _close_quietly(conn)
+
+    async def _listen(self, conn):
+        while True:
+            try:
+                payload = await asyncio.wait_for(
+                    conn.get_payload(), self.ping_interval
+                )
+            except asyncio.TimeoutError:
+                # Без запросов потеря соединения может остаться незамеченной
+                await asyncio.wait_for(
+                    conn.execute('SELECT 1'), self.ping_interval
+                )
+                continue
+            self.notifications += 1
+            change = parse_change(payload)
+            if change is None:
+                logger.warning(
+                    'Unknown change notification {!r}'.format(payload)
+                )
+                continue
+            self.on_change(*change)
+
+
+async def _close_quietly(conn):
+    try:
+        await conn.close()
+    except LISTEN_ERRORS:
+        pass
@@ -0,0 +1,445 @@
+"""Массовый импорт разделов, постов и комментариев из NDJSON.
+
+Каждая строка входного потока - JSON-объект с полем type ('section',
+'post' или 'comment') и идентификатором id из исходной системы:
+
+    {"type": "section", "id": 1, "name": "...", "description": "..."}
+    {"type": "post", "id": 7, "section_id": 1, "topic": "...", ...}
+    {"type": "comment", "id": 3, "post_id": 7, "parent_id": null, ...}
+
+Ссылки (section_id, post_id, parent_id) указывают на id исходной системы,
+поэтому объект должен встретиться в потоке раньше, чем ссылающиеся на него
+записи. Новые id выделяются из последовательностей таблиц блоками, записи
+копятся в буферах и загружаются через COPY во временные таблицы,
+по транзакции на пачку. Оттуда они вставляются в таблицы форума, ссылки
+заменяются на новые id в SQL. Путь комментария заполняет триггер БД.
+
+Соответствие id исходной системы новым id хранится во временной таблице
+import_ids на сервере БД, а не в памяти процесса: память импорта
+ограничена размером пачки. Таблица растет на сервере на одну строку
+на запись и удаляется в конце импорта.
+"""
+import io
+import json
+import logging
+from collections import Counter, namedtuple
+from datetime import datetime
+from time import monotonic
+
+from psycopg2 import IntegrityError
+from psycopg2.errorcodes import UNIQUE_VIOLATION
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
+
+from simple_forum.db.models import comment, post, section
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 10000
+
+# Порядок загрузки пачки: родители раньше потомков
+RECORD_TYPES = ('section', 'post', 'comment')
+
+TABLES = {
+    'section': section,
+    'post': post,
+    'comment': comment,
+}
+
+# Ссылки на другие объекты: поле -> (тип объекта, может ли быть null)
+REFERENCES = {
+    'section': {},
+    'post': {'section_id': ('section', False)},
+    'comment': {
+        'post_id': ('post', False),
+        'parent_id': ('comment', True),
+    },
+}
+
+# Колонки, которые заполняет сама БД
+_GENERATED_COLUMNS = {'path'}
+
+_DATETIME_COLUMNS = {'created_at', 'updated_at'}
+
+# Диапазон bigint, в котором хранятся id исходной системы
+_MIN_LEGACY_ID = -2 ** 63
+_MAX_LEGACY_ID = 2 ** 63 - 1
+
+# Временная таблица соответствия id исходной системы новым id
+_IDS_TABLE = 'import_ids'
+
+# Экранирование для текстового формата COPY
+_COPY_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+
+_dialect = PGDialect_psycopg2()
+
+ImportResult = namedtuple('ImportResult', ('rows', 'elapsed'))
+
+
+class ImportDataError(Exception):
+    """Ошибка во входных данных."""
+
+    def __init__(self, line_num, message):
+        super().__init__('line {}: {}'.format(line_num, message))
+        self.line_num = line_num
+
+
+def _get_columns(record_type):
+    return [
+        column.name for column in TABLES[record_type].c
+        if column.name not in _GENERATED_COLUMNS
+    ]
+
+
+def _get_staging_table(record_type):
+    return 'import_{}'.format(record_type)
+
+
+def _is_legacy_id(value):
+    return (
+        isinstance(value, int) and
+        _MIN_LEGACY_ID <= value <= _MAX_LEGACY_ID
+    )
+
+
+def _format_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value).translate(_COPY_ESCAPES)
+
+
+class DataImporter:
+    """Загружает записи пачками через COPY.
+
+    :param conn: соединение psycopg2 в режиме autocommit.
+    :param batch_size: максимальное количество записей в пачке.
+    """
+
+    def __init__(self, conn, batch_size=DEFAULT_BATCH_SIZE):
+        self._conn = conn
+        self._batch_size = batch_size
+        self._columns = {
+            record_type: _get_columns(record_type)
+            for record_type in RECORD_TYPES
+        }
+        # Колонки временной таблицы пачки: номер строки, id исходной
+        # системы и колонки таблицы. Ссылки хранятся как id исходной
+        # системы
+        self._staging_columns = {
+            record_type: ['line_num', 'legacy_id'] + columns
+            for record_type, columns in self._columns.items()
+        }
+        # Выделенные, но еще не использованные id
+        self._free_ids = {record_type: [] for record_type in RECORD_TYPES}
+        # Количество строк import_ids: всего и при последнем ANALYZE
+        self._ids_count = 0
+        self._ids_analyzed_count = 0
+        self._buffers = {
+            record_type: io.StringIO() for record_type in RECORD_TYPES
+        }
+        self._pending = Counter()
+        self.rows = Counter()
+        self.started_at = monotonic()
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._conn.cursor() as cur:
+            cur.execute(
+                'CREATE TEMP TABLE {} ('
+                'record_type text, legacy_id bigint, id integer NOT NULL, '
+                'line_num bigint NOT NULL, '
+                'PRIMARY KEY (record_type, legacy_id))'.format(_IDS_TABLE)
+            )
+            for record_type in RECORD_TYPES:
+                table = TABLES[record_type]
+                columns = [
+                    'line_num bigint NOT NULL', 'legacy_id bigint NOT NULL'
+                ]
+                for column in self._columns[record_type]:
+                    if column in REFERENCES[record_type]:
+                        column_type = 'bigint'
+                    else:
+                        column_type = table.c[column].type.compile(
+                            dialect=_dialect
+                        )
+                    columns.append('{} {}'.format(column, column_type))
+                cur.execute(
+                    'CREATE TEMP TABLE {} ({}) ON COMMIT DELETE ROWS'.format(
+                        _get_staging_table(record_type), ', '.join(columns)
+                    )
+                )
+
+    def close(self):
+        """Удаляет временные таблицы импорта."""
+        with self._conn.cursor() as cur:
+            cur.execute('DROP TABLE IF EXISTS {}'.format(', '.join(
+                [_IDS_TABLE] + [
+                    _get_staging_table(record_type)
+                    for record_type in RECORD_TYPES
+                ]
+            )))
+
+    def add(self, line_num, record):
+        """Проверяет запись и добавляет ее в пачку.
+
+        Ссылки на другие объекты и повторы id проверяются при загрузке
+        пачки.
+
+        :param line_num: номер строки входного потока для сообщений
+            об ошибках.
+        :param record: запись.
+        """
+        if not isinstance(record, dict):
+            raise ImportDataError(line_num, 'record must be an object')
+        record_type = record.get('type')
+        if record_type not in TABLES:
+            raise ImportDataError(
+                line_num, 'unknown record type {!r}'.format(record_type)
+            )
+        legacy_id = record.get('id')
+        if not _is_legacy_id(legacy_id):
+            raise ImportDataError(line_num, 'id must be an integer')
+        values = {
+            column: self._convert(
+                line_num, record_type, column, record.get(column)
+            )
+            for column in self._columns[record_type] if column != 'id'
+        }
+        values['line_num'] = line_num
+        values['legacy_id'] = legacy_id
+        values['id'] = self._next_id(record_type)
+        if values['created_at'] is None:
+            values['created_at'] = datetime.utcnow()
+        self._buffers[record_type].write('\t'.join(
+            _format_value(values[column])
+            for column in self._staging_columns[record_type]
+        ))
+        self._buffers[record_type].write('\n')
+        self._pending[record_type] += 1
+        if sum(self._pending.values()) >= self._batch_size:
+            self.flush()
+
+    def _convert(self, line_num, record_type, column, value):
+        reference = REFERENCES[record_type].get(column)
+        if reference is not None:
+            target_type, nullable = reference
+            if value is None and nullable:
+                return None
+            if not _is_legacy_id(value):
+                raise ImportDataError(
+                    line_num,
+                    '{} refers to unknown {} {!r}'.format(
+                        column, target_type, value
+                    )
+                )
+            return value
+        if value is None:
+            return None
+        if column in _DATETIME_COLUMNS:
+            try:
+                return datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise ImportDataError(
+                    line_num, '{} must be an ISO datetime'.format(column)
+                ) from None
+        if not isinstance(value, str):
+            raise ImportDataError(
+                line_num, '{} must be a string'.format(column)
+            )
+        return value
+
+    def _next_id(self, record_type):
+        free_ids = self._free_ids[record_type]
+        if not free_ids:
+            with self._conn.cursor() as cur:
+                cur.execute(
+                    'SELECT nextval(pg_get_serial_sequence(%s, %s)) '
+                    'FROM generate_series(1, %s)',
+                    (TABLES[record_type].name, 'id', self._batch_size)
+                )
+                # Выдаем id с конца списка, поэтому разворачиваем его
+                free_ids.extend(
+                    new_id for new_id, in reversed(cur.fetchall())
+                )
+        return free_ids.pop()
+
+    def flush(self):
+        """Загружает накопленную пачку одной транзакцией."""
+        if not self._pending:
+            return
+        with self._conn.cursor() as cur:
+            cur.execute('BEGIN')
+            # В пачке выполняются только поиски по первичному ключу:
+            # проверки внешних ключей, триггер пути комментария и замена
+            # ссылок по import_ids. Пока таблица пуста или мала,
+            # планировщик выбирает для них seq scan, план кешируется,
+            # и загрузка замедляется квадратично
+            cur.execute('SET LOCAL enable_seqscan = off')
+            try:
+                for record_type in RECORD_TYPES:
+                    if self._pending[record_type]:
+                        self._load(cur, record_type)
+            except Exception:
+                cur.execute('ROLLBACK')
+                raise
+            cur.execute('COMMIT')
+        self.rows.update(self._pending)
+        self._pending.clear()
+        total = sum(self.rows.values())
+        logger.info(
+            'Imported %d rows, %.0f rows/s',
+            total, total / (monotonic() - self.started_at)
+        )
+
+    def _load(self, cur, record_type):
+        staging_table = _get_staging_table(record_type)
+        buffer = self._buffers[record_type]
+        buffer.seek(0)
+        cur.copy_expert(
+            'COPY {} ({}) FROM STDIN'.format(
+                staging_table,
+                ', '.join(self._staging_columns[record_type])
+            ),
+            buffer
+        )
+        self._buffers[record_type] = io.StringIO()
+        # Повтор id нарушает первичный ключ import_ids, строка с повтором
+        # ищется только в этом случае
+        cur.execute('SAVEPOINT import_ids')
+        try:
+            cur.execute(
+                'INSERT INTO {ids} (record_type, legacy_id, id, line_num) '
+                'SELECT %s, legacy_id, id, line_num FROM {staging}'.format(
+                    ids=_IDS_TABLE, staging=staging_table
+                ),
+                (record_type,)
+            )
+        except IntegrityError as exc:
+            if exc.pgcode != UNIQUE_VIOLATION:
+                raise
+            cur.execute('ROLLBACK TO SAVEPOINT import_ids')
+            self._check_duplicates(cur, record_type)
+            raise
+        cur.execute('RELEASE SAVEPOINT import_ids')
+        self._ids_count += self._pending[record_type]
+        # Временные таблицы не анализирует autovacuum. Без статистики
+        # планировщик не знает размеров пачки и import_ids и для замены
+        # ссылок хеширует всю import_ids вместо поиска по индексу.
+        # Оценку размера по статистике планировщик масштабирует
+        # по текущему размеру таблицы, поэтому import_ids достаточно
+        # анализировать при каждом удвоении
+        tables = [staging_table]
+        if self._ids_count >= 2 * self._ids_analyzed_count:
+            tables.append(_IDS_TABLE)
+            self._ids_analyzed_count = self._ids_count
+        cur.execute('ANALYZE {}'.format(', '.join(tables)))
+        for column in REFERENCES[record_type]:
+            self._check_reference(cur, record_type, column)
+        # Вставка в порядке входного потока: триггер пути видит
+        # родительские комментарии, вставленные этим же запросом раньше
+        select_columns = []
+        joins = []
+        params = []
+        for column in self._columns[record_type]:
+            reference = REFERENCES[record_type].get(column)
+            if reference is not None:
+                select_columns.append('{}_ids.id'.format(column))
+                joins.append(
+                    'LEFT JOIN {ids} AS {column}_ids '
+                    'ON {column}_ids.record_type = %s '
+                    'AND {column}_ids.legacy_id = s.{column}'.format(
+                        ids=_IDS_TABLE, column=column
+                    )
+                )
+                params.append(reference[0])
+            else:
+                select_columns.append('s.{}'.format(column))
+        cur.execute(
+            'INSERT INTO {table} ({columns}) SELECT {select_columns} '
+            'FROM {staging} AS s {joins} ORDER BY s.line_num'.format(
+                table=TABLES[record_type].name,
+                columns=', '.join(self._columns[record_type]),
+                select_columns=', '.join(select_columns),
+                staging=staging_table,
+                joins=' '.join(joins)
+            ),
+            params
+        )
+
+    def _check_duplicates(self, cur, record_type):
+        cur.execute(
+            'SELECT line_num, legacy_id FROM ('
+            'SELECT line_num, legacy_id, row_number() OVER ('
+            'PARTITION BY legacy_id ORDER BY line_num) AS num '
+            'FROM {staging}) AS s '
+            'WHERE num > 1 OR EXISTS ('
+            'SELECT 1 FROM {ids} WHERE record_type = %s '
+            'AND legacy_id = s.legacy_id) '
+            'ORDER BY line_num LIMIT 1'.format(
+                staging=_get_staging_table(record_type), ids=_IDS_TABLE
+            ),
+            (record_type,)
+        )
+        duplicate = cur.fetchone()
+        if duplicate is not None:
+            line_num, legacy_id = duplicate
+            raise ImportDataError(
+                line_num, 'duplicate {} id {}'.format(record_type, legacy_id)
+            )
+
+    def _check_reference(self, cur, record_type, column):
+        target_type, _ = REFERENCES[record_type][column]
+        # Ссылка на объект, который встретился в потоке позже записи,
+        # тоже считается ошибкой
+        cur.execute(
+            'SELECT s.line_num, s.{column} FROM {staging} AS s '
+            'LEFT JOIN {ids} AS ids ON ids.record_type = %s '
+            'AND ids.legacy_id = s.{column} AND ids.line_num < s.line_num '
+            'WHERE s.{column} IS NOT NULL AND ids.id IS NULL '
+            'ORDER BY s.line_num LIMIT 1'.format(
+                column=column, staging=_get_staging_table(record_type),
+                ids=_IDS_TABLE
+            ),
+            (target_type,)
+        )
+        unknown = cur.fetchone()
+        if unknown is not None:
+            line_num, legacy_id = unknown
+            raise ImportDataError(
+                line_num,
+                '{} refers to unknown {} {!r}'.format(
+                    column, target_type, legacy_id
+                )
+            )
+
+
+def import_ndjson(conn, lines, batch_size=DEFAULT_BATCH_SIZE):
+    """Импортирует записи из NDJSON.
+
+    Пачки, загруженные до ошибки во входных данных, остаются в БД.
+
+    :param conn: соединение psycopg2 в режиме autocommit.
+    :param lines: итерируемый объект со строками NDJSON.
+    :param batch_size: максимальное количество записей в пачке.
+    :return: количество загруженных записей по типам и затраченное время.
+    """
+    importer = DataImporter(conn, batch_size)
+    try:
+        for line_num, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                raise ImportDataError(line_num, str(exc)) from None
+            importer.add(line_num, record)
+        importer.flush()
+    finally:
+        importer.close()
+    return ImportResult(importer.rows, monotonic() - importer.started_at)
@@ -1,12 +1,16 @@
 from datetime import datetime
 
 from sqlalchemy import (
-    Column, ColumnDefault, DateTime, ForeignKey, Integer, MetaData, String,
-    Table
+    Column, ColumnDefault, DateTime, ForeignKey, Index, Integer, MetaData,
+    String, Table, func, text
 )
 
 meta = MetaData()
 
+# Конфигурация полнотекстового поиска. Форум многоязычный, поэтому
+# используется 'simple' - без стемминга и стоп-слов
+SEARCH_CONFIG = text("'simple'")
+
 
 # Раздел форума
 section = Table(
@@ -17,7 +21,10 @@ section = Table(
     Column('name', String),
     Column('description', String),
     Column('created_at', DateTime, default=ColumnDefault(datetime.utcnow)),
-    Column('updated_at', DateTime, onupdate=ColumnDefault(datetime.utcnow))
+    Column('updated_at', DateTime, onupdate=ColumnDefault(datetime.utcnow)),
+    
+    # Порядок пагинации
+    Index('ix_section_created_at_id', 'created_at', 'id')
 )
 
 
@@ -31,10 +38,17 @@ post = Table(
     Column('topic', String),
     Column('description', String),
     Column('created_at', DateTime, default=ColumnDefault(datetime.utcnow)),
-    Column('updated_at', DateTime, onupdate=ColumnDefault(datetime.utcnow))
+    Column('updated_at', DateTime, onupdate=ColumnDefault(datetime.utcnow)),
+    
+    Index('ix_post_section_id', 'section_id'),
+    # Порядок пагинации
+    Index('ix_post_created_at_id', 'created_at', 'id')
 )
 
 
+COMMENT_PATH_SEGMENT_WIDTH = 10
+
+
 # Комментарий к посту
 comment = Table(
     'comment',
@@ -45,5 +59,29 @@ comment = Table(
     Column('parent_id', ForeignKey('comment.id', ondelete='CASCADE')),
     Column('text', String),
     Column('created_at', DateTime, default=ColumnDefault(datetime.utcnow)),
-    Column('updated_at', DateTime, onupdate=ColumnDefault(datetime.utcnow))
+    Column('updated_at', DateTime, onupdate=ColumnDefault(datetime.utcnow)),
+    # Материализованный путь от корня ветки: id предков и самого
+    # комментария, дополненные нулями до COMMENT_PATH_SEGMENT_WIDTH знаков
+    # и разделенные точкой. Заполняется триггером comment_set_path при
+    # вставке. Побайтовое сравнение (collation "C") дает порядок обхода
+    # дерева в глубину
+    Column('path', String(collation='C')),
+    
+    Index('ix_comment_post_id_path', 'post_id', 'path'),
+    Index('ix_comment_parent_id', 'parent_id')
 )
+
+
+# Выражения полнотекстового поиска используются и в индексах, и в запросах:
+# планировщик применяет GIN-индекс только при точном совпадении выражения
+section_search_vector = func.to_tsvector(
+    SEARCH_CONFIG, func.coalesce(section.c.name, '')
+)
+post_search_vector = func.to_tsvector(
+    SEARCH_CONFIG,
+    func.coalesce(post.c.topic, '') + ' ' +
+    func.coalesce(post.c.description, '')
+)
+
+Index('ix_section_search', section_search_vector, postgresql_using='gin')
+Index('ix_post_search', post_search_vector, postgresql_using='gin')
@@ -1,17 +1,43 @@
 from collections import namedtuple
+from datetime import datetime
 from functools import partial
-from typing import NewType, Optional
+from types import SimpleNamespace
+from typing import AsyncIterator, Iterable, List, NewType, Optional, Set, Tuple
 
 from aiopg.sa import SAConnection
 from aiopg.sa.result import RowProxy
 from sqlalchemy import (
-    Table, alias, delete, desc, exists, func, insert, select, update
+    BigInteger, DateTime, Integer, Table, Text, alias, and_, bindparam, cast,
+    column, delete, desc, exists, func, insert, literal, literal_column, null,
+    select, table, true, tuple_, union_all, update
 )
+from sqlalchemy.dialects.postgresql import REGCLASS, aggregate_order_by
 
-from .models import comment, post, section
+from .models import (
+    COMMENT_PATH_SEGMENT_WIDTH, SEARCH_CONFIG, comment, post,
+    post_search_vector, section, section_search_vector
+)
+from .utils import compile_query, prepared_query
 
 DEFAULT_PAGE_NUM = 1
 DEFAULT_PER_PAGE = 25
+MAX_PER_PAGE = 100
+# Количество комментариев в ответе с веткой комментариев
+DEFAULT_COMMENTS_LIMIT = 200
+MAX_COMMENTS_LIMIT = 1000
+
+# Способы подсчета общего количества элементов страницы пагинации
+TOTAL_EXACT = 'exact'
+TOTAL_APPROXIMATE = 'approximate'
+TOTAL_NONE = 'none'
+TOTAL_MODES = (TOTAL_EXACT, TOTAL_APPROXIMATE, TOTAL_NONE)
+
+# Системный каталог со статистикой таблиц, см. _estimate_query
+pg_class = table('pg_class', column('oid'), column('reltuples'))
+
+# Количество строк, читаемых из серверного курсора выгрузки за раз
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_CURSOR_NAME = 'section_export'
 
 
 SectionRow = NewType('SectionRow', RowProxy)
@@ -19,7 +45,21 @@ PostRow = NewType('PostRow', RowProxy)
 CommentRow = NewType('CommentRow', RowProxy)
 
 
-Page = namedtuple('Page', ('items', 'page_num', 'per_page', 'total'))
+Page = namedtuple(
+    'Page', ('items', 'page_num', 'per_page', 'total', 'next')
+)
+
+# Ключ сортировки (created_at, id) для курсорной пагинации
+PageCursor = Tuple[datetime, int]
+
+# Пустой JSON-массив для агрегатов без строк
+_EMPTY_JSON_ARRAY = literal_column("'[]'::json")
+
+# Колонки полнотекстового поиска по таблицам
+SEARCH_VECTORS = {
+    section: section_search_vector,
+    post: post_search_vector,
+}
 
 
 SectionsPage = NewType('SectionsPage', Page)
@@ -27,7 +67,7 @@ PostsPage = NewType('PostsPage', Page)
 
 
 async def is_exist(model: Table, conn: SAConnection, obj_id: int) -> bool:
-    return await conn.scalar(select([exists().where(model.c.id == obj_id)]))
+    return await _is_exist_query(model).scalar(conn, obj_id=obj_id)
 
 
 is_section_exist = partial(is_exist, section)
@@ -35,8 +75,30 @@ is_post_exist = partial(is_exist, post)
 is_comment_exist = partial(is_exist, comment)
 
 
-async def delete_obj(model: Table, conn: SAConnection, obj_id: int) -> None:
-    return await conn.execute(delete(model).where(model.c.id == obj_id))
+async def get_existing_ids(
+    model: Table, conn: SAConnection, obj_ids: Iterable[int]
+) -> Set[int]:
+    """Возвращает те id из переданных, объекты с которыми существуют."""
+    cur = await conn.execute(
+        select([model.c.id]).where(model.c.id.in_(set(obj_ids)))
+    )
+    return {row.id for row in await cur.fetchall()}
+
+
+get_existing_section_ids = partial(get_existing_ids, section)
+get_existing_post_ids = partial(get_existing_ids, post)
+get_existing_comment_ids = partial(get_existing_ids, comment)
+
+
+async def delete_obj(
+    model: Table, conn: SAConnection, obj_id: int
+) -> Optional[RowProxy]:
+    """Удаляет объект и возвращает удаленную строку.
+    Если объекта не существует - возвращает None."""
+    cur = await conn.execute(
+        delete(model).where(model.c.id == obj_id).returning(model)
+    )
+    return await cur.fetchone()
 
 
 delete_section = partial(delete_obj, section)
@@ -52,20 +114,21 @@ async def create_section(
     :param conn: коннект к БД.
     :param name: название раздела.
     :param description: описание раздела."""
-    section_id = await conn.scalar(
+    cur = await conn.execute(
         insert(section).values({
             'name': name,
             'description': description
-        })
+        }).returning(section)
     )
-    return await get_section(conn, section_id)
+    return await cur.fetchone()
 
 
 async def update_section(
     conn: SAConnection, section_id: int, name: Optional[str] = None,
     description: Optional[str] = None
-) -> SectionRow:
+) -> Optional[SectionRow]:
     """Обновление информации о разделе форума.
+    Если раздела не существует - возвращает None
     
     :param conn: коннект к БД.
     :param section_id: id раздела.
@@ -76,13 +139,14 @@ async def update_section(
         for_update['name'] = name
     if description is not None:
         for_update['description'] = description
-    if for_update:
-        await conn.execute(
-            update(section).where(
-                section.c.id == section_id
-            ).values(for_update)
-        )
-    return await get_section(conn, section_id)
+    if not for_update:
+        return await get_section(conn, section_id)
+    cur = await conn.execute(
+        update(section).where(
+            section.c.id == section_id
+        ).values(for_update).returning(section)
+    )
+    return await cur.fetchone()
     
 
 async def get_section(
@@ -93,27 +157,34 @@ async def get_section(
     
     :param conn: коннект к БД.
     :param section_id: id раздела."""
-    cur = await conn.execute(
-        select([section]).where(section.c.id == section_id)
-    )
+    cur = await _get_obj_query(section).execute(conn, obj_id=section_id)
     return await cur.fetchone()
 
 
 async def find_sections(
     conn: SAConnection, name__like: Optional[str] = None,
-    page_num: int = DEFAULT_PAGE_NUM, per_page: int = DEFAULT_PER_PAGE
+    page_num: int = DEFAULT_PAGE_NUM, per_page: int = DEFAULT_PER_PAGE,
+    after: Optional[PageCursor] = None, total: str = TOTAL_APPROXIMATE,
+    search: Optional[str] = None
 ) -> SectionsPage:
     """Возвращает страницу пагинации, содержащую разделы форума.
     
     :param conn: коннект к БД.
     :param name__like: шаблон для поиска разделов по названию.
     :param page_num: номер страницы.
-    :param per_page: количество элементов на странице."""
-    query = select([section])
-    if name__like is not None:
-        query = query.where(section.c.name.ilike(name__like))
+    :param per_page: количество элементов на странице.
+    :param after: курсор (created_at, id) последнего элемента предыдущей
+    страницы. Если передан - page_num игнорируется.
+    :param total: способ подсчета общего количества элементов
+    (exact, approximate или none). По умолчанию - оценка по статистике
+    таблицы (при фильтрах и поиске не подсчитывается), точный подсчет
+    проходит по всей выборке.
+    :param search: строка полнотекстового поиска. Если передана - элементы
+    сортируются по релевантности и курсор следующей страницы не
+    возвращается."""
     return await _paginate_query(
-        conn, query, page_num=page_num, per_page=per_page
+        conn, section, 'name', name__like, page_num=page_num,
+        per_page=per_page, after=after, total=total, search=search
     )
 
 
@@ -126,21 +197,44 @@ async def create_post(
     :param section_id: id раздела.
     :param topic: тема поста.
     :param description: описание поста."""
-    post_id = await conn.scalar(
+    cur = await conn.execute(
         insert(post).values({
             'section_id': section_id,
             'topic': topic,
             'description': description
-        })
+        }).returning(post)
+    )
+    return await cur.fetchone()
+
+
+async def create_posts(
+    conn: SAConnection, posts: List[dict]
+) -> List[PostRow]:
+    """Создание нескольких постов одним запросом.
+    Посты возвращаются в порядке передачи.
+    
+    :param conn: коннект к БД.
+    :param posts: список словарей с ключами section_id, topic
+    и description."""
+    cur = await conn.execute(
+        insert(post).values([
+            {
+                'section_id': _post['section_id'],
+                'topic': _post['topic'],
+                'description': _post['description']
+            }
+            for _post in posts
+        ]).returning(post)
     )
-    return await get_post(conn, post_id)
+    return await cur.fetchall()
 
 
 async def update_post(
     conn: SAConnection, post_id: int, topic: Optional[str] = None,
     description: Optional[str] = None
-) -> PostRow:
+) -> Optional[PostRow]:
     """Обновление информации о посте.
+    Если поста не существует - возвращает None
     
     :param conn: коннект к БД.
     :param post_id: id поста.
@@ -151,13 +245,14 @@ async def update_post(
         for_update['topic'] = topic
     if description is not None:
         for_update['description'] = description
-    if for_update:
-        await conn.execute(
-            update(post).where(
-                post.c.id == post_id
-            ).values(for_update)
-        )
-    return await get_post(conn, post_id)
+    if not for_update:
+        return await get_post(conn, post_id)
+    cur = await conn.execute(
+        update(post).where(
+            post.c.id == post_id
+        ).values(for_update).returning(post)
+    )
+    return await cur.fetchone()
 
 
 async def get_post(conn: SAConnection, post_id: int) -> Optional[PostRow]:
@@ -166,25 +261,49 @@ async def get_post(conn: SAConnection, post_id: int) -> Optional[PostRow]:
     
     :param conn: коннект к БД.
     :param post_id: id поста."""
-    cur = await conn.execute(select([post]).where(post.c.id == post_id))
+    cur = await _get_obj_query(post).execute(conn, obj_id=post_id)
+    return await cur.fetchone()
+
+
+async def get_post_version(
+    conn: SAConnection, post_id: int
+) -> Optional[RowProxy]:
+    """Возвращает версию поста вместе с комментариями, не читая их самих:
+    created_at и updated_at поста, количество комментариев и время
+    последнего изменения комментария (comments_modified_at).
+    Любое создание, изменение или удаление комментария меняет версию.
+    Если поста не существует - возвращает None.
+    
+    :param conn: коннект к БД.
+    :param post_id: id поста."""
+    cur = await _post_version_query().execute(conn, post_id=post_id)
     return await cur.fetchone()
 
 
 async def find_posts(
-    conn: SAConnection, topic__like: Optional[str],
-    page_num: int = DEFAULT_PAGE_NUM, per_page: int = DEFAULT_PER_PAGE
+    conn: SAConnection, topic__like: Optional[str] = None,
+    page_num: int = DEFAULT_PAGE_NUM, per_page: int = DEFAULT_PER_PAGE,
+    after: Optional[PageCursor] = None, total: str = TOTAL_APPROXIMATE,
+    search: Optional[str] = None
 ) -> PostsPage:
     """Возвращает страницу пагинации, содержащую посты.
 
     :param conn: коннект к БД.
     :param topic__like: шаблон для поиска разделов по названию.
     :param page_num: номер страницы.
-    :param per_page: количество элементов на странице."""
-    query = select([post])
-    if topic__like is not None:
-        query = query.where(post.c.topic.ilike(topic__like))
+    :param per_page: количество элементов на странице.
+    :param after: курсор (created_at, id) последнего элемента предыдущей
+    страницы. Если передан - page_num игнорируется.
+    :param total: способ подсчета общего количества элементов
+    (exact, approximate или none). По умолчанию - оценка по статистике
+    таблицы (при фильтрах и поиске не подсчитывается), точный подсчет
+    проходит по всей выборке.
+    :param search: строка полнотекстового поиска. Если передана - элементы
+    сортируются по релевантности и курсор следующей страницы не
+    возвращается."""
     return await _paginate_query(
-        conn, query, page_num=page_num, per_page=per_page
+        conn, post, 'topic', topic__like, page_num=page_num,
+        per_page=per_page, after=after, total=total, search=search
     )
 
 
@@ -199,32 +318,55 @@ async def create_comment(
     :param text: текст комментария.
     :param parent_id: id родительского комментария
     (в случае цепочки комментариев)"""
-    comment_id = await conn.scalar(
+    cur = await conn.execute(
         comment.insert().values({
             'post_id': post_id,
             'text': text,
             'parent_id': parent_id,
             
-        })
+        }).returning(comment)
     )
-    return await get_comment(conn, comment_id)
+    return await cur.fetchone()
+
+
+async def create_comments(
+    conn: SAConnection, comments: List[dict]
+) -> List[CommentRow]:
+    """Создание нескольких комментариев одним запросом.
+    Комментарии возвращаются в порядке передачи.
+    
+    :param conn: коннект к БД.
+    :param comments: список словарей с ключами post_id, text
+    и parent_id (необязательный)."""
+    cur = await conn.execute(
+        insert(comment).values([
+            {
+                'post_id': _comment['post_id'],
+                'text': _comment['text'],
+                'parent_id': _comment.get('parent_id')
+            }
+            for _comment in comments
+        ]).returning(comment)
+    )
+    return await cur.fetchall()
 
 
 async def update_comment(
     conn: SAConnection, comment_id: int, text: str
-) -> CommentRow:
+) -> Optional[CommentRow]:
     """Обноовляет текст комментария к посту.
+    Если комментария не существует - возвращает None.
     
     :param conn: коннект к БД.
     :param comment_id: id комментария.
     :param text: новый текст комментария.
     """
-    await conn.execute(
+    cur = await conn.execute(
         update(comment).where(comment.c.id == comment_id).values({
             'text': text
-        })
+        }).returning(comment)
     )
-    return await get_comment(conn, comment_id)
+    return await cur.fetchone()
     
     
 async def get_comment(
@@ -235,44 +377,461 @@ async def get_comment(
     
     :param conn: коннект к БД.
     :param comment_id: id комментария."""
-    cur = await conn.execute(
-        select([comment]).where(comment.c.id == comment_id)
-    )
+    cur = await _get_obj_query(comment).execute(conn, obj_id=comment_id)
     return await cur.fetchone()
 
 
-async def get_post_comments(conn: SAConnection, post_id: int):
-    """Возвращает все комментарии к посту.
+async def get_post_comments(
+    conn: SAConnection, post_id: int, max_depth: Optional[int] = None,
+    limit: Optional[int] = None
+) -> List[SimpleNamespace]:
+    """Возвращает комментарии к посту в порядке обхода дерева
+    комментариев в глубину.
     
     :param conn: коннект к БД.
     :param post_id: id поста.
+    :param max_depth: максимальная глубина комментариев (1 - только
+    комментарии верхнего уровня).
+    :param limit: максимальное количество комментариев.
     """
-    children = alias(comment, 'children')
-    cur = await conn.execute(
-        select([
-            comment,
-            func.array_remove(
-                func.array_agg(children.c.id), None
-            ).label('children')
-        ]).select_from(
-            comment.join(
-                children, comment.c.id == children.c.parent_id, isouter=True
+    query = _post_comments_query(max_depth is not None, limit is not None)
+    cur = await query.execute(
+        conn, post_id=post_id, limit=limit,
+        path_length=None if max_depth is None else _path_length(max_depth)
+    )
+    return _build_comment_tree(await cur.fetchall())
+
+
+async def get_post_json(
+    conn: SAConnection, post_id: int, max_depth: Optional[int] = None,
+    limit: Optional[int] = None
+) -> Optional[str]:
+    """Возвращает пост вместе с комментариями в виде JSON-документа
+    в формате PostSchema. Документ собирается в БД одним запросом.
+    Если поста не существует - возвращает None.
+    
+    :param conn: коннект к БД.
+    :param post_id: id поста.
+    :param max_depth: максимальная глубина комментариев (1 - только
+    комментарии верхнего уровня).
+    :param limit: максимальное количество комментариев.
+    """
+    query = _post_json_query(max_depth is not None, limit is not None)
+    return await query.scalar(
+        conn, post_id=post_id, limit=limit,
+        path_length=None if max_depth is None else _path_length(max_depth)
+    )
+
+
+async def get_comment_subtree(
+    conn: SAConnection, comment_id: int, max_depth: Optional[int] = None,
+    limit: Optional[int] = None
+) -> List[SimpleNamespace]:
+    """Возвращает комментарий и ответы на него в порядке обхода дерева
+    в глубину. Если комментария не существует - возвращает пустой список.
+    
+    :param conn: коннект к БД.
+    :param comment_id: id комментария.
+    :param max_depth: максимальная глубина ответов относительно
+    комментария (0 - только сам комментарий).
+    :param limit: максимальное количество комментариев.
+    """
+    query = _comment_subtree_query(max_depth is not None, limit is not None)
+    cur = await query.execute(
+        conn, comment_id=comment_id, limit=limit,
+        depth_length=(
+            None if max_depth is None
+            else max_depth * (COMMENT_PATH_SEGMENT_WIDTH + 1)
+        )
+    )
+    return _build_comment_tree(await cur.fetchall())
+
+
+async def iter_section_export(
+    conn: SAConnection, section_id: int,
+    chunk_size: int = EXPORT_CHUNK_SIZE
+) -> AsyncIterator[List[RowProxy]]:
+    """Читает посты раздела вместе с комментариями через серверный курсор.
+    
+    Каждый пост идет перед своими комментариями, комментарии - в порядке
+    обхода дерева в глубину. Колонка type содержит 'post' или 'comment'.
+    Курсор существует до конца транзакции, поэтому функцию нужно вызывать
+    внутри conn.begin().
+    
+    :param conn: коннект к БД.
+    :param section_id: id раздела.
+    :param chunk_size: количество строк, читаемых из курсора за раз.
+    :return: асинхронный итератор по пачкам строк.
+    """
+    query, params = compile_query(_section_export_query(section_id))
+    await conn.execute(
+        'DECLARE {} NO SCROLL CURSOR FOR {}'.format(EXPORT_CURSOR_NAME, query),
+        params
+    )
+    fetch = 'FETCH FORWARD {:d} FROM {}'.format(
+        chunk_size, EXPORT_CURSOR_NAME
+    )
+    while True:
+        result = await conn.execute(fetch)
+        rows = await result.fetchall()
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            break
+    await conn.execute('CLOSE {}'.format(EXPORT_CURSOR_NAME))
+
+
+def _section_export_query(section_id):
+    posts = select([
+        literal('post').label('type'),
+        post.c.id,
+        post.c.section_id,
+        null().label('post_id'),
+        null().label('parent_id'),
+        post.c.topic,
+        post.c.description,
+        null().label('text'),
+        post.c.created_at,
+        post.c.updated_at,
+        post.c.id.label('sort_post_id'),
+        literal('').label('sort_path')
+    ]).where(post.c.section_id == section_id)
+    comments = select([
+        literal('comment').label('type'),
+        comment.c.id,
+        null().label('section_id'),
+        comment.c.post_id,
+        comment.c.parent_id,
+        null().label('topic'),
+        null().label('description'),
+        comment.c.text,
+        comment.c.created_at,
+        comment.c.updated_at,
+        comment.c.post_id.label('sort_post_id'),
+        comment.c.path.label('sort_path')
+    ]).select_from(
+        comment.join(post, post.c.id == comment.c.post_id)
+    ).where(post.c.section_id == section_id)
+    return union_all(posts, comments).order_by('sort_post_id', 'sort_path')
+
+
+# Запросы ниже строятся и компилируются один раз для каждой формы,
+# значения параметров подставляются при выполнении, см. prepared_query
+
+
+@prepared_query
+def _is_exist_query(model):
+    return select([exists().where(model.c.id == bindparam('obj_id'))])
+
+
+@prepared_query
+def _get_obj_query(model):
+    return select([model]).where(model.c.id == bindparam('obj_id'))
+
+
+@prepared_query
+def _post_version_query():
+    comments = select([
+        func.count().label('comments_count'),
+        func.max(
+            func.greatest(comment.c.created_at, comment.c.updated_at)
+        ).label('comments_modified_at')
+    ]).where(comment.c.post_id == post.c.id).lateral('comments')
+    return select([
+        post.c.created_at, post.c.updated_at, comments.c.comments_count,
+        comments.c.comments_modified_at
+    ]).select_from(post.join(comments, true())).where(
+        post.c.id == bindparam('post_id')
+    )
+
+
+@prepared_query
+def _post_comments_query(with_max_depth, with_limit):
+    query = select([comment]).where(comment.c.post_id == bindparam('post_id'))
+    if with_max_depth:
+        query = query.where(
+            func.char_length(comment.c.path) <=
+            bindparam('path_length', type_=Integer)
+        )
+    return _comment_tree_query(query, with_max_depth or with_limit, with_limit)
+
+
+@prepared_query
+def _comment_subtree_query(with_max_depth, with_limit):
+    root = alias(comment, 'root')
+    # Пути всех ответов начинаются с пути корня, за которым следует
+    # точка, поэтому поддерево - это диапазон [path, path || '/')
+    query = select([comment]).select_from(
+        comment.join(
+            root, and_(
+                comment.c.post_id == root.c.post_id,
+                comment.c.path >= root.c.path,
+                comment.c.path < root.c.path + '/'
             )
-        ).where(
-            comment.c.post_id == post_id
-        ).group_by(comment.c.id)
+        )
+    ).where(root.c.id == bindparam('comment_id'))
+    if with_max_depth:
+        query = query.where(
+            func.char_length(comment.c.path) <=
+            func.char_length(root.c.path) +
+            bindparam('depth_length', type_=Integer)
+        )
+    return _comment_tree_query(query, with_max_depth or with_limit, with_limit)
+
+
+@prepared_query
+def _post_json_query(with_max_depth, with_limit):
+    # Те же комментарии, что возвращает get_post_comments, поля children,
+    # replies_count и has_more_replies считаются так же, как
+    # в _build_comment_tree
+    comments = _post_comments_query.build(with_max_depth, with_limit).cte(
+        'comments'
     )
-    return await cur.fetchall()
+    children = select([
+        comments.c.parent_id,
+        func.json_agg(
+            aggregate_order_by(comments.c.id, comments.c.path)
+        ).label('ids'),
+        func.count().label('count')
+    ]).group_by(comments.c.parent_id).alias('children')
+    children_count = func.coalesce(children.c.count, literal_column('0'))
+    if with_max_depth or with_limit:
+        replies_count = comments.c.replies_count
+    else:
+        replies_count = children_count
+    comment_json = _json_object(
+        ('id', comments.c.id),
+        ('post_id', comments.c.post_id),
+        ('parent_id', comments.c.parent_id),
+        ('text', comments.c.text),
+        ('children', func.coalesce(children.c.ids, _EMPTY_JSON_ARRAY)),
+        ('replies_count', replies_count),
+        ('has_more_replies', replies_count > children_count)
+    )
+    comments_json = select([
+        func.coalesce(
+            func.json_agg(aggregate_order_by(comment_json, comments.c.path)),
+            _EMPTY_JSON_ARRAY
+        )
+    ]).select_from(
+        comments.outerjoin(children, children.c.parent_id == comments.c.id)
+    )
+    # Документ возвращается строкой: psycopg2 иначе разобрал бы его
+    # в объекты Python
+    return select([
+        cast(_json_object(
+            ('id', post.c.id),
+            ('section_id', post.c.section_id),
+            ('topic', post.c.topic),
+            ('description', post.c.description),
+            ('comments', comments_json.as_scalar())
+        ), Text)
+    ]).where(post.c.id == bindparam('post_id'))
+
+
+def _json_object(*fields):
+    """json_build_object по парам (ключ, выражение).
+    Ключи встраиваются в SQL литералами: тип параметров функции с
+    переменным числом аргументов БД вывести не может."""
+    args = []
+    for key, value in fields:
+        args.extend((literal_column("'{}'".format(key)), value))
+    return func.json_build_object(*args)
+
+
+def _comment_tree_query(query, with_replies_count, with_limit):
+    if with_replies_count:
+        # Выборка может оказаться неполной - считаем ответы на каждый
+        # комментарий, чтобы клиент мог догрузить недостающие
+        replies = alias(comment, 'replies')
+        query = query.column(
+            select([func.count()]).where(
+                replies.c.parent_id == comment.c.id
+            ).label('replies_count')
+        )
+    query = query.order_by(comment.c.path)
+    if with_limit:
+        query = query.limit(bindparam('limit', type_=Integer))
+    return query
+
+
+def _build_comment_tree(rows) -> List[SimpleNamespace]:
+    """Дополняет комментарии списками id дочерних комментариев
+    и признаком наличия ответов, не попавших в выборку.
+    
+    :param rows: комментарии в порядке обхода дерева."""
+    comments = [SimpleNamespace(**row, children=[]) for row in rows]
+    by_id = {_comment.id: _comment for _comment in comments}
+    for _comment in comments:
+        parent = by_id.get(_comment.parent_id)
+        if parent is not None:
+            parent.children.append(_comment.id)
+    for _comment in comments:
+        if not hasattr(_comment, 'replies_count'):
+            _comment.replies_count = len(_comment.children)
+        _comment.has_more_replies = (
+            _comment.replies_count > len(_comment.children)
+        )
+    return comments
+
+
+def _path_length(depth: int) -> int:
+    """Длина материализованного пути комментария на глубине depth.
+    Глубина отсчитывается от поста: 1 - комментарии верхнего уровня."""
+    return depth * (COMMENT_PATH_SEGMENT_WIDTH + 1) - 1
+    
+
+def _search(query, model, search_vector, search):
+    """Добавляет к запросу условие полнотекстового поиска.
+    Возвращает запрос и сортировку по релевантности."""
+    ts_query = func.plainto_tsquery(SEARCH_CONFIG, search)
+    query = query.where(search_vector.op('@@')(ts_query))
+    rank = func.ts_rank(search_vector, ts_query)
+    return query, (desc(rank), model.c.id)
+
+
+def _filter_query(model, like_column, with_search):
+    """Строит выборку страницы пагинации без сортировки и ограничений.
+    Возвращает запрос и сортировку (None - по ключу курсора).
     
+    :param model: таблица.
+    :param like_column: колонка для фильтра по шаблону (параметр like)
+    или None.
+    :param with_search: есть ли условие полнотекстового поиска
+    (параметр search)."""
+    query = select([model])
+    if like_column is not None:
+        query = query.where(model.c[like_column].ilike(bindparam('like')))
+    order_by = None
+    if with_search:
+        query, order_by = _search(
+            query, model, SEARCH_VECTORS[model], bindparam('search')
+        )
+    return query, order_by
+
+
+@prepared_query
+def _count_query(model, like_column, with_search):
+    query, _ = _filter_query(model, like_column, with_search)
+    return select([func.count()]).select_from(alias(query, 'query'))
+
+
+@prepared_query
+def _estimate_query(model):
+    """Строит запрос оценки количества строк таблицы по статистике
+    pg_class.reltuples: одно чтение каталога вместо прохода по таблице.
+    Для таблицы, которую еще не анализировали, оценка -1.
+
+    :param model: таблица."""
+    return select([cast(pg_class.c.reltuples, BigInteger)]).where(
+        pg_class.c.oid == cast(literal(model.name), REGCLASS)
+    )
+
+
+@prepared_query
+def _page_query(
+    model, like_column, with_search, with_after, with_offset, total
+):
+    query, order_by = _filter_query(model, like_column, with_search)
+    sort_key = (model.c.created_at, model.c.id)
+    page_query = query
+    if with_after:
+        # Курсорный режим: продолжаем с ключа сортировки последнего
+        # элемента предыдущей страницы, поэтому стоимость запроса
+        # не зависит от глубины листания
+        page_query = page_query.where(
+            tuple_(*sort_key) > tuple_(
+                bindparam('after_created_at', type_=DateTime),
+                bindparam('after_id', type_=Integer)
+            )
+        )
+    elif with_offset:
+        page_query = page_query.offset(bindparam('offset', type_=Integer))
+    # Общее количество считается подзапросом в том же запросе,
+    # что и сама страница - один round trip вместо двух
+    if total == TOTAL_EXACT:
+        count_query = select([func.count()]).select_from(
+            alias(query, 'query')
+        )
+        page_query = page_query.column(count_query.label('total'))
+    elif total == TOTAL_APPROXIMATE:
+        page_query = page_query.column(
+            _estimate_query.build(model).label('total')
+        )
+    return page_query.order_by(*(order_by or sort_key)).limit(
+        bindparam('limit', type_=Integer)
+    )
+
 
 async def _paginate_query(
-    conn, query, page_num=DEFAULT_PAGE_NUM, per_page=DEFAULT_PER_PAGE
+    conn, model, like_column, like=None, page_num=DEFAULT_PAGE_NUM,
+    per_page=DEFAULT_PER_PAGE, after=None, total=TOTAL_APPROXIMATE,
+    search=None
 ) -> Page:
-    total = await conn.scalar(
-        select([func.count('id')]).select_from(alias(query, 'query'))
-    )
-    if page_num != DEFAULT_PAGE_NUM:
-        query = query.offset(page_num)
-    cur = await conn.execute(query.limit(per_page))
+    # Форма запроса зависит только от наличия фильтров, поэтому
+    # запросы берутся из кеша скомпилированных, см. prepared_query
+    if like is None:
+        like_column = None
+    # Курсор строится только по ключу сортировки (created_at, id),
+    # при сортировке по релевантности доступна только постраничная
+    # навигация
+    keyset = search is None
+    with_after = after is not None and keyset
+    with_offset = not with_after and page_num != DEFAULT_PAGE_NUM
+    if with_after:
+        page_num = None
+    # Статистика таблицы ничего не говорит о размере отфильтрованной
+    # выборки, а оценка планировщика для ILIKE и полнотекстового поиска -
+    # обобщенная константа, поэтому с фильтрами оценка не возвращается
+    if total == TOTAL_APPROXIMATE and (
+        like_column is not None or search is not None
+    ):
+        total = TOTAL_NONE
+    params = {'like': like, 'search': search}
+    if with_after:
+        params['after_created_at'], params['after_id'] = after
+    if with_offset:
+        params['offset'] = (page_num - 1) * per_page
+    # Выбираем на один элемент больше, чтобы понять, есть ли следующая
+    # страница
+    cur = await _page_query(
+        model, like_column, not keyset, with_after, with_offset, total
+    ).execute(conn, limit=per_page + 1, **params)
     items = await cur.fetchall()
-    return Page(items, page_num, per_page, total)
+    has_next = len(items) > per_page
+    next_cursor = None
+    if has_next:
+        items = items[:per_page]
+        if keyset:
+            next_cursor = (items[-1].created_at, items[-1].id)
+    if total == TOTAL_EXACT:
+        if items:
+            total_count = items[0].total
+        elif after is None and page_num == DEFAULT_PAGE_NUM:
+            total_count = 0
+        else:
+            # Страница за пределами выборки - подсчитать в запросе
+            # страницы было не по чему
+            total_count = await _count_query(
+                model, like_column, not keyset
+            ).scalar(conn, **params)
+    elif total == TOTAL_APPROXIMATE:
+        offset = params.get('offset', 0)
+        if not (with_after or has_next) and (items or not with_offset):
+            # Последняя страница постраничной навигации - количество
+            # известно точно
+            total_count = offset + len(items)
+        else:
+            if items:
+                estimate = items[0].total
+            else:
+                # Страница за пределами выборки - оценки в запросе
+                # страницы нет
+                estimate = await _estimate_query(model).scalar(conn)
+            # Оценка не может быть меньше количества уже увиденных
+            # элементов, в том числе у неанализированной таблицы (-1)
+            seen = offset + len(items) + has_next if items else 0
+            total_count = max(estimate, seen)
+    else:
+        total_count = None
+    return Page(items, page_num, per_page, total_count, next_cursor)
@@ -1,35 +1,207 @@
 import asyncio
-from time import sleep
+from functools import lru_cache
+from time import monotonic, sleep
 
 from aiopg.sa import create_engine as _create_async_engine
+from psycopg2 import IntegrityError
 from psycopg2 import OperationalError as AiopgOperationalError
+from psycopg2.errorcodes import FOREIGN_KEY_VIOLATION
 from sqlalchemy import create_engine as _create_blocking_engine
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
 from sqlalchemy.exc import OperationalError as AlchemyOperationalError
 
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
 BASE_TIMEOUT = 0.01
 MAX_RECONNECTS = 10
 
+# Драйверы БД
+BACKEND_AIOPG = 'aiopg'
+BACKEND_ASYNCPG = 'asyncpg'
+BACKENDS = (BACKEND_AIOPG, BACKEND_ASYNCPG)
+
+# Диалект с тем же paramstyle, что использует aiopg
+_dialect = PGDialect_psycopg2()
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось дождаться свободного соединения из пула."""
+
+
+class InstrumentedEngine:
+    """Обертка над движком aiopg с таймаутом ожидания соединения
+    и счетчиками пула.
+    
+    :param engine: движок aiopg.
+    :param acquire_timeout: максимальное время ожидания свободного
+    соединения в секундах, None - без ограничения.
+    """
+    
+    def __init__(self, engine, acquire_timeout=None):
+        self._engine = engine
+        self._acquire_timeout = acquire_timeout
+        # Количество корутин, ожидающих соединение
+        self.waiters = 0
+        self.acquired = 0
+        self.acquire_timeouts = 0
+        self.acquire_wait_total = 0.0
+        self.acquire_wait_max = 0.0
+    
+    @property
+    def minsize(self):
+        return self._engine.minsize
+    
+    @property
+    def maxsize(self):
+        return self._engine.maxsize
+    
+    @property
+    def size(self):
+        return self._engine.size
+    
+    @property
+    def freesize(self):
+        return self._engine.freesize
+    
+    def acquire(self):
+        return _AcquireContextManager(self._acquire())
+    
+    async def _acquire(self):
+        self.waiters += 1
+        started_at = monotonic()
+        # Не asyncio.wait_for: в Python 3.7 соединение, полученное
+        # одновременно с истечением таймаута, теряется, и пул постепенно
+        # исчерпывается (bpo-37658)
+        acquiring = asyncio.ensure_future(self._engine.acquire())
+        try:
+            await asyncio.wait((acquiring,), timeout=self._acquire_timeout)
+        except asyncio.CancelledError:
+            self._abandon(acquiring)
+            raise
+        finally:
+            self.waiters -= 1
+            wait_time = monotonic() - started_at
+            self.acquire_wait_total += wait_time
+            self.acquire_wait_max = max(self.acquire_wait_max, wait_time)
+        if not acquiring.done():
+            self._abandon(acquiring)
+            self.acquire_timeouts += 1
+            raise PoolTimeoutError(
+                'No free connection in {} s'.format(self._acquire_timeout)
+            )
+        conn = acquiring.result()
+        self.acquired += 1
+        return conn
+    
+    def _abandon(self, acquiring):
+        """Отменяет ожидание соединения. Если соединение все же получено,
+        возвращает его в пул."""
+        acquiring.cancel()
+        acquiring.add_done_callback(_release_abandoned)
+    
+    def release(self, conn):
+        return self._engine.release(conn)
+    
+    def close(self):
+        self._engine.close()
+    
+    async def wait_closed(self):
+        await self._engine.wait_closed()
+    
+    def stats(self):
+        """Возвращает текущее состояние пула и счетчики ожидания."""
+        return {
+            'minsize': self.minsize,
+            'maxsize': self.maxsize,
+            'size': self.size,
+            'free': self.freesize,
+            'waiters': self.waiters,
+            'acquired': self.acquired,
+            'acquire_timeouts': self.acquire_timeouts,
+            'acquire_wait_total': self.acquire_wait_total,
+            'acquire_wait_max': self.acquire_wait_max,
+        }
+
+
+def _release_abandoned(acquiring):
+    if not acquiring.cancelled() and acquiring.exception() is None:
+        asyncio.ensure_future(acquiring.result().close())
+
+
+class _AcquireContextManager:
+    """Результат InstrumentedEngine.acquire(): как и у aiopg, его можно
+    использовать в async with или дождаться через await."""
+    
+    def __init__(self, coro):
+        self._coro = coro
+        self._conn = None
+    
+    def __await__(self):
+        return self._coro.__await__()
+    
+    async def __aenter__(self):
+        self._conn = await self._coro
+        return self._conn
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._conn.close()
+        self._conn = None
+
 
 async def create_async_engine(
     db_config, base_timeout=BASE_TIMEOUT, max_reconnects=MAX_RECONNECTS
 ):
+    db_config = dict(db_config)
+    backend = db_config.pop('backend', BACKEND_AIOPG)
+    acquire_timeout = db_config.pop('acquire_timeout', None) or None
+    if backend == BACKEND_ASYNCPG:
+        if asyncpg is None:
+            raise ValueError(
+                'Database backend asyncpg requires the asyncpg package'
+            )
+        from . import asyncpg_backend
+        create_engine = asyncpg_backend.create_engine
+        connect_errors = asyncpg_backend.CONNECT_ERRORS
+    else:
+        create_engine = _create_aiopg_engine
+        connect_errors = AiopgOperationalError
     error = None
     delay = base_timeout
     for _ in range(max_reconnects):
         try:
-            return await _create_async_engine(**db_config)
-        except AiopgOperationalError as exc:
+            return InstrumentedEngine(
+                await create_engine(**db_config), acquire_timeout
+            )
+        except connect_errors as exc:
             error = exc
             await asyncio.sleep(delay)
             delay *= 2
     raise error
 
 
+async def _create_aiopg_engine(statement_timeout=None, **db_config):
+    if statement_timeout:
+        db_config['options'] = '-c statement_timeout={:d}'.format(
+            statement_timeout
+        )
+    return await _create_async_engine(**db_config)
+
+
 async def close_async_engine(engine):
     engine.close()
     await engine.wait_closed()
 
 
+def make_dsn(db_config):
+    """Собирает DSN для блокирующего движка из секции database конфига."""
+    return 'postgresql://{user}:{password}@{host}:{port}/{database}'.format(
+        **db_config
+    )
+
+
 def create_blocking_engine(
     dsn, base_timeout=BASE_TIMEOUT, max_reconnects=MAX_RECONNECTS
 ):
@@ -46,4 +218,76 @@ def create_blocking_engine(
 
 
 def close_blocking_engine(engine):
-    engine.close()
+    engine.dispose()
+
+
+def _is_asyncpg_error(exc):
+    """Проверяет, что ошибка БД получена от asyncpg (а не psycopg2)."""
+    return asyncpg is not None and isinstance(exc, asyncpg.PostgresError)
+
+
+def is_foreign_key_violation(exc):
+    """Проверяет, что ошибка БД - нарушение внешнего ключа."""
+    if _is_asyncpg_error(exc):
+        return isinstance(exc, asyncpg.ForeignKeyViolationError)
+    return (
+        isinstance(exc, IntegrityError) and
+        exc.pgcode == FOREIGN_KEY_VIOLATION
+    )
+
+
+def get_error_detail(exc):
+    """Возвращает пояснение к ошибке БД."""
+    if _is_asyncpg_error(exc):
+        return exc.detail
+    return exc.diag.message_detail
+
+
+def get_constraint_name(exc):
+    """Возвращает имя ограничения, нарушение которого вызвало ошибку БД."""
+    if _is_asyncpg_error(exc):
+        return exc.constraint_name
+    return exc.diag.constraint_name
+
+
+def compile_query(query):
+    """Компилирует SQLAlchemy-запрос в SQL-строку и словарь параметров
+    для выполнения через курсор psycopg2."""
+    compiled = query.compile(dialect=_dialect)
+    return str(compiled), compiled.params
+
+
+class PreparedQuery:
+    """SQLAlchemy-запрос, один раз скомпилированный в SQL-строку.
+
+    Изменяемые части запроса задаются через bindparam, их значения
+    передаются при выполнении. Остальные параметры (константы, попавшие
+    в запрос при построении) берутся из результата компиляции."""
+
+    def __init__(self, query):
+        self.sql, self._params = compile_query(query)
+
+    def params(self, **params) -> dict:
+        return {**self._params, **params}
+
+    def execute(self, conn, **params):
+        return conn.execute(self.sql, self.params(**params))
+
+    def scalar(self, conn, **params):
+        return conn.scalar(self.sql, self.params(**params))
+
+
+def prepared_query(build):
+    """Кеширует запросы, построенные функцией build.
+
+    Аргументы build должны описывать форму запроса (какие условия в нем
+    есть), а не значения параметров: запрос строится и компилируется один
+    раз для каждого набора аргументов. Исходная функция доступна как
+    атрибут build результата.
+
+    :param build: функция, возвращающая SQLAlchemy-запрос."""
+    cached = lru_cache(maxsize=None)(
+        lambda *args: PreparedQuery(build(*args))
+    )
+    cached.build = build
+    return cached
@@ -0,0 +1,44 @@
+"""Выбор реализации цикла событий.
+
+Если установлен uvloop, по умолчанию используется он, иначе - цикл
+событий asyncio. Политика устанавливается до создания цикла: в main.run
+до запуска приложения и воркеров, в тестах - в фикстуре loop.
+"""
+import asyncio
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Названия циклов событий. auto - uvloop, если он установлен, иначе asyncio
+LOOP_AUTO = 'auto'
+LOOP_ASYNCIO = 'asyncio'
+LOOP_UVLOOP = 'uvloop'
+LOOP_NAMES = (LOOP_AUTO, LOOP_ASYNCIO, LOOP_UVLOOP)
+
+
+def create_event_loop_policy(
+    name: str = LOOP_AUTO
+) -> asyncio.AbstractEventLoopPolicy:
+    """Создает политику цикла событий по названию.
+
+    :param name: auto, asyncio или uvloop."""
+    if name == LOOP_AUTO:
+        name = LOOP_ASYNCIO if uvloop is None else LOOP_UVLOOP
+    if name not in LOOP_NAMES:
+        raise ValueError(
+            'Unknown event loop {}, expected one of {}'.format(
+                name, ', '.join(LOOP_NAMES)
+            )
+        )
+    if name == LOOP_ASYNCIO:
+        return asyncio.DefaultEventLoopPolicy()
+    if uvloop is None:
+        raise ValueError('Event loop uvloop requires the uvloop package')
+    return uvloop.EventLoopPolicy()
+
+
+def setup_event_loop(name: str = LOOP_AUTO):
+    """Устанавливает политику цикла событий для процесса."""
+    asyncio.set_event_loop_policy(create_event_loop_policy(name))
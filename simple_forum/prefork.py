@@ -0,0 +1,228 @@
+"""Пре-форк сервер: несколько процессов-воркеров на одном порту.
+
+Основной процесс открывает слушающий сокет и запускает воркеры через
+fork, каждый воркер запускает свое приложение aiohttp на унаследованном
+сокете. Новые соединения ядро раздает воркерам, ожидающим на сокете.
+Поскольку сокет принадлежит основному процессу, соединения в очереди не
+теряются, когда воркер падает или перезапускается.
+
+Основной процесс следит за воркерами и перезапускает упавшие. По SIGTERM
+или SIGINT он останавливает воркеры по одному (rolling shutdown):
+остальные продолжают обслуживать запросы, пока очередной воркер
+завершает начатые (см. shutdown_timeout в aiohttp.web.run_app).
+
+В основном процессе нельзя создавать цикл событий и соединения с БД до
+запуска воркеров - они будут разделены между процессами.
+"""
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# Интервал в секундах, с которым основной процесс проверяет воркеры
+SUPERVISE_INTERVAL = 0.1
+# Воркер, проработавший меньше этого времени в секундах, перезапускается
+# с задержкой, которая удваивается до MAX_RESTART_DELAY, чтобы не
+# перезапускать в цикле воркер, который падает при старте
+MIN_WORKER_UPTIME = 1
+BASE_RESTART_DELAY = 0.1
+MAX_RESTART_DELAY = 10
+# Интервал в секундах, с которым воркер проверяет, жив ли основной процесс
+PARENT_CHECK_INTERVAL = 1
+
+
+def bind_socket(
+    host: str, port: int, reuse_address: bool = True,
+    reuse_port: bool = False, backlog: int = 128
+) -> socket.socket:
+    """Открывает слушающий TCP-сокет для воркеров."""
+    family, sock_type, proto, _, address = socket.getaddrinfo(
+        host, port, type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE
+    )[0]
+    sock = socket.socket(family, sock_type, proto)
+    if reuse_address:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(address)
+    sock.listen(backlog)
+    return sock
+
+
+def split_pool_size(
+    db_config: dict, workers: int, budget: int, reserved: int = 0
+) -> dict:
+    """Настройки пула соединений воркера при общем лимите соединений.
+
+    :param db_config: настройки БД (секция database или реплики).
+    :param workers: количество воркеров.
+    :param budget: общее количество соединений всех воркеров с одной БД,
+    0 - без общего лимита.
+    :param reserved: количество соединений воркера с этой БД вне пула
+    (прослушивание изменений, см. db/changes.py).
+    :raises ValueError: лимита не хватает на пул хотя бы из одного
+    соединения у каждого воркера."""
+    if budget <= 0:
+        return db_config
+    maxsize = budget // workers - reserved
+    if maxsize < 1:
+        raise ValueError(
+            'workers.db_connections {} is too small for {} workers, '
+            'at least {} are needed'.format(
+                budget, workers, workers * (reserved + 1)
+            )
+        )
+    return {
+        **db_config,
+        'maxsize': maxsize,
+        'minsize': min(db_config['minsize'], maxsize)
+    }
+
+
+class Supervisor:
+    """Запускает воркеры и следит за ними.
+
+    :param target: функция, которую выполняет воркер, получает номер
+    воркера. Должна завершиться после SIGTERM.
+    :param workers: количество воркеров.
+    :param stop_timeout: время в секундах на завершение воркера после
+    SIGTERM, после которого он получает SIGKILL."""
+
+    def __init__(
+        self, target: Callable[[int], None], workers: int,
+        stop_timeout: float
+    ):
+        self.target = target
+        self.workers = workers
+        self.stop_timeout = stop_timeout
+        # pid -> номер воркера
+        self._pids = {}
+        # Номер воркера -> (время запуска, задержка следующего перезапуска)
+        self._starts = {}
+        # Номер воркера -> время, когда его нужно перезапустить
+        self._restarts = {}
+        self._stopping = False
+
+    def run(self):
+        """Запускает воркеры и возвращает управление после их остановки."""
+        signal.signal(signal.SIGTERM, self._on_stop_signal)
+        signal.signal(signal.SIGINT, self._on_stop_signal)
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+        while not self._stopping:
+            self._reap()
+            self._restart_due()
+            time.sleep(SUPERVISE_INTERVAL)
+        self._stop_workers()
+
+    def _on_stop_signal(self, signum, frame):
+        if not self._stopping:
+            logger.info('Received signal {}, stopping workers'.format(signum))
+        self._stopping = True
+
+    def _spawn(self, worker_id):
+        pid = os.fork()
+        if pid == 0:
+            os._exit(_run_worker(self.target, worker_id))
+        now = time.monotonic()
+        _, delay = self._starts.get(worker_id, (now, BASE_RESTART_DELAY))
+        self._starts[worker_id] = (now, delay)
+        self._pids[pid] = worker_id
+        logger.info('Started worker {} with pid {}'.format(worker_id, pid))
+
+    def _reap(self):
+        while self._pids:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            worker_id = self._pids.pop(pid, None)
+            if worker_id is None:
+                continue
+            logger.error('Worker {} with pid {} exited: {}'.format(
+                worker_id, pid, _describe_status(status)
+            ))
+            started_at, delay = self._starts[worker_id]
+            now = time.monotonic()
+            if now - started_at < MIN_WORKER_UPTIME:
+                self._restarts[worker_id] = now + delay
+                self._starts[worker_id] = (
+                    started_at, min(delay * 2, MAX_RESTART_DELAY)
+                )
+            else:
+                self._restarts[worker_id] = now
+                self._starts[worker_id] = (started_at, BASE_RESTART_DELAY)
+
+    def _restart_due(self):
+        now = time.monotonic()
+        for worker_id, restart_at in list(self._restarts.items()):
+            if restart_at <= now:
+                del self._restarts[worker_id]
+                self._spawn(worker_id)
+
+    def _stop_workers(self):
+        # Повторный сигнал во время остановки не должен ее прерывать
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for pid, worker_id in sorted(
+            self._pids.items(), key=lambda item: item[1]
+        ):
+            self._stop_worker(pid, worker_id)
+        self._pids.clear()
+
+    def _stop_worker(self, pid, worker_id):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + self.stop_timeout
+        while time.monotonic() < deadline:
+            exited_pid, _ = os.waitpid(pid, os.WNOHANG)
+            if exited_pid:
+                logger.info('Worker {} with pid {} stopped'.format(
+                    worker_id, pid
+                ))
+                return
+            time.sleep(SUPERVISE_INTERVAL)
+        logger.error(
+            'Worker {} with pid {} did not stop in {}s, killing'.format(
+                worker_id, pid, self.stop_timeout
+            )
+        )
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+
+def _run_worker(target, worker_id):
+    """Выполняет воркер в дочернем процессе и возвращает код выхода."""
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, signal.SIG_DFL)
+    threading.Thread(
+        target=_watch_parent, args=(os.getppid(),), daemon=True
+    ).start()
+    try:
+        target(worker_id)
+    except Exception:
+        logger.exception('Worker {} failed'.format(worker_id))
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _watch_parent(parent_pid):
+    """Останавливает воркер, если основной процесс завершился
+    аварийно и не остановил его."""
+    while os.getppid() == parent_pid:
+        time.sleep(PARENT_CHECK_INTERVAL)
+    logger.error('Supervisor exited, stopping worker {}'.format(os.getpid()))
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def _describe_status(status):
+    if os.WIFSIGNALED(status):
+        return 'killed by signal {}'.format(os.WTERMSIG(status))
+    return 'exit code {}'.format(os.WEXITSTATUS(status))
@@ -6,12 +6,52 @@ import yaml
 BASE_PATH = pathlib.Path(__file__).parent.parent
 # Путь до конфига по умолчанию
 DEFAULT_CONFIG_PATH = BASE_PATH / 'conf' / 'conf.yaml'
+# Драйвер БД: aiopg или asyncpg
+DEFAULT_BACKEND = 'aiopg'
+# Настройки пула соединений по умолчанию совпадают с настройками aiopg.
+# Время - в секундах, statement_timeout - в миллисекундах, 0 и -1 отключают
+# ограничение
+DEFAULT_POOL_MINSIZE = 1
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_POOL_RECYCLE = -1
+DEFAULT_ACQUIRE_TIMEOUT = 0
+DEFAULT_STATEMENT_TIMEOUT = 0
+# Время в секундах после записи, в течение которого клиент читает
+# из основной БД
+DEFAULT_READ_YOUR_WRITES_WINDOW = 5
+# Собирать ответ GET /posts/{id} в БД (см. get_post_json)
+DEFAULT_POST_JSON_IN_DB = False
+# Кодек JSON запросов и ответов: auto, json или orjson
+DEFAULT_JSON_CODEC = 'auto'
+# Количество ответов в кеше GET /posts/{id}, 0 отключает кеш
+DEFAULT_POST_CACHE_SIZE = 1000
+# Объединять одинаковые одновременные запросы на чтение
+DEFAULT_COALESCE_READS = True
+# Сжатие ответов: минимальный размер в байтах, уровень zlib (0 отключает
+# сжатие) и размер, начиная с которого ответ сжимается в пуле потоков
+DEFAULT_COMPRESSION_MIN_SIZE = 1024
+DEFAULT_COMPRESSION_LEVEL = 6
+DEFAULT_COMPRESSION_EXECUTOR_SIZE = 65536
+# Количество процессов-воркеров, 1 - один процесс без пре-форка
+DEFAULT_WORKERS = 1
+# Общее количество соединений воркеров с каждой БД, 0 - у каждого воркера
+# пул database.maxsize
+DEFAULT_WORKERS_DB_CONNECTIONS = 0
+# Время в секундах на остановку воркера, должно быть больше
+# server.shutdown_timeout (60 по умолчанию)
+DEFAULT_WORKERS_STOP_TIMEOUT = 70
+# Цикл событий: auto, asyncio или uvloop
+DEFAULT_EVENT_LOOP = 'auto'
 
 
 def read_config(config_path=DEFAULT_CONFIG_PATH):
     with open(config_path) as f:
         config = yaml.load(f, Loader=yaml.FullLoader)
+    db_config = config['database']
     config['database'] = {
+        'backend': os.environ.get(
+            'DATABASE_BACKEND', db_config.get('backend', DEFAULT_BACKEND)
+        ),
         'host': os.environ.get('DATABASE_HOST', config['database']['host']),
         'port': int(
             os.environ.get('DATABASE_PORT', config['database']['port'])
@@ -22,6 +62,154 @@ def read_config(config_path=DEFAULT_CONFIG_PATH):
         'user': os.environ.get('DATABASE_USER', config['database']['user']),
         'password': os.environ.get(
             'DATABASE_PASSWORD', config['database']['password']
+        ),
+        'minsize': int(
+            os.environ.get(
+                'DATABASE_POOL_MINSIZE',
+                db_config.get('minsize', DEFAULT_POOL_MINSIZE)
+            )
+        ),
+        'maxsize': int(
+            os.environ.get(
+                'DATABASE_POOL_MAXSIZE',
+                db_config.get('maxsize', DEFAULT_POOL_MAXSIZE)
+            )
+        ),
+        'pool_recycle': float(
+            os.environ.get(
+                'DATABASE_POOL_RECYCLE',
+                db_config.get('pool_recycle', DEFAULT_POOL_RECYCLE)
+            )
+        ),
+        'acquire_timeout': float(
+            os.environ.get(
+                'DATABASE_ACQUIRE_TIMEOUT',
+                db_config.get('acquire_timeout', DEFAULT_ACQUIRE_TIMEOUT)
+            )
+        ),
+        'statement_timeout': int(
+            os.environ.get(
+                'DATABASE_STATEMENT_TIMEOUT',
+                db_config.get('statement_timeout', DEFAULT_STATEMENT_TIMEOUT)
+            )
+        )
+    }
+    config['replicas'] = _read_replicas_config(
+        config.get('replicas') or {}, config['database']
+    )
+    api_config = config.get('api') or {}
+    config['api'] = {
+        'post_json_in_db': _to_bool(
+            os.environ.get(
+                'POST_JSON_IN_DB',
+                api_config.get('post_json_in_db', DEFAULT_POST_JSON_IN_DB)
+            )
+        ),
+        'json_codec': os.environ.get(
+            'JSON_CODEC', api_config.get('json_codec', DEFAULT_JSON_CODEC)
+        ),
+        'post_cache_size': int(
+            os.environ.get(
+                'POST_CACHE_SIZE',
+                api_config.get('post_cache_size', DEFAULT_POST_CACHE_SIZE)
+            )
+        ),
+        'coalesce_reads': _to_bool(
+            os.environ.get(
+                'COALESCE_READS',
+                api_config.get('coalesce_reads', DEFAULT_COALESCE_READS)
+            )
+        ),
+        'compression_min_size': int(
+            os.environ.get(
+                'COMPRESSION_MIN_SIZE',
+                api_config.get(
+                    'compression_min_size', DEFAULT_COMPRESSION_MIN_SIZE
+                )
+            )
+        ),
+        'compression_level': int(
+            os.environ.get(
+                'COMPRESSION_LEVEL',
+                api_config.get(
+                    'compression_level', DEFAULT_COMPRESSION_LEVEL
+                )
+            )
+        ),
+        'compression_executor_size': int(
+            os.environ.get(
+                'COMPRESSION_EXECUTOR_SIZE',
+                api_config.get(
+                    'compression_executor_size',
+                    DEFAULT_COMPRESSION_EXECUTOR_SIZE
+                )
+            )
+        )
+    }
+    workers_config = config.get('workers') or {}
+    config['workers'] = {
+        'count': int(
+            os.environ.get(
+                'WORKERS', workers_config.get('count', DEFAULT_WORKERS)
+            )
+        ),
+        'db_connections': int(
+            os.environ.get(
+                'WORKERS_DB_CONNECTIONS',
+                workers_config.get(
+                    'db_connections', DEFAULT_WORKERS_DB_CONNECTIONS
+                )
+            )
+        ),
+        'stop_timeout': float(
+            os.environ.get(
+                'WORKERS_STOP_TIMEOUT',
+                workers_config.get(
+                    'stop_timeout', DEFAULT_WORKERS_STOP_TIMEOUT
+                )
+            )
         )
     }
+    config['event_loop'] = os.environ.get(
+        'EVENT_LOOP', config.get('event_loop', DEFAULT_EVENT_LOOP)
+    )
     return config
+
+
+def _to_bool(value):
+    """Значение флага из конфига (bool) или переменной окружения
+    (строка)."""
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+
+def _read_replicas_config(replicas_config, primary_config):
+    """Собирает настройки реплик.
+    
+    Параметры подключения, не указанные для реплики, берутся из настроек
+    основной БД. Переменная окружения DATABASE_REPLICAS задает реплики
+    списком host[:port] через запятую."""
+    if 'DATABASE_REPLICAS' in os.environ:
+        databases = []
+        for address in os.environ['DATABASE_REPLICAS'].split(','):
+            if not address.strip():
+                continue
+            host, _, port = address.strip().partition(':')
+            database = {'host': host}
+            if port:
+                database['port'] = int(port)
+            databases.append(database)
+    else:
+        databases = replicas_config.get('databases') or []
+    return {
+        'databases': [
+            {**primary_config, **database} for database in databases
+        ],
+        'read_your_writes_window': int(
+            os.environ.get(
+                'READ_YOUR_WRITES_WINDOW',
+                replicas_config.get(
+                    'read_your_writes_window', DEFAULT_READ_YOUR_WRITES_WINDOW
+                )
+            )
+        )
+    }
@@ -4,7 +4,10 @@ import pytest
 from sqlalchemy import delete
 
 from simple_forum.db.models import section
-from simple_forum.db.utils import close_async_engine, create_async_engine
+from simple_forum.db.utils import (
+    BACKENDS, close_async_engine, create_async_engine
+)
+from simple_forum.event_loop import setup_event_loop
 from simple_forum.utils import DEFAULT_CONFIG_PATH, read_config
 
 
@@ -26,15 +29,18 @@ def config(config_path):
     
     
 @pytest.yield_fixture(scope='session')
-def loop():
+def loop(config):
+    setup_event_loop(config['event_loop'])
     _loop = asyncio.get_event_loop_policy().new_event_loop()
     yield _loop
     _loop.close()
     
 
-@pytest.yield_fixture(scope='session')
-async def db_engine(loop, config):
-    engine = await create_async_engine(config['database'])
+@pytest.yield_fixture(scope='session', params=BACKENDS)
+async def db_engine(request, loop, config):
+    engine = await create_async_engine(
+        {**config['database'], 'backend': request.param}
+    )
     yield engine
     await close_async_engine(engine)
     
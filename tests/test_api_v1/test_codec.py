@@ -0,0 +1,50 @@
+from datetime import date, datetime, timezone
+
+import pytest
+
+from simple_forum.api.codec import (
+    CODEC_AUTO, CODEC_JSON, CODEC_ORJSON, create_json_codec, orjson
+)
+
+CODECS = [CODEC_JSON] + ([CODEC_ORJSON] if orjson is not None else [])
+
+DATA = {
+    'id': 1,
+    'text': 'текст "в кавычках"\n',
+    'ratio': 0.5,
+    'children': [1, 2],
+    'parent_id': None,
+    'has_more_replies': False,
+    'created_at': datetime(2019, 1, 2, 3, 4, 5, 678),
+    'updated_at': datetime(2019, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+    'day': date(2019, 1, 2),
+}
+
+
+@pytest.mark.parametrize('name', CODECS)
+def test_codec(name):
+    codec = create_json_codec(name)
+    assert codec.name == name
+    # Все кодеки дают одинаковый JSON
+    raw = codec.dumps(DATA)
+    assert raw == create_json_codec(CODEC_JSON).dumps(DATA)
+    assert codec.loads(raw) == {
+        **DATA,
+        'created_at': '2019-01-02T03:04:05.000678',
+        'updated_at': '2019-01-02T03:04:05+00:00',
+        'day': '2019-01-02',
+    }
+
+
+@pytest.mark.parametrize('name', CODECS)
+@pytest.mark.parametrize('raw', [b'', b'{', '{"a": 1}x'.encode(), b'\xff'])
+def test_codec_invalid_json(name, raw):
+    with pytest.raises(ValueError):
+        create_json_codec(name).loads(raw)
+
+
+def test_create_json_codec():
+    expected = CODEC_JSON if orjson is None else CODEC_ORJSON
+    assert create_json_codec(CODEC_AUTO).name == expected
+    with pytest.raises(ValueError):
+        create_json_codec('unknown')
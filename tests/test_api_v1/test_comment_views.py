@@ -95,6 +95,9 @@ async def test_create_comment_if_post_does_not_exist(cli):
     request_data = {'post_id': random.randint(1, 100), 'text': 'text'}
     response = await cli.post('/api/v1/comments', json=request_data)
     assert response.status == 400
+    assert await response.text() == 'Post with id {} does not exist'.format(
+        request_data['post_id']
+    )
     
 
 async def test_create_child_comment_if_parent_does_not_exist(cli):
@@ -119,6 +122,78 @@ async def test_create_child_comment_if_parent_does_not_exist(cli):
     }
     response = await cli.post('/api/v1/comments', json=request_data)
     assert response.status == 400
+    assert await response.text() == (
+        'Comment with id {} does not exist'.format(request_data['parent_id'])
+    )
+
+
+async def test_create_comments(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'name',
+                'description': 'description'
+            })
+        )
+        post_id = await conn.scalar(
+            insert(post).values({
+                'section_id': section_id,
+                'topic': 'topic',
+                'description': 'description'
+            })
+        )
+        parent_comment_id = await conn.scalar(
+            insert(comment).values({'post_id': post_id, 'text': 'text'})
+        )
+        request_data = [
+            {'post_id': post_id, 'text': 'text'},
+            {
+                'post_id': post_id,
+                'parent_id': parent_comment_id,
+                'text': 'text'
+            }
+        ]
+        response = await cli.post('/api/v1/comments:batch', json=request_data)
+        assert response.status == 201
+        new_comments = await response.json()
+        assert [_comment['parent_id'] for _comment in new_comments] == [
+            None, parent_comment_id
+        ]
+        assert await conn.scalar(
+            select([exists().where(
+                and_(
+                    comment.c.id == new_comments[1]['id'],
+                    comment.c.path.startswith(
+                        '{:010d}.'.format(parent_comment_id)
+                    )
+                )
+            )])
+        )
+
+
+async def test_create_comments_if_parent_does_not_exist(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'name',
+                'description': 'description'
+            })
+        )
+        post_id = await conn.scalar(
+            insert(post).values({
+                'section_id': section_id,
+                'topic': 'topic',
+                'description': 'description'
+            })
+        )
+    request_data = [
+        {'post_id': post_id, 'text': 'text'},
+        {'post_id': post_id, 'parent_id': random.randint(1, 100), 'text': 't'}
+    ]
+    response = await cli.post('/api/v1/comments:batch', json=request_data)
+    assert response.status == 400
+    response_text = await response.text()
+    assert '1:' in response_text and 'parent_id' in response_text
 
 
 async def test_update_comment_if_comment_does_not_exist(cli):
@@ -163,3 +238,86 @@ async def test_delete_comment_if_comment_does_not_exist(cli):
         '/api/v1/comments/{}'.format(random.randint(1, 100))
     )
     assert response.status == 404
+
+
+async def test_retrieve_comment_subtree(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'name',
+                'description': 'description'
+            })
+        )
+        post_id = await conn.scalar(
+            insert(post).values({
+                'section_id': section_id,
+                'topic': 'topic',
+                'description': 'description'
+            })
+        )
+        parent_comment_id = await conn.scalar(
+            insert(comment).values({'post_id': post_id, 'text': 'text'})
+        )
+        child_comment_id = await conn.scalar(
+            insert(comment).values({
+                'post_id': post_id,
+                'parent_id': parent_comment_id,
+                'text': 'text'
+            })
+        )
+    response = await cli.get(
+        '/api/v1/comments/{}/subtree'.format(parent_comment_id),
+        params={'max_depth': 1}
+    )
+    assert response.status == 200
+    response_data = await response.json()
+    assert [_comment['id'] for _comment in response_data] == [
+        parent_comment_id, child_comment_id
+    ]
+    assert response_data[0]['children'] == [child_comment_id]
+    assert not response_data[0]['has_more_replies']
+
+
+async def test_retrieve_comment_subtree_with_zero_max_depth(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'name',
+                'description': 'description'
+            })
+        )
+        post_id = await conn.scalar(
+            insert(post).values({
+                'section_id': section_id,
+                'topic': 'topic',
+                'description': 'description'
+            })
+        )
+        parent_comment_id = await conn.scalar(
+            insert(comment).values({'post_id': post_id, 'text': 'text'})
+        )
+        child_comment_id = await conn.scalar(
+            insert(comment).values({
+                'post_id': post_id,
+                'parent_id': parent_comment_id,
+                'text': 'text'
+            })
+        )
+    response = await cli.get(
+        '/api/v1/comments/{}/subtree'.format(parent_comment_id),
+        params={'max_depth': 0}
+    )
+    assert response.status == 200
+    response_data = await response.json()
+    assert [_comment['id'] for _comment in response_data] == [
+        parent_comment_id
+    ]
+    assert response_data[0]['replies_count'] == 1
+    assert response_data[0]['has_more_replies']
+
+
+async def test_retrieve_comment_subtree_if_comment_does_not_exist(cli):
+    response = await cli.get(
+        '/api/v1/comments/{}/subtree'.format(random.randint(1, 100))
+    )
+    assert response.status == 404
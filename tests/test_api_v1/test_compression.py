@@ -0,0 +1,130 @@
+import gzip
+import zlib
+
+import pytest
+from aiohttp import web
+from aiojobs.aiohttp import setup as setup_jobs
+from sqlalchemy import insert
+
+from simple_forum.api import middlewares
+from simple_forum.api.cache import PostCache
+from simple_forum.api.compression import choose_encoding, compress
+from simple_forum.api.middlewares import compression_middleware
+from simple_forum.db.models import comment, post, section
+from simple_forum.routes import POST_URLS
+
+
+@pytest.fixture(params=[0, 10 ** 6])
+def cli(request, loop, aiohttp_client, db_engine, cleanup_db):
+    app = web.Application(middlewares=[compression_middleware])
+    app.add_routes(POST_URLS)
+    app['db'] = db_engine
+    app['post_cache'] = PostCache(10)
+    # Параметр - размер, начиная с которого сжатие идет в пуле потоков
+    app['config'] = {'api': {
+        'compression_min_size': 1024, 'compression_level': 6,
+        'compression_executor_size': request.param
+    }}
+    setup_jobs(app)
+    return loop.run_until_complete(
+        aiohttp_client(app, auto_decompress=False)
+    )
+
+
+@pytest.mark.parametrize('accept_encoding, encoding', [
+    ('gzip, deflate', 'gzip'),
+    ('deflate, gzip', 'gzip'),
+    ('deflate', 'deflate'),
+    ('gzip;q=0.5, deflate', 'deflate'),
+    ('GZIP', 'gzip'),
+    ('gzip;q=0, *', 'deflate'),
+    ('*;q=0.1', 'gzip'),
+    ('identity', None),
+    ('gzip;q=0', None),
+    ('gzip;q=abc', None),
+    ('', None),
+])
+def test_choose_encoding(accept_encoding, encoding):
+    assert choose_encoding(accept_encoding) == encoding
+
+
+@pytest.mark.parametrize('encoding, decompress', [
+    ('gzip', gzip.decompress),
+    ('deflate', zlib.decompress),
+])
+def test_compress(encoding, decompress):
+    body = b'{"text": "text"}' * 100
+    compressed = compress(body, encoding, 6)
+    assert len(compressed) < len(body)
+    assert decompress(compressed) == body
+
+
+async def create_post(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({'name': 'name', 'description': 'd'})
+        )
+        post_id = await conn.scalar(
+            insert(post).values({
+                'section_id': section_id,
+                'topic': 'topic',
+                'description': 'description'
+            })
+        )
+        await conn.execute(insert(comment).values([
+            {'post_id': post_id, 'text': 'text {}'.format(num)}
+            for num in range(100)
+        ]))
+    return post_id
+
+
+async def test_compress_post(cli):
+    url = '/api/v1/posts/{}'.format(await create_post(cli))
+    response = await cli.get(url, headers={'Accept-Encoding': 'identity'})
+    assert response.status == 200
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    body = await response.read()
+    for encoding, decompress in (
+        ('gzip', gzip.decompress), ('deflate', zlib.decompress)
+    ):
+        response = await cli.get(url, headers={'Accept-Encoding': encoding})
+        assert response.status == 200
+        assert response.headers['Content-Encoding'] == encoding
+        assert response.headers['Vary'] == 'Accept-Encoding'
+        compressed = await response.read()
+        assert len(compressed) < len(body)
+        assert decompress(compressed) == body
+
+
+async def test_skip_small_response(cli):
+    response = await cli.get(
+        '/api/v1/posts', headers={'Accept-Encoding': 'gzip'}
+    )
+    assert response.status == 200
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers.getall('Vary') == ['Accept-Encoding']
+
+
+async def test_compress_cached_post_once(cli, monkeypatch):
+    calls = []
+
+    def counting_compress(body, encoding, level):
+        calls.append(encoding)
+        return compress(body, encoding, level)
+
+    monkeypatch.setattr(middlewares, 'compress', counting_compress)
+    url = '/api/v1/posts/{}'.format(await create_post(cli))
+    bodies = []
+    for _ in range(3):
+        response = await cli.get(url, headers={'Accept-Encoding': 'gzip'})
+        assert response.status == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        bodies.append(await response.read())
+    assert calls == ['gzip']
+    assert len(set(bodies)) == 1
+    response = await cli.get(
+        url, headers={'If-None-Match': response.headers['ETag']}
+    )
+    assert response.status == 304
+    assert response.headers['Vary'] == 'Accept-Encoding'
@@ -0,0 +1,49 @@
+import pytest
+from aiohttp import web
+from aiojobs.aiohttp import setup as setup_jobs
+
+from simple_forum.api.middlewares import pool_timeout_middleware
+from simple_forum.db.utils import close_async_engine, create_async_engine
+from simple_forum.routes import METRICS_URLS, SECTION_URLS
+
+
+@pytest.yield_fixture
+async def small_engine(loop, config):
+    engine = await create_async_engine({
+        **config['database'], 'minsize': 1, 'maxsize': 1,
+        'acquire_timeout': 0.05
+    })
+    yield engine
+    await close_async_engine(engine)
+
+
+@pytest.fixture
+def cli(loop, aiohttp_client, small_engine):
+    app = web.Application(middlewares=[pool_timeout_middleware])
+    app.add_routes(SECTION_URLS)
+    app.add_routes(METRICS_URLS)
+    app['db'] = small_engine
+    setup_jobs(app)
+    return loop.run_until_complete(aiohttp_client(app))
+
+
+async def test_retrieve_metrics(cli):
+    response = await cli.get('/api/v1/metrics')
+    assert response.status == 200
+    metrics = await response.json()
+    assert metrics['db']['replicas'] == []
+    assert metrics['post_cache'] is None
+    assert metrics['single_flight'] is None
+    assert metrics['db']['primary']['maxsize'] == 1
+    assert metrics['db']['primary']['free'] == 1
+
+
+async def test_pool_exhausted(cli):
+    async with cli.server.app['db'].acquire():
+        response = await cli.get('/api/v1/sections')
+        assert response.status == 503
+        assert response.headers['Retry-After'] == '1'
+        response = await cli.get('/api/v1/metrics')
+        metrics = await response.json()
+    assert metrics['db']['primary']['free'] == 0
+    assert metrics['db']['primary']['acquire_timeouts'] == 1
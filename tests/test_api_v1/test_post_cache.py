@@ -0,0 +1,232 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiojobs.aiohttp import setup as setup_jobs
+from sqlalchemy import insert, update
+
+from simple_forum.api.cache import CachedPost, PostCache
+from simple_forum.db.changes import ChangesListener
+from simple_forum.db.models import comment, post, section
+from simple_forum.routes import COMMENT_URLS, POST_URLS, SECTION_URLS
+
+
+@pytest.fixture
+def cli(loop, aiohttp_client, db_engine, cleanup_db):
+    app = web.Application()
+    app.add_routes(SECTION_URLS)
+    app.add_routes(POST_URLS)
+    app.add_routes(COMMENT_URLS)
+    app['db'] = db_engine
+    app['post_cache'] = PostCache(10)
+    setup_jobs(app)
+    return loop.run_until_complete(aiohttp_client(app))
+
+
+async def create_post_with_comment(conn):
+    section_id = await conn.scalar(
+        insert(section).values({'name': 'name', 'description': 'description'})
+    )
+    post_id = await conn.scalar(
+        insert(post).values({
+            'section_id': section_id,
+            'topic': 'topic',
+            'description': 'description'
+        })
+    )
+    comment_id = await conn.scalar(
+        insert(comment).values({'post_id': post_id, 'text': 'text'})
+    )
+    return section_id, post_id, comment_id
+
+
+def test_post_cache_eviction():
+    cache = PostCache(2)
+    for post_id in (1, 2):
+        cache.set(post_id, (), CachedPost(b'{}', 'etag', {}), cache.version)
+    assert cache.get(1, ()) is not None
+    cache.set(3, (), CachedPost(b'{}', 'etag', {}), cache.version)
+    # Вытесняется пост, к которому дольше всего не обращались
+    assert cache.get(2, ()) is None
+    assert cache.get(1, ()) is not None
+    assert cache.get(3, ()) is not None
+    assert cache.stats() == {
+        'size': 2, 'posts': 2, 'maxsize': 2, 'hits': 3, 'misses': 1,
+        'invalidations': 0, 'evictions': 1
+    }
+
+
+def test_post_cache_eviction_by_params():
+    cache = PostCache(2)
+    # Каждый ответ на другие параметры занимает место в кеше
+    for limit in range(1, 4):
+        cache.set(
+            1, (('limit', limit),), CachedPost(b'{}', 'etag', {}),
+            cache.version
+        )
+    assert cache.get(1, (('limit', 1),)) is None
+    assert cache.get(1, (('limit', 3),)) is not None
+    stats = cache.stats()
+    assert stats['size'] == 2
+    assert stats['posts'] == 1
+    assert stats['evictions'] == 1
+    cache.invalidate(1)
+    assert cache.stats()['size'] == cache.stats()['posts'] == 0
+
+
+def test_post_cache_invalidation():
+    cache = PostCache(10)
+    cache.set(1, ('limit', 1), CachedPost(b'{}', 'etag', {}), cache.version)
+    cache.set(1, (), CachedPost(b'{}', 'etag', {}), cache.version)
+    version = cache.version
+    cache.invalidate(1)
+    assert cache.get(1, ('limit', 1)) is None
+    assert cache.get(1, ()) is None
+    # Ответ, прочитанный до сброса, может быть устаревшим
+    cache.set(1, (), CachedPost(b'{}', 'etag', {}), version)
+    assert cache.get(1, ()) is None
+    # Сброс другого поста не мешает сохранить ответ
+    cache.set(2, (), CachedPost(b'{}', 'etag', {}), version)
+    assert cache.get(2, ()) is not None
+    version = cache.version
+    cache.clear()
+    assert cache.get(2, ()) is None
+    cache.set(2, (), CachedPost(b'{}', 'etag', {}), version)
+    assert cache.get(2, ()) is None
+    assert cache.stats()['invalidations'] == 2
+
+
+def test_post_cache_forgets_invalidations():
+    cache = PostCache(2)
+    version = cache.version
+    for post_id in (1, 2, 3):
+        cache.invalidate(post_id)
+    # Сброс поста 1 забыт: ответы, чтение которых началось до него,
+    # не сохраняются
+    cache.set(4, (), CachedPost(b'{}', 'etag', {}), version)
+    assert cache.get(4, ()) is None
+    cache.set(4, (), CachedPost(b'{}', 'etag', {}), cache.version)
+    assert cache.get(4, ()) is not None
+
+
+def test_post_cache_from_replica(monkeypatch):
+    cache = PostCache(10)
+    cache.set(1, (), CachedPost(b'{}', 'etag', {}), cache.version, True)
+    assert cache.get(1, ()) is None
+    cache = PostCache(10, replica_ttl=5)
+    cache.set(1, (), CachedPost(b'{}', 'etag', {}), cache.version, True)
+    assert cache.get(1, ()) is not None
+    monkeypatch.setattr(
+        'simple_forum.api.cache.monotonic', lambda: float('inf')
+    )
+    assert cache.get(1, ()) is None
+
+
+async def test_retrieve_post_from_cache(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        _, post_id, _ = await create_post_with_comment(conn)
+    url = '/api/v1/posts/{}'.format(post_id)
+    response = await cli.get(url)
+    assert response.status == 200
+    body = await response.read()
+    etag = response.headers['ETag']
+    # Изменение в обход API в кеше не видно
+    async with cli.server.app['db'].acquire() as conn:
+        await conn.execute(
+            update(post).where(post.c.id == post_id).values(topic='new')
+        )
+    response = await cli.get(url)
+    assert response.status == 200
+    assert await response.read() == body
+    assert response.headers['ETag'] == etag
+    response = await cli.get(url, headers={'If-None-Match': etag})
+    assert response.status == 304
+    stats = cli.server.app['post_cache'].stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+
+
+async def test_post_cache_invalidation_by_views(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        section_id, post_id, comment_id = await create_post_with_comment(conn)
+    url = '/api/v1/posts/{}'.format(post_id)
+
+    async def get_comments():
+        response = await cli.get(url)
+        assert response.status == 200
+        return (await response.json())['comments']
+
+    assert len(await get_comments()) == 1
+    response = await cli.post(
+        '/api/v1/comments', json={'post_id': post_id, 'text': 'text'}
+    )
+    assert response.status == 201
+    assert len(await get_comments()) == 2
+    response = await cli.post(
+        '/api/v1/comments:batch',
+        json=[{'post_id': post_id, 'text': 'text', 'parent_id': comment_id}]
+    )
+    assert response.status == 201
+    assert len(await get_comments()) == 3
+    response = await cli.put(
+        '/api/v1/comments/{}'.format(comment_id),
+        json={'post_id': post_id, 'text': 'new text'}
+    )
+    assert response.status == 200
+    assert {_comment['text'] for _comment in await get_comments()} == {
+        'text', 'new text'
+    }
+    response = await cli.delete('/api/v1/comments/{}'.format(comment_id))
+    assert response.status == 204
+    assert len(await get_comments()) == 1
+    response = await cli.put(url, json={
+        'section_id': section_id, 'topic': 'new topic',
+        'description': 'description'
+    })
+    assert response.status == 200
+    response = await cli.get(url)
+    assert (await response.json())['topic'] == 'new topic'
+    response = await cli.delete(url)
+    assert response.status == 204
+    response = await cli.get(url)
+    assert response.status == 404
+
+
+async def test_post_cache_invalidation_by_section_delete(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        section_id, post_id, _ = await create_post_with_comment(conn)
+    url = '/api/v1/posts/{}'.format(post_id)
+    response = await cli.get(url)
+    assert response.status == 200
+    response = await cli.delete('/api/v1/sections/{}'.format(section_id))
+    assert response.status == 204
+    response = await cli.get(url)
+    assert response.status == 404
+
+
+async def test_post_cache_invalidation_by_notification(cli, config):
+    post_cache = cli.server.app['post_cache']
+    listener = ChangesListener(
+        config['database'], post_cache.on_change, post_cache.clear
+    )
+    listener.start()
+    try:
+        await asyncio.wait_for(listener.connected.wait(), 5)
+        async with cli.server.app['db'].acquire() as conn:
+            _, post_id, _ = await create_post_with_comment(conn)
+            url = '/api/v1/posts/{}'.format(post_id)
+            response = await cli.get(url)
+            assert (await response.json())['topic'] == 'topic'
+            # Изменение другим процессом приходит уведомлением
+            await conn.execute(
+                update(post).where(post.c.id == post_id).values(topic='new')
+            )
+            for _ in range(50):
+                response = await cli.get(url)
+                if (await response.json())['topic'] == 'new':
+                    break
+                await asyncio.sleep(0.1)
+            else:
+                pytest.fail('Post cache was not invalidated')
+    finally:
+        await listener.stop()
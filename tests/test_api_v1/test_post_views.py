@@ -3,10 +3,13 @@ import random
 import pytest
 from aiohttp import web
 from aiojobs.aiohttp import setup as setup_jobs
-from sqlalchemy import and_, exists, insert, select
+from sqlalchemy import and_, delete, exists, func, insert, select
 
 from simple_forum.db.models import comment, post, section
-from simple_forum.db.queries import DEFAULT_PAGE_NUM, DEFAULT_PER_PAGE
+from simple_forum.db.queries import (
+    DEFAULT_COMMENTS_LIMIT, DEFAULT_PAGE_NUM, DEFAULT_PER_PAGE,
+    MAX_COMMENTS_LIMIT
+)
 from simple_forum.routes import POST_URLS
 
 
@@ -51,6 +54,9 @@ async def test_create_post_if_section_does_not_exist(cli):
     }
     response = await cli.post('/api/v1/posts', json=request_data)
     assert response.status == 400
+    assert await response.text() == 'Section with id {} does not exist'.format(
+        request_data['section_id']
+    )
     
     
 @pytest.mark.parametrize(
@@ -70,6 +76,65 @@ async def test_create_post_with_invalid_request_data(request_data, cli):
     assert response.status == 400
     
     
+async def test_create_posts(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'name',
+                'description': 'description'
+            })
+        )
+        request_data = [
+            {
+                'section_id': section_id,
+                'topic': 'topic{}'.format(index),
+                'description': 'description'
+            }
+            for index in range(3)
+        ]
+        response = await cli.post('/api/v1/posts:batch', json=request_data)
+        assert response.status == 201
+        new_posts = await response.json()
+        assert [_post['topic'] for _post in new_posts] == [
+            _post['topic'] for _post in request_data
+        ]
+        assert await conn.scalar(
+            select([func.count()]).where(post.c.section_id == section_id)
+        ) == len(request_data)
+
+
+async def test_create_posts_if_section_does_not_exist(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'name',
+                'description': 'description'
+            })
+        )
+        request_data = [
+            {
+                'section_id': _section_id,
+                'topic': 'topic',
+                'description': 'description'
+            }
+            for _section_id in (section_id, section_id + 1)
+        ]
+        response = await cli.post('/api/v1/posts:batch', json=request_data)
+        assert response.status == 400
+        assert '1:' in await response.text()
+        assert not await conn.scalar(
+            select([exists().where(post.c.section_id == section_id)])
+        )
+
+
+@pytest.mark.parametrize(
+    'request_data', ([], [{'topic': 'topic'}], {'topic': 'topic'})
+)
+async def test_create_posts_with_invalid_request_data(request_data, cli):
+    response = await cli.post('/api/v1/posts:batch', json=request_data)
+    assert response.status == 400
+
+
 async def test_update_post(cli):
     request_data = {
         'topic': 'new topic',
@@ -132,7 +197,7 @@ async def test_update_post_with_invalid_request_data(request_data, cli):
     assert response.status == 400
     
     
-async def retrieve_post(cli):
+async def test_retrieve_post(cli):
     post_data = {
         'topic': 'topic',
         'description': 'description'
@@ -166,6 +231,7 @@ async def retrieve_post(cli):
     assert response_data['section_id'] == section_id
     assert response_data['topic'] == post_data['topic']
     assert response_data['description'] == post_data['description']
+    assert len(response_data['comments']) == 2
     for _comment in response_data['comments']:
         if _comment['id'] == parent_comment_id:
             assert _comment['children'] == [child_comment_id]
@@ -174,9 +240,172 @@ async def retrieve_post(cli):
             assert not _comment['children']
     
     
+async def test_retrieve_post_with_max_depth(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'name',
+                'description': 'description'
+            })
+        )
+        post_id = await conn.scalar(
+            insert(post).values({
+                'section_id': section_id,
+                'topic': 'topic',
+                'description': 'description'
+            })
+        )
+        parent_comment_id = await conn.scalar(
+            insert(comment).values({'post_id': post_id, 'text': 'text'})
+        )
+        await conn.execute(
+            insert(comment).values({
+                'post_id': post_id,
+                'parent_id': parent_comment_id,
+                'text': 'text'
+            })
+        )
+    response = await cli.get(
+        '/api/v1/posts/{}'.format(post_id),
+        params={'max_depth': 1, 'limit': 10}
+    )
+    assert response.status == 200
+    response_data = await response.json()
+    assert len(response_data['comments']) == 1
+    assert response_data['comments'][0]['id'] == parent_comment_id
+    assert response_data['comments'][0]['replies_count'] == 1
+    assert response_data['comments'][0]['has_more_replies']
+
+
+async def test_retrieve_post_with_zero_max_depth(cli):
+    response = await cli.get('/api/v1/posts/1', params={'max_depth': 0})
+    assert response.status == 400
+
+
+async def test_retrieve_post_with_default_comments_limit(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'name',
+                'description': 'description'
+            })
+        )
+        post_id = await conn.scalar(
+            insert(post).values({
+                'section_id': section_id,
+                'topic': 'topic',
+                'description': 'description'
+            })
+        )
+        await conn.execute(insert(comment).values([
+            {'post_id': post_id, 'text': 'text'}
+            for _ in range(DEFAULT_COMMENTS_LIMIT + 1)
+        ]))
+    response = await cli.get('/api/v1/posts/{}'.format(post_id))
+    assert response.status == 200
+    response_data = await response.json()
+    assert len(response_data['comments']) == DEFAULT_COMMENTS_LIMIT
+
+
+async def test_retrieve_post_with_too_large_comments_limit(cli):
+    response = await cli.get(
+        '/api/v1/posts/1', params={'limit': MAX_COMMENTS_LIMIT + 1}
+    )
+    assert response.status == 400
+
+
 async def test_retrieve_post_if_post_does_not_exist(cli):
     response = await cli.get('/api/v1/posts/{}'.format(random.randint(1, 100)))
     assert response.status == 404
+
+
+async def test_retrieve_post_not_modified(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'name',
+                'description': 'description'
+            })
+        )
+        post_id = await conn.scalar(
+            insert(post).values({
+                'section_id': section_id,
+                'topic': 'topic',
+                'description': 'description'
+            })
+        )
+        await conn.execute(
+            insert(comment).values({'post_id': post_id, 'text': 'text'})
+        )
+    url = '/api/v1/posts/{}'.format(post_id)
+    response = await cli.get(url)
+    assert response.status == 200
+    etag = response.headers['ETag']
+    assert 'Last-Modified' not in response.headers
+    response = await cli.get(url, headers={'If-None-Match': etag})
+    assert response.status == 304
+    # Ответ зависит от параметров запроса
+    response = await cli.get(
+        url, params={'limit': 1}, headers={'If-None-Match': etag}
+    )
+    assert response.status == 200
+    async with cli.server.app['db'].acquire() as conn:
+        comment_id = await conn.scalar(
+            insert(comment).values({'post_id': post_id, 'text': 'text'})
+        )
+    response = await cli.get(url, headers={'If-None-Match': etag})
+    assert response.status == 200
+    assert len((await response.json())['comments']) == 2
+    new_etag = response.headers['ETag']
+    async with cli.server.app['db'].acquire() as conn:
+        await conn.execute(delete(comment).where(comment.c.id == comment_id))
+    response = await cli.get(url, headers={'If-None-Match': new_etag})
+    assert response.status == 200
+    assert response.headers['ETag'] == etag
+
+
+@pytest.mark.parametrize('params', [
+    {}, {'max_depth': 1}, {'limit': 2}, {'max_depth': 2, 'limit': 3}
+])
+async def test_retrieve_post_json_in_db(params, cli, aiohttp_client):
+    app = web.Application()
+    app.add_routes(POST_URLS)
+    app['config'] = {'api': {'post_json_in_db': True}}
+    app['db'] = cli.server.app['db']
+    db_cli = await aiohttp_client(app)
+    async with app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'name',
+                'description': 'description'
+            })
+        )
+        post_id = await conn.scalar(
+            insert(post).values({
+                'section_id': section_id,
+                'topic': 'topic "quoted"',
+                'description': 'description'
+            })
+        )
+        parent_id = None
+        for num in range(4):
+            comment_id = await conn.scalar(
+                insert(comment).values({
+                    'post_id': post_id,
+                    'parent_id': parent_id,
+                    'text': 'text {}'.format(num)
+                })
+            )
+            # Две ветки по два уровня
+            parent_id = None if parent_id else comment_id
+    url = '/api/v1/posts/{}'.format(post_id)
+    response = await db_cli.get(url, params=params)
+    assert response.status == 200
+    assert response.content_type == 'application/json'
+    expected_response = await cli.get(url, params=params)
+    assert await response.json() == await expected_response.json()
+    response = await db_cli.get('/api/v1/posts/0')
+    assert response.status == 404
     
 
 async def test_retrieve_posts(cli):
@@ -207,7 +436,7 @@ async def test_retrieve_posts(cli):
         ]
         await conn.execute(insert(post).values([*target_posts, *other_posts]))
     response = await cli.get(
-        '/api/v1/posts', params={'topic__like': 'topic%'}
+        '/api/v1/posts', params={'topic__like': 'topic%', 'total': 'exact'}
     )
     assert response.status == 200
     posts_page = await response.json()
@@ -217,6 +446,201 @@ async def test_retrieve_posts(cli):
     target_ids = sorted([_post['id'] for _post in target_posts])
     page_ids = sorted([_post['id'] for _post in posts_page['items']])
     assert page_ids == target_ids[:DEFAULT_PER_PAGE]
+    assert posts_page['next'] is not None
+
+
+async def test_retrieve_posts_page(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'name',
+                'description': 'description'
+            })
+        )
+        await conn.execute(insert(post).values([
+            {
+                'id': _id,
+                'section_id': section_id,
+                'topic': 'topic',
+                'description': 'description'
+            }
+            for _id in range(1, 31)
+        ]))
+    response = await cli.get(
+        '/api/v1/posts', params={'page_num': 2, 'per_page': 10}
+    )
+    assert response.status == 200
+    posts_page = await response.json()
+    assert posts_page['page_num'] == 2
+    assert [_post['id'] for _post in posts_page['items']] == list(
+        range(11, 21)
+    )
+
+
+async def test_retrieve_posts_by_cursor(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'name',
+                'description': 'description'
+            })
+        )
+        await conn.execute(insert(post).values([
+            {
+                'id': _id,
+                'section_id': section_id,
+                'topic': 'topic',
+                'description': 'description'
+            }
+            for _id in range(1, 61)
+        ]))
+    page_ids = []
+    params = {'per_page': 25, 'total': 'exact'}
+    while True:
+        response = await cli.get('/api/v1/posts', params=params)
+        assert response.status == 200
+        posts_page = await response.json()
+        assert posts_page['total'] == 60
+        if 'after' in params:
+            assert posts_page['page_num'] is None
+        page_ids.extend(_post['id'] for _post in posts_page['items'])
+        if posts_page['next'] is None:
+            break
+        params['after'] = posts_page['next']
+    assert page_ids == list(range(1, 61))
+
+
+@pytest.mark.parametrize('page_num, page_size', ((1, 10), (5, 0)))
+async def test_retrieve_posts_total(page_num, page_size, cli):
+    async with cli.server.app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'name',
+                'description': 'description'
+            })
+        )
+        await conn.execute(insert(post).values([
+            {
+                'section_id': section_id,
+                'topic': 'topic',
+                'description': 'description'
+            }
+            for _ in range(10)
+        ]))
+    response = await cli.get(
+        '/api/v1/posts', params={'page_num': page_num, 'total': 'exact'}
+    )
+    assert response.status == 200
+    posts_page = await response.json()
+    assert len(posts_page['items']) == page_size
+    assert posts_page['total'] == 10
+
+
+@pytest.mark.parametrize(
+    'params, is_expected_type', (
+        ({'total': 'none'}, lambda value: value is None),
+        ({'total': 'approximate'}, lambda value: isinstance(value, int)),
+        ({}, lambda value: isinstance(value, int))
+    )
+)
+async def test_retrieve_posts_without_exact_total(
+    params, is_expected_type, cli
+):
+    response = await cli.get('/api/v1/posts', params=params)
+    assert response.status == 200
+    posts_page = await response.json()
+    assert is_expected_type(posts_page['total'])
+
+
+async def test_retrieve_posts_approximate_total(cli):
+    response = await cli.get('/api/v1/posts')
+    assert response.status == 200
+    assert (await response.json())['total'] == 0
+    async with cli.server.app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'name',
+                'description': 'description'
+            })
+        )
+        await conn.execute(insert(post).values([
+            {
+                'section_id': section_id,
+                'topic': 'topic',
+                'description': 'description'
+            }
+            for _ in range(60)
+        ]))
+    # Без статистики оценка не меньше уже увиденных элементов,
+    # на последней странице количество точное
+    response = await cli.get('/api/v1/posts', params={'per_page': 25})
+    assert (await response.json())['total'] >= 26
+    response = await cli.get(
+        '/api/v1/posts', params={'per_page': 25, 'page_num': 3}
+    )
+    assert (await response.json())['total'] == 60
+    async with cli.server.app['db'].acquire() as conn:
+        await conn.execute('ANALYZE post')
+    response = await cli.get('/api/v1/posts', params={'per_page': 25})
+    assert (await response.json())['total'] == 60
+    response = await cli.get(
+        '/api/v1/posts', params={'per_page': 25, 'page_num': 10}
+    )
+    assert (await response.json())['total'] == 60
+    response = await cli.get(
+        '/api/v1/posts', params={'topic__like': 'top%'}
+    )
+    assert (await response.json())['total'] is None
+
+
+async def test_search_posts(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'name',
+                'description': 'description'
+            })
+        )
+        await conn.execute(insert(post).values([
+            {
+                'id': 1,
+                'section_id': section_id,
+                'topic': 'aiohttp',
+                'description': 'web server'
+            },
+            {
+                'id': 2,
+                'section_id': section_id,
+                'topic': 'aiohttp server',
+                'description': 'fast web server'
+            },
+            {
+                'id': 3,
+                'section_id': section_id,
+                'topic': 'postgres',
+                'description': 'database'
+            }
+        ]))
+    response = await cli.get(
+        '/api/v1/posts', params={'search': 'server', 'total': 'exact'}
+    )
+    assert response.status == 200
+    posts_page = await response.json()
+    assert posts_page['total'] == 2
+    assert posts_page['next'] is None
+    assert [_post['id'] for _post in posts_page['items']] == [2, 1]
+
+
+async def test_search_posts_by_cursor(cli):
+    response = await cli.get(
+        '/api/v1/posts', params={'search': 'server', 'after': 'cursor'}
+    )
+    assert response.status == 400
+
+
+async def test_retrieve_posts_with_invalid_cursor(cli):
+    response = await cli.get('/api/v1/posts', params={'after': 'invalid'})
+    assert response.status == 400
     
     
 async def test_delete_post(cli):
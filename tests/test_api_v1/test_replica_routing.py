@@ -0,0 +1,90 @@
+import pytest
+from aiohttp import web
+from aiojobs.aiohttp import setup as setup_jobs
+
+from simple_forum.api.middlewares import read_your_writes_middleware
+from simple_forum.api.utils import READ_PRIMARY_COOKIE
+from simple_forum.routes import SECTION_URLS
+
+
+class CountingEngine:
+    """Обертка над движком, считающая полученные соединения."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.acquired = 0
+
+    def acquire(self):
+        self.acquired += 1
+        return self.engine.acquire()
+
+
+def make_app(primary, replicas, window=5):
+    app = web.Application(middlewares=[read_your_writes_middleware])
+    app.add_routes(SECTION_URLS)
+    app['config'] = {'replicas': {'read_your_writes_window': window}}
+    app['db'] = primary
+    app['db_replicas'] = replicas
+    setup_jobs(app)
+    return app
+
+
+@pytest.fixture
+def primary(db_engine):
+    return CountingEngine(db_engine)
+
+
+@pytest.fixture
+def replica(db_engine):
+    return CountingEngine(db_engine)
+
+
+async def test_read_from_replica(
+    aiohttp_client, cleanup_db, primary, replica
+):
+    cli = await aiohttp_client(make_app(primary, [replica]))
+    response = await cli.get('/api/v1/sections')
+    assert response.status == 200
+    assert (primary.acquired, replica.acquired) == (0, 1)
+
+
+async def test_read_your_writes(
+    aiohttp_client, cleanup_db, primary, replica
+):
+    cli = await aiohttp_client(make_app(primary, [replica]))
+    response = await cli.post(
+        '/api/v1/sections',
+        json={'name': 'name', 'description': 'description'}
+    )
+    assert response.status == 201
+    assert READ_PRIMARY_COOKIE in response.cookies
+    assert (primary.acquired, replica.acquired) == (1, 0)
+    new_section = await response.json()
+    response = await cli.get(
+        '/api/v1/sections/{}'.format(new_section['id'])
+    )
+    assert response.status == 200
+    assert (primary.acquired, replica.acquired) == (2, 0)
+
+
+async def test_failed_write_does_not_pin_to_primary(
+    aiohttp_client, cleanup_db, primary, replica
+):
+    cli = await aiohttp_client(make_app(primary, [replica]))
+    response = await cli.post('/api/v1/sections', json={})
+    assert response.status == 400
+    assert READ_PRIMARY_COOKIE not in response.cookies
+
+
+async def test_read_without_replicas(
+    aiohttp_client, cleanup_db, primary
+):
+    cli = await aiohttp_client(make_app(primary, []))
+    response = await cli.post(
+        '/api/v1/sections',
+        json={'name': 'name', 'description': 'description'}
+    )
+    assert READ_PRIMARY_COOKIE not in response.cookies
+    response = await cli.get('/api/v1/sections')
+    assert response.status == 200
+    assert primary.acquired == 2
@@ -1,3 +1,4 @@
+import json
 import random
 
 import pytest
@@ -5,7 +6,7 @@ from aiohttp import web
 from aiojobs.aiohttp import setup as setup_jobs
 from sqlalchemy import and_, exists, insert, select
 
-from simple_forum.db.models import section
+from simple_forum.db.models import comment, post, section
 from simple_forum.db.queries import DEFAULT_PAGE_NUM, DEFAULT_PER_PAGE
 from simple_forum.routes import SECTION_URLS
 
@@ -97,6 +98,66 @@ async def test_retrieve_section(cli):
     assert _section['description'] == section_data['description']
     
     
+async def test_retrieve_section_not_modified(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'name', 'description': 'description'
+            })
+        )
+    url = '/api/v1/sections/{}'.format(section_id)
+    response = await cli.get(url)
+    assert response.status == 200
+    etag = response.headers['ETag']
+    last_modified = response.headers['Last-Modified']
+    response = await cli.get(url, headers={'If-None-Match': etag})
+    assert response.status == 304
+    assert response.headers['ETag'] == etag
+    response = await cli.get(
+        url, headers={'If-Modified-Since': last_modified}
+    )
+    assert response.status == 304
+    response = await cli.put(
+        url, json={'name': 'new name', 'description': 'description'}
+    )
+    assert response.status == 200
+    response = await cli.get(url, headers={'If-None-Match': etag})
+    assert response.status == 200
+    assert response.headers['ETag'] != etag
+    assert (await response.json())['name'] == 'new name'
+
+
+async def test_retrieve_sections_not_modified(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        await conn.execute(
+            insert(section).values({
+                'name': 'name', 'description': 'description'
+            })
+        )
+    response = await cli.get('/api/v1/sections')
+    etag = response.headers['ETag']
+    response = await cli.get(
+        '/api/v1/sections', headers={'If-None-Match': etag}
+    )
+    assert response.status == 304
+    response = await cli.get(
+        '/api/v1/sections', params={'per_page': 1},
+        headers={'If-None-Match': etag}
+    )
+    assert response.status == 200
+    async with cli.server.app['db'].acquire() as conn:
+        await conn.execute(
+            insert(section).values({
+                'name': 'name', 'description': 'description'
+            })
+        )
+    response = await cli.get(
+        '/api/v1/sections', headers={'If-None-Match': etag}
+    )
+    assert response.status == 200
+    assert len((await response.json())['items']) == 2
+
+
 async def test_retrieve_section_if_section_does_not_exist(cli):
     response = await cli.get(
         '/api/v1/sections/{}'.format(random.randint(1, 100))
@@ -126,7 +187,8 @@ async def test_retrieve_sections(cli):
             insert(section).values([*target_sections, *other_sections])
         )
     response = await cli.get(
-        '/api/v1/sections', params={'name__like': 'target%'}
+        '/api/v1/sections',
+        params={'name__like': 'target%', 'total': 'exact'}
     )
     assert response.status == 200
     sections_page = await response.json()
@@ -138,6 +200,39 @@ async def test_retrieve_sections(cli):
     assert page_ids == target_ids[:DEFAULT_PER_PAGE]
 
 
+async def test_retrieve_sections_by_cursor(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        await conn.execute(insert(section).values([
+            {'id': _id, 'name': 'name', 'description': 'description'}
+            for _id in range(1, 41)
+        ]))
+    response = await cli.get('/api/v1/sections', params={'per_page': 30})
+    first_page = await response.json()
+    response = await cli.get(
+        '/api/v1/sections',
+        params={'per_page': 30, 'after': first_page['next']}
+    )
+    assert response.status == 200
+    second_page = await response.json()
+    assert second_page['next'] is None
+    assert [_section['id'] for _section in second_page['items']] == list(
+        range(31, 41)
+    )
+
+
+async def test_search_sections(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        await conn.execute(insert(section).values([
+            {'id': 1, 'name': 'python', 'description': 'description'},
+            {'id': 2, 'name': 'python news', 'description': 'description'},
+            {'id': 3, 'name': 'golang', 'description': 'description'}
+        ]))
+    response = await cli.get('/api/v1/sections', params={'search': 'news'})
+    assert response.status == 200
+    sections_page = await response.json()
+    assert [_section['id'] for _section in sections_page['items']] == [2]
+
+
 async def test_delete_section(cli):
     async with cli.server.app['db'].acquire() as conn:
         section_id = await conn.scalar(
@@ -148,9 +243,10 @@ async def test_delete_section(cli):
         )
     response = await cli.delete('/api/v1/sections/{}'.format(section_id))
     assert response.status == 204
-    assert not await conn.scalar(
-        select([exists().where(section.c.id == section_id)])
-    )
+    async with cli.server.app['db'].acquire() as conn:
+        assert not await conn.scalar(
+            select([exists().where(section.c.id == section_id)])
+        )
 
 
 async def test_delete_section_if_section_does_not_exist(cli):
@@ -158,3 +254,43 @@ async def test_delete_section_if_section_does_not_exist(cli):
         '/api/v1/sections/{}'.format(random.randint(1, 100))
     )
     assert response.status == 404
+
+
+async def test_export_section(cli):
+    async with cli.server.app['db'].acquire() as conn:
+        await conn.execute(insert(section).values([
+            {'id': 1, 'name': 'name', 'description': 'description'},
+            {'id': 2, 'name': 'other', 'description': 'description'}
+        ]))
+        await conn.execute(insert(post).values([
+            {'id': 2, 'section_id': 1, 'topic': 'b', 'description': 'b'},
+            {'id': 1, 'section_id': 1, 'topic': 'a', 'description': 'a'},
+            {'id': 3, 'section_id': 2, 'topic': 'c', 'description': 'c'}
+        ]))
+        await conn.execute(insert(comment).values([
+            {'id': 1, 'post_id': 1, 'parent_id': None, 'text': 'root'},
+            {'id': 2, 'post_id': 2, 'parent_id': None, 'text': 'root'},
+            {'id': 3, 'post_id': 1, 'parent_id': None, 'text': 'root'},
+            {'id': 4, 'post_id': 1, 'parent_id': 1, 'text': 'reply'},
+            {'id': 5, 'post_id': 3, 'parent_id': None, 'text': 'root'}
+        ]))
+    response = await cli.get('/api/v1/sections/1/export')
+    assert response.status == 200
+    assert response.content_type == 'application/x-ndjson'
+    lines = (await response.text()).splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [(record['type'], record['id']) for record in records] == [
+        ('section', 1),
+        ('post', 1), ('comment', 1), ('comment', 4), ('comment', 3),
+        ('post', 2), ('comment', 2)
+    ]
+    assert records[1]['section_id'] == 1
+    assert records[3]['parent_id'] == 1
+    assert records[3]['text'] == 'reply'
+
+
+async def test_export_section_if_section_does_not_exist(cli):
+    response = await cli.get(
+        '/api/v1/sections/{}/export'.format(random.randint(1, 100))
+    )
+    assert response.status == 404
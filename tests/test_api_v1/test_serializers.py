@@ -0,0 +1,90 @@
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from marshmallow import Schema, fields, post_dump
+
+from simple_forum.api.serializers import _compile_strftime, make_serializer
+from simple_forum.api.v1.resources import (
+    CommentExportSchema, CommentSchema, PostSchema, PostsPageSchema,
+    SectionSchema, SectionsPageSchema
+)
+from simple_forum.db.queries import Page
+
+CREATED_AT = datetime(2019, 1, 2, 3, 4, 5, 678)
+
+SECTION = {
+    'id': 1, 'name': 'name', 'description': 'description',
+    'created_at': CREATED_AT, 'updated_at': None
+}
+
+COMMENTS = [
+    SimpleNamespace(
+        id=1, post_id=1, parent_id=None, text='text', children=[2],
+        replies_count=1, has_more_replies=False
+    ),
+    SimpleNamespace(
+        id=2, post_id=1, parent_id=1, text='text', children=[],
+        replies_count=3, has_more_replies=True
+    ),
+]
+
+
+class AliasSchema(Schema):
+
+    id = fields.Integer(dump_to='key')
+    name = fields.String(attribute='title')
+    secret = fields.String(load_only=True)
+    tags = fields.List(fields.String())
+
+
+@pytest.mark.parametrize('schema, obj', [
+    (SectionSchema(), SECTION),
+    (SectionsPageSchema(), Page([SECTION], 1, 25, 1, None)),
+    (SectionsPageSchema(), Page([], None, 25, None, (CREATED_AT, 1))),
+    (PostSchema(), {
+        'id': 1, 'section_id': 1, 'topic': 'topic',
+        'description': 'description', 'comments': COMMENTS
+    }),
+    (PostsPageSchema(), Page(
+        [{'id': 1, 'section_id': 1, 'topic': 'topic', 'description': None}],
+        2, 1, 5, None
+    )),
+    (CommentSchema(many=True), COMMENTS),
+    (CommentExportSchema(), {
+        'id': 1, 'post_id': 1, 'parent_id': None, 'text': 'text',
+        'created_at': CREATED_AT, 'updated_at': None
+    }),
+    (AliasSchema(), {'id': '1', 'title': 'name', 'tags': 'tag'}),
+    (AliasSchema(exclude=('tags',)), SimpleNamespace(id=1, title=None)),
+])
+def test_make_serializer(schema, obj):
+    # Сравниваем JSON, чтобы проверить и порядок ключей
+    assert json.dumps(make_serializer(schema)(obj)) == json.dumps(
+        schema.dump(obj).data
+    )
+
+
+def test_make_serializer_with_processors():
+
+    class ProcessedSchema(Schema):
+
+        id = fields.Integer()
+
+        @post_dump
+        def add_type(self, data):
+            data['type'] = 'processed'
+            return data
+
+    with pytest.raises(ValueError):
+        make_serializer(ProcessedSchema())
+
+
+@pytest.mark.parametrize('dateformat', [
+    '%d.%m.%Y %H:%M:%S', '%Y', '', 'at 100%% %H:%M', '%A, %d %B'
+])
+def test_compile_strftime(dateformat):
+    assert _compile_strftime(dateformat)(CREATED_AT) == CREATED_AT.strftime(
+        dateformat
+    )
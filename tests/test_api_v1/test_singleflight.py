@@ -0,0 +1,197 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiojobs.aiohttp import setup as setup_jobs
+from sqlalchemy import insert
+
+from simple_forum.api.middlewares import single_flight_middleware
+from simple_forum.api.singleflight import SingleFlight
+from simple_forum.api.v1.views import posts, sections
+from simple_forum.db.models import comment, post, section
+from simple_forum.routes import COMMENT_URLS, POST_URLS, SECTION_URLS
+
+
+class Fetch:
+    """Выборка, которая завершается по сигналу."""
+
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.done = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+async def test_single_flight(loop):
+    single_flight = SingleFlight()
+    fetch = Fetch(result=b'body')
+    requests = [
+        asyncio.ensure_future(single_flight.do('key', fetch))
+        for _ in range(5)
+    ]
+    other_fetch = Fetch(result=b'other')
+    other = asyncio.ensure_future(single_flight.do('other', other_fetch))
+    await asyncio.sleep(0)
+    assert single_flight.stats()['in_flight'] == 2
+    fetch.done.set()
+    other_fetch.done.set()
+    assert await asyncio.gather(*requests) == [b'body'] * 5
+    assert await other == b'other'
+    assert fetch.calls == other_fetch.calls == 1
+    assert single_flight.stats() == {
+        'in_flight': 0, 'requests': 6, 'fetches': 2, 'coalesced': 4,
+        'max_requests_per_fetch': 5,
+        'requests_per_fetch': {
+            '1': 1, '2-10': 1, '11-100': 0, '101-1000': 0, '>1000': 0
+        }
+    }
+    # Завершенная выборка не переиспользуется
+    fetch = Fetch(result=b'new body')
+    fetch.done.set()
+    assert await single_flight.do('key', fetch) == b'new body'
+
+
+async def test_single_flight_reset(loop):
+    single_flight = SingleFlight()
+    old_fetch = Fetch(result=b'old')
+    old = asyncio.ensure_future(single_flight.do('key', old_fetch))
+    await asyncio.sleep(0)
+    single_flight.reset()
+    new_fetch = Fetch(result=b'new')
+    new = asyncio.ensure_future(single_flight.do('key', new_fetch))
+    old_fetch.done.set()
+    new_fetch.done.set()
+    assert await old == b'old'
+    assert await new == b'new'
+    assert single_flight.stats()['fetches'] == 2
+
+
+async def test_single_flight_cancel(loop):
+    single_flight = SingleFlight()
+    fetch = Fetch(result=b'body')
+    first = asyncio.ensure_future(single_flight.do('key', fetch))
+    second = asyncio.ensure_future(single_flight.do('key', fetch))
+    await asyncio.sleep(0)
+    # Отмена запроса, начавшего выборку, не отменяет ее для остальных
+    first.cancel()
+    await asyncio.sleep(0)
+    fetch.done.set()
+    assert await second == b'body'
+    assert first.cancelled()
+
+
+async def test_single_flight_error(loop):
+    single_flight = SingleFlight()
+    fetch = Fetch(error=ValueError('error'))
+    requests = [
+        asyncio.ensure_future(single_flight.do('key', fetch))
+        for _ in range(2)
+    ]
+    await asyncio.sleep(0)
+    fetch.done.set()
+    for request in requests:
+        with pytest.raises(ValueError):
+            await request
+    assert single_flight.stats()['in_flight'] == 0
+
+
+@pytest.fixture
+def cli(loop, aiohttp_client, db_engine, cleanup_db):
+    app = web.Application(middlewares=[single_flight_middleware])
+    app.add_routes(SECTION_URLS)
+    app.add_routes(POST_URLS)
+    app.add_routes(COMMENT_URLS)
+    app['db'] = db_engine
+    app['single_flight'] = SingleFlight()
+    setup_jobs(app)
+    return loop.run_until_complete(aiohttp_client(app))
+
+
+async def test_coalesce_post_requests(cli, monkeypatch):
+    get_post_version = posts.get_post_version
+
+    async def slow_get_post_version(conn, post_id):
+        # Запросы успевают прийти, пока идет выборка
+        await asyncio.sleep(0.2)
+        return await get_post_version(conn, post_id)
+
+    monkeypatch.setattr(posts, 'get_post_version', slow_get_post_version)
+    async with cli.server.app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({'name': 'name', 'description': 'd'})
+        )
+        post_id = await conn.scalar(
+            insert(post).values({
+                'section_id': section_id,
+                'topic': 'topic',
+                'description': 'description'
+            })
+        )
+        await conn.execute(
+            insert(comment).values({'post_id': post_id, 'text': 'text'})
+        )
+    url = '/api/v1/posts/{}'.format(post_id)
+
+    async def get():
+        response = await cli.get(url)
+        assert response.status == 200
+        return await response.read()
+
+    bodies = await asyncio.gather(*(get() for _ in range(10)))
+    assert len(set(bodies)) == 1
+    stats = cli.server.app['single_flight'].stats()
+    assert stats['fetches'] == 1
+    assert stats['max_requests_per_fetch'] == 10
+    # Запрос после записи не получает результат выборки, начатой до нее
+    response = await cli.post(
+        '/api/v1/comments', json={'post_id': post_id, 'text': 'text'}
+    )
+    assert response.status == 201
+    response = await cli.get(url)
+    assert len((await response.json())['comments']) == 2
+    response = await cli.get('/api/v1/posts/{}'.format(post_id + 1))
+    assert response.status == 404
+
+
+async def test_conditional_requests_are_not_serialized(cli, monkeypatch):
+    async with cli.server.app['db'].acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({'name': 'name', 'description': 'd'})
+        )
+    urls = [
+        '/api/v1/sections/{}'.format(section_id),
+        '/api/v1/sections',
+        '/api/v1/posts',
+    ]
+    validators = {}
+    for url in urls:
+        response = await cli.get(url)
+        assert response.status == 200
+        validators[url] = response.headers
+    single_flight = cli.server.app['single_flight']
+    fetches = single_flight.stats()['fetches']
+
+    def fail(*args, **kwargs):
+        raise AssertionError('Response is serialized')
+
+    monkeypatch.setattr(sections, 'dump_section', fail)
+    monkeypatch.setattr(sections, 'dump_sections_page', fail)
+    monkeypatch.setattr(posts, 'dump_posts_page', fail)
+    for url in urls:
+        response = await cli.get(
+            url, headers={'If-None-Match': validators[url]['ETag']}
+        )
+        assert response.status == 304
+    response = await cli.get(urls[0], headers={
+        'If-Modified-Since': validators[urls[0]]['Last-Modified']
+    })
+    assert response.status == 304
+    # Условные запросы не объединяются с остальными
+    assert single_flight.stats()['fetches'] == fetches
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from simple_forum import event_loop
+from simple_forum.event_loop import (
+    LOOP_ASYNCIO, LOOP_AUTO, LOOP_UVLOOP, create_event_loop_policy
+)
+
+
+def test_create_asyncio_policy():
+    policy = create_event_loop_policy(LOOP_ASYNCIO)
+    assert type(policy) is asyncio.DefaultEventLoopPolicy
+
+
+@pytest.mark.skipif(event_loop.uvloop is None, reason='uvloop is missing')
+def test_create_uvloop_policy():
+    policy = create_event_loop_policy(LOOP_UVLOOP)
+    loop = policy.new_event_loop()
+    try:
+        assert isinstance(loop, event_loop.uvloop.Loop)
+    finally:
+        loop.close()
+
+
+def test_auto_policy_without_uvloop(monkeypatch):
+    monkeypatch.setattr(event_loop, 'uvloop', None)
+    policy = create_event_loop_policy(LOOP_AUTO)
+    assert type(policy) is asyncio.DefaultEventLoopPolicy
+    with pytest.raises(ValueError):
+        create_event_loop_policy(LOOP_UVLOOP)
+
+
+def test_unknown_loop():
+    with pytest.raises(ValueError):
+        create_event_loop_policy('unknown')
+
+
+def test_loop_fixture(loop, config):
+    if config['event_loop'] == LOOP_ASYNCIO or event_loop.uvloop is None:
+        assert not type(loop).__module__.startswith('uvloop')
+    else:
+        assert type(loop).__module__.startswith('uvloop')
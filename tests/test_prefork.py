@@ -0,0 +1,105 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from urllib.request import urlopen
+
+import pytest
+import yaml
+
+from simple_forum.prefork import split_pool_size
+from simple_forum.utils import BASE_PATH
+
+
+@pytest.mark.parametrize('budget, workers, reserved, minsize, maxsize', [
+    (0, 4, 1, 2, 10),
+    (20, 4, 0, 2, 5),
+    (20, 4, 1, 2, 4),
+    (4, 2, 0, 2, 2),
+    (4, 2, 1, 1, 1),
+])
+def test_split_pool_size(budget, workers, reserved, minsize, maxsize):
+    db_config = {'host': 'localhost', 'minsize': 2, 'maxsize': 10}
+    worker_config = split_pool_size(db_config, workers, budget, reserved)
+    assert worker_config['host'] == 'localhost'
+    assert worker_config['minsize'] == minsize
+    assert worker_config['maxsize'] == maxsize
+
+
+@pytest.mark.parametrize('budget, workers, reserved', [
+    (3, 4, 0),
+    (4, 4, 1),
+])
+def test_split_pool_size_over_budget(budget, workers, reserved):
+    db_config = {'host': 'localhost', 'minsize': 2, 'maxsize': 10}
+    with pytest.raises(ValueError):
+        split_pool_size(db_config, workers, budget, reserved)
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def get_children(pid):
+    with open('/proc/{0}/task/{0}/children'.format(pid)) as f:
+        return set(map(int, f.read().split()))
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if condition():
+                return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    pytest.fail('Condition was not met in {}s'.format(timeout))
+
+
+@pytest.fixture
+def server_config(tmpdir, config_path):
+    with open(config_path) as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+    config['server'] = {
+        **config['server'], 'host': '127.0.0.1', 'port': get_free_port()
+    }
+    path = tmpdir.join('conf.yaml')
+    path.write(yaml.dump(config))
+    return str(path), config['server']['port']
+
+
+@pytest.mark.skipif(
+    not sys.platform.startswith('linux'), reason='Uses /proc to find workers'
+)
+def test_workers(server_config):
+    path, port = server_config
+    url = 'http://127.0.0.1:{}/api/v1/metrics'.format(port)
+    server = subprocess.Popen(
+        [sys.executable, 'main.py', '--config', path, '--workers', '2'],
+        cwd=str(BASE_PATH), stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for(lambda: len(get_children(server.pid)) == 2)
+        wait_for(lambda: urlopen(url).status == 200)
+        workers = get_children(server.pid)
+        # Упавший воркер перезапускается
+        killed_pid = workers.pop()
+        os.kill(killed_pid, signal.SIGKILL)
+        wait_for(lambda: (
+            killed_pid not in get_children(server.pid) and
+            len(get_children(server.pid)) == 2
+        ))
+        assert workers < get_children(server.pid)
+        assert urlopen(url).status == 200
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
+    finally:
+        if server.poll() is None:
+            server.kill()
+            server.wait()
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+from sqlalchemy import delete, insert, select, text, update
+
+from simple_forum.db.changes import (
+    APPLICATION_NAME, ChangesListener, parse_change
+)
+from simple_forum.db.models import comment, post, section
+from simple_forum.db.utils import BACKENDS
+
+
+@pytest.yield_fixture(params=BACKENDS)
+async def listener(request, loop, config):
+    listener = ChangesListener(
+        {**config['database'], 'backend': request.param},
+        lambda *change: listener.changes.append(change),
+        lambda: listener.changes.append('reset'), ping_interval=0.1
+    )
+    listener.changes = []
+    listener.start()
+    await asyncio.wait_for(listener.connected.wait(), 5)
+    yield listener
+    await listener.stop()
+
+
+async def wait_for_changes(listener, *expected):
+    for _ in range(50):
+        if all(change in listener.changes for change in expected):
+            return
+        await asyncio.sleep(0.1)
+    assert listener.changes == list(expected)
+
+
+@pytest.mark.parametrize('payload, change', [
+    ('post:1', ('post', 1)),
+    ('section:25', ('section', 25)),
+    ('post:', None),
+    ('post:abc', None),
+    ('', None),
+])
+def test_parse_change(payload, change):
+    assert parse_change(payload) == change
+
+
+async def test_notifications(db_engine, cleanup_db, listener):
+    async with db_engine.acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({'name': 'name', 'description': None})
+        )
+        post_id = await conn.scalar(
+            insert(post).values({
+                'section_id': section_id,
+                'topic': 'topic',
+                'description': 'description'
+            })
+        )
+        await conn.execute(insert(comment).values([
+            {'post_id': post_id, 'text': 'text'},
+            {'post_id': post_id, 'text': 'text'},
+        ]))
+        await wait_for_changes(listener, ('post', post_id))
+        # Новые разделы и посты не отправляют уведомлений, а пакет
+        # комментариев к посту отправляет одно
+        assert listener.changes == ['reset', ('post', post_id)]
+        listener.changes.clear()
+        await conn.execute(
+            update(section).where(section.c.id == section_id).values(
+                name='new name'
+            )
+        )
+        await wait_for_changes(listener, ('section', section_id))
+        listener.changes.clear()
+        await conn.execute(delete(section).where(section.c.id == section_id))
+        await wait_for_changes(
+            listener, ('section', section_id), ('post', post_id)
+        )
+        assert len(listener.changes) == 2
+
+
+async def test_reconnect(db_engine, cleanup_db, listener):
+    async with db_engine.acquire() as conn:
+        await conn.execute(
+            select([text('pg_terminate_backend(pid)')]).select_from(
+                text('pg_stat_activity')
+            ).where(text('application_name = :name')).params(
+                name=APPLICATION_NAME
+            )
+        )
+        for _ in range(50):
+            if listener.reconnects and listener.connected.is_set():
+                break
+            await asyncio.sleep(0.1)
+        assert listener.stats() == {
+            'connected': True, 'notifications': 0, 'reconnects': 1
+        }
+        # Пропущенные уведомления сбрасывают кеши
+        assert listener.changes == ['reset', 'reset', 'reset']
+        section_id = await conn.scalar(
+            insert(section).values({'name': 'name', 'description': None})
+        )
+        await conn.execute(delete(section).where(section.c.id == section_id))
+        await wait_for_changes(listener, ('section', section_id))
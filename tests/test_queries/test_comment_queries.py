@@ -7,7 +7,8 @@ from sqlalchemy import ColumnDefault, and_, exists, insert, select
 
 from simple_forum.db.models import comment, post, section
 from simple_forum.db.queries import (
-    create_comment, delete_comment, get_comment, get_post_comments
+    create_comment, delete_comment, get_comment, get_comment_subtree,
+    get_post_comments, update_comment
 )
 
 
@@ -82,6 +83,9 @@ async def test_create_child_comment(db_engine, cleanup_db):
             assert new_comment.text == comment_text
             assert new_comment.parent_id == parent_id
             assert new_comment.created_at == dt_now
+            assert new_comment.path == '{:010d}.{:010d}'.format(
+                parent_id, new_comment.id
+            )
             assert await conn.scalar(
                 select([exists().where(
                     and_(
@@ -125,6 +129,13 @@ async def test_get_comment_if_comment_does_not_exist(db_engine):
         assert await get_comment(conn, random.randint(1, 100)) is None
         
 
+async def test_update_comment_if_comment_does_not_exist(db_engine):
+    async with db_engine.acquire() as conn:
+        assert await update_comment(
+            conn, random.randint(1, 100), 'comment text'
+        ) is None
+
+
 async def test_get_post_comments(db_engine, cleanup_db):
     async with db_engine.acquire() as conn:
         section_id = await conn.scalar(
@@ -165,6 +176,130 @@ async def test_get_post_comments(db_engine, cleanup_db):
         assert child_comment.children == []
 
 
+async def test_get_post_comments_order(db_engine, cleanup_db):
+    async with db_engine.acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'section name',
+                'description': 'section description'
+            })
+        )
+        post_id = await conn.scalar(
+            insert(post).values({
+                'section_id': section_id,
+                'topic': 'post topic',
+                'description': 'post description'
+            })
+        )
+        first_id = await conn.scalar(
+            insert(comment).values({'post_id': post_id, 'text': 'text'})
+        )
+        second_id = await conn.scalar(
+            insert(comment).values({'post_id': post_id, 'text': 'text'})
+        )
+        reply_id = await conn.scalar(
+            insert(comment).values({
+                'post_id': post_id,
+                'parent_id': first_id,
+                'text': 'text'
+            })
+        )
+        post_comments = await get_post_comments(conn, post_id)
+        assert [_comment.id for _comment in post_comments] == [
+            first_id, reply_id, second_id
+        ]
+        reply = post_comments[1]
+        assert reply.path == '{:010d}.{:010d}'.format(first_id, reply_id)
+
+
+async def test_get_post_comments_with_max_depth(db_engine, cleanup_db):
+    async with db_engine.acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'section name',
+                'description': 'section description'
+            })
+        )
+        post_id = await conn.scalar(
+            insert(post).values({
+                'section_id': section_id,
+                'topic': 'post topic',
+                'description': 'post description'
+            })
+        )
+        parent_id = await conn.scalar(
+            insert(comment).values({'post_id': post_id, 'text': 'text'})
+        )
+        await conn.execute(
+            insert(comment).values({
+                'post_id': post_id,
+                'parent_id': parent_id,
+                'text': 'text'
+            })
+        )
+        post_comments = await get_post_comments(conn, post_id, max_depth=1)
+        assert len(post_comments) == 1
+        assert post_comments[0].id == parent_id
+        assert post_comments[0].children == []
+        assert post_comments[0].replies_count == 1
+        assert post_comments[0].has_more_replies
+
+
+async def test_get_comment_subtree(db_engine, cleanup_db):
+    async with db_engine.acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'section name',
+                'description': 'section description'
+            })
+        )
+        post_id = await conn.scalar(
+            insert(post).values({
+                'section_id': section_id,
+                'topic': 'post topic',
+                'description': 'post description'
+            })
+        )
+        # root -> reply -> nested_reply, other - вне поддерева
+        root_id = await conn.scalar(
+            insert(comment).values({'post_id': post_id, 'text': 'text'})
+        )
+        reply_id = await conn.scalar(
+            insert(comment).values({
+                'post_id': post_id,
+                'parent_id': root_id,
+                'text': 'text'
+            })
+        )
+        nested_reply_id = await conn.scalar(
+            insert(comment).values({
+                'post_id': post_id,
+                'parent_id': reply_id,
+                'text': 'text'
+            })
+        )
+        await conn.execute(
+            insert(comment).values({'post_id': post_id, 'text': 'text'})
+        )
+        subtree = await get_comment_subtree(conn, root_id)
+        assert [_comment.id for _comment in subtree] == [
+            root_id, reply_id, nested_reply_id
+        ]
+        subtree = await get_comment_subtree(conn, reply_id, max_depth=0)
+        assert [_comment.id for _comment in subtree] == [reply_id]
+        assert subtree[0].has_more_replies
+        subtree = await get_comment_subtree(conn, root_id, limit=2)
+        assert [_comment.id for _comment in subtree] == [root_id, reply_id]
+        assert subtree[0].children == [reply_id]
+        assert not subtree[0].has_more_replies
+        assert subtree[1].has_more_replies
+
+
+async def test_get_comment_subtree_if_comment_does_not_exist(db_engine):
+    async with db_engine.acquire() as conn:
+        assert await get_comment_subtree(conn, random.randint(1, 100)) == []
+
+
 async def test_delete_comment(db_engine, cleanup_db):
     async with db_engine.acquire() as conn:
         section_id = await conn.scalar(
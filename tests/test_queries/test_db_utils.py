@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+from sqlalchemy import bindparam, select
+
+from simple_forum.db.models import section
+from simple_forum.db.utils import (
+    BACKENDS, InstrumentedEngine, PoolTimeoutError, close_async_engine,
+    create_async_engine, prepared_query
+)
+
+
+@pytest.yield_fixture
+async def small_engine(loop, config):
+    engine = await create_async_engine({
+        **config['database'], 'minsize': 1, 'maxsize': 1,
+        'acquire_timeout': 0.05, 'statement_timeout': 100
+    })
+    yield engine
+    await close_async_engine(engine)
+
+
+async def test_acquire_timeout(small_engine):
+    async with small_engine.acquire():
+        assert small_engine.stats()['free'] == 0
+        with pytest.raises(PoolTimeoutError):
+            async with small_engine.acquire():
+                pass
+    stats = small_engine.stats()
+    assert stats['free'] == 1
+    assert stats['waiters'] == 0
+    assert stats['acquired'] == 1
+    assert stats['acquire_timeouts'] == 1
+    assert stats['acquire_wait_max'] >= 0.05
+
+
+class FakeConnection:
+    
+    def __init__(self):
+        self.closed = asyncio.Event()
+    
+    async def close(self):
+        self.closed.set()
+
+
+class LateEngine:
+    """Движок, который получает соединение, когда ожидание уже
+    отменено."""
+    
+    def __init__(self):
+        self.conn = FakeConnection()
+    
+    async def acquire(self):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            return self.conn
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+async def test_pool_size(backend, config):
+    engine = await create_async_engine({
+        **config['database'], 'backend': backend,
+        'minsize': 1, 'maxsize': 3
+    })
+    try:
+        assert engine.stats()['size'] == 1
+        conns = [await engine.acquire() for _ in range(3)]
+        stats = engine.stats()
+        assert (stats['size'], stats['free']) == (3, 0)
+        for conn in conns:
+            await conn.close()
+        stats = engine.stats()
+        assert (stats['size'], stats['free']) == (3, 3)
+    finally:
+        await close_async_engine(engine)
+
+
+async def test_acquire_timeout_releases_late_connection(loop):
+    late_engine = LateEngine()
+    engine = InstrumentedEngine(late_engine, acquire_timeout=0.01)
+    with pytest.raises(PoolTimeoutError):
+        await engine.acquire()
+    await asyncio.wait_for(late_engine.conn.closed.wait(), 1)
+    assert engine.acquire_timeouts == 1
+
+
+async def test_acquire_cancel_releases_late_connection(loop):
+    late_engine = LateEngine()
+    engine = InstrumentedEngine(late_engine)
+    acquiring = asyncio.ensure_future(engine.acquire())
+    await asyncio.sleep(0)
+    acquiring.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await acquiring
+    await asyncio.wait_for(late_engine.conn.closed.wait(), 1)
+    assert engine.waiters == 0
+
+
+async def test_statement_timeout(small_engine):
+    async with small_engine.acquire() as conn:
+        assert await conn.scalar('SHOW statement_timeout') == '100ms'
+
+
+async def test_prepared_query(db_engine, cleanup_db):
+    builds = []
+
+    @prepared_query
+    def query(with_name):
+        builds.append(with_name)
+        query = select([section.c.id]).where(
+            section.c.description == 'description'
+        )
+        if with_name:
+            query = query.where(section.c.name == bindparam('name'))
+        return query
+
+    assert query(True) is query(True)
+    assert builds == [True]
+    async with db_engine.acquire() as conn:
+        await conn.execute(section.insert().values(
+            name='name', description='description'
+        ))
+        assert await query(True).scalar(conn, name='name') is not None
+        assert await query(True).scalar(conn, name='other') is None
+        cur = await query(False).execute(conn)
+        assert len(await cur.fetchall()) == 1
+    assert builds == [True, False]
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from simple_forum.db.importer import ImportDataError, import_ndjson
+from simple_forum.db.utils import (
+    close_blocking_engine, create_blocking_engine, make_dsn
+)
+
+
+@pytest.yield_fixture
+def blocking_conn(config):
+    engine = create_blocking_engine(make_dsn(config['database']))
+    conn = engine.raw_connection()
+    yield conn
+    conn.close()
+    close_blocking_engine(engine)
+
+
+def to_ndjson(records):
+    return [json.dumps(record) + '\n' for record in records]
+
+
+def fetch_all(conn, query, params=()):
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        return cur.fetchall()
+
+
+def test_import_ndjson(blocking_conn, cleanup_db):
+    records = [
+        {'type': 'section', 'id': 100, 'name': 'name',
+         'description': 'tab\there\nnew line \\N'},
+        {'type': 'post', 'id': 200, 'section_id': 100, 'topic': 'topic',
+         'description': None, 'created_at': '2019-01-02T03:04:05'},
+        {'type': 'comment', 'id': 300, 'post_id': 200, 'parent_id': None,
+         'text': 'root'},
+        {'type': 'comment', 'id': 301, 'post_id': 200, 'parent_id': 300,
+         'text': 'reply'},
+        {'type': 'comment', 'id': 302, 'post_id': 200, 'parent_id': 301,
+         'text': ''},
+    ]
+    # Пачки по 2 записи: потомки загружаются позже родителей
+    result = import_ndjson(blocking_conn, to_ndjson(records), batch_size=2)
+    assert result.rows == {'section': 1, 'post': 1, 'comment': 3}
+
+    [(section_id, description)] = fetch_all(
+        blocking_conn, 'SELECT id, description FROM section'
+    )
+    assert description == 'tab\there\nnew line \\N'
+    [(post_id, post_section_id, post_description, created_at)] = fetch_all(
+        blocking_conn,
+        'SELECT id, section_id, description, created_at FROM post'
+    )
+    assert post_section_id == section_id
+    assert post_description is None
+    assert created_at.isoformat() == '2019-01-02T03:04:05'
+    comments = fetch_all(
+        blocking_conn,
+        'SELECT id, parent_id, text, path FROM comment '
+        'WHERE post_id = %s ORDER BY path',
+        (post_id,)
+    )
+    assert [text for _, _, text, _ in comments] == ['root', 'reply', '']
+    assert comments[0][1] is None
+    assert comments[1][1] == comments[0][0]
+    assert comments[2][1] == comments[1][0]
+    assert comments[2][3].startswith(comments[1][3] + '.')
+
+
+@pytest.mark.parametrize('records, line_num', [
+    ([{'type': 'post', 'id': 1, 'section_id': 1}], 1),
+    ([{'type': 'section', 'id': 1}, {'type': 'section', 'id': 1}], 2),
+    ([{'type': 'user', 'id': 1}], 1),
+    ([{'type': 'section', 'id': 1, 'created_at': 'yesterday'}], 1),
+    # Родитель встречается в потоке позже потомка
+    ([
+        {'type': 'section', 'id': 1},
+        {'type': 'post', 'id': 1, 'section_id': 1},
+        {'type': 'comment', 'id': 1, 'post_id': 1, 'parent_id': 2},
+        {'type': 'comment', 'id': 2, 'post_id': 1, 'parent_id': None},
+    ], 3),
+])
+def test_import_ndjson_invalid(blocking_conn, cleanup_db, records, line_num):
+    with pytest.raises(ImportDataError) as exc_info:
+        import_ndjson(blocking_conn, to_ndjson(records))
+    assert exc_info.value.line_num == line_num
+    assert fetch_all(blocking_conn, 'SELECT id FROM section') == []
+
+
+def test_import_ndjson_duplicate_in_other_batch(blocking_conn, cleanup_db):
+    records = [
+        {'type': 'section', 'id': 1},
+        {'type': 'section', 'id': 2},
+        {'type': 'section', 'id': 1},
+    ]
+    with pytest.raises(ImportDataError) as exc_info:
+        import_ndjson(blocking_conn, to_ndjson(records), batch_size=2)
+    assert exc_info.value.line_num == 3
+    # Пачка, загруженная до ошибки, остается в БД
+    assert len(fetch_all(blocking_conn, 'SELECT id FROM section')) == 2
+    # Временные таблицы удалены, соединение можно использовать снова
+    result = import_ndjson(blocking_conn, to_ndjson(records[:1]))
+    assert result.rows == {'section': 1}
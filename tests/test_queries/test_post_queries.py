@@ -145,6 +145,13 @@ async def test_update_post(db_engine, cleanup_db):
             )
 
 
+async def test_update_post_if_post_does_not_exist(db_engine):
+    async with db_engine.acquire() as conn:
+        assert await update_post(
+            conn, random.randint(1, 100), topic='new topic'
+        ) is None
+
+
 async def test_delete_post(db_engine, cleanup_db):
     async with db_engine.acquire() as conn:
         section_id = await conn.scalar(
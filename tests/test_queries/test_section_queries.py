@@ -4,10 +4,10 @@ from unittest import mock
 
 from sqlalchemy import ColumnDefault, and_, exists, insert, select
 
-from simple_forum.db.models import section
+from simple_forum.db.models import post, section
 from simple_forum.db.queries import (
     create_section, delete_section, get_section, is_section_exist,
-    update_section
+    iter_section_export, update_section
 )
 
 
@@ -123,3 +123,30 @@ async def test_delete_section(db_engine, cleanup_db):
         assert not await conn.scalar(
             select([exists().where(section.c.id == section_id)])
         )
+
+
+async def test_delete_section_if_section_does_not_exist(db_engine):
+    async with db_engine.acquire() as conn:
+        assert await delete_section(conn, random.randint(1, 100)) is None
+
+
+async def test_iter_section_export(db_engine, cleanup_db):
+    async with db_engine.acquire() as conn:
+        section_id = await conn.scalar(
+            insert(section).values({
+                'name': 'section name',
+                'description': 'section description'
+            })
+        )
+        await conn.execute(insert(post).values([
+            {'section_id': section_id, 'topic': 'topic', 'description': 'd'}
+            for _ in range(5)
+        ]))
+        async with conn.begin():
+            chunks = [
+                [row.id for row in rows]
+                async for rows in iter_section_export(conn, section_id, 2)
+            ]
+    assert [len(rows) for rows in chunks] == [2, 2, 1]
+    post_ids = [post_id for rows in chunks for post_id in rows]
+    assert post_ids == sorted(post_ids)